@@ -1,8 +1,7 @@
 from flask import Blueprint, jsonify, request  # type: ignore
-from utils import get_db
-import json
+from utils import get_db, query_batch, request_budget
 from datetime import datetime, timedelta, date
-from typing import Dict, Tuple, Any
+from typing import Dict, List, Tuple, Any
 from collections.abc import Mapping, Sequence
 
 try:
@@ -46,87 +45,44 @@ def _resolve_timeframe(raw_value: str) -> Tuple[str, date, date]:
     return normalized, start, end
 
 
-def _compute_metrics(cur, menu_prices: Dict[int, float], menu_names: Dict[int, str], start_date: date, end_date: date) -> Dict[str, object]:
+def _compute_metrics(conn, start_date: date, end_date: date) -> Dict[str, object]:
     start_dt = datetime.combine(start_date, datetime.min.time())
     end_dt = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
     start_str = start_dt.strftime('%Y-%m-%d %H:%M:%S')
     end_str = end_dt.strftime('%Y-%m-%d %H:%M:%S')
 
-    cur.execute('SELECT id, order_timestamp FROM orders WHERE order_timestamp >= ? AND order_timestamp < ?', (start_str, end_str))
-    order_rows = cur.fetchall()
-    order_ids = []
-    order_dates: Dict[int, date] = {}
-    for row in order_rows:
-        order_id = _row_value(row, 'id', 0)
-        ts = _row_value(row, 'order_timestamp', 1)
-        if order_id is None:
-            continue
-        try:
-            order_id_int = int(order_id)
-        except (TypeError, ValueError):
-            continue
-        order_ids.append(order_id_int)
-        parsed_dt = None
-        if isinstance(ts, datetime):
-            parsed_dt = ts
-        elif isinstance(ts, str):
-            try:
-                parsed_dt = datetime.fromisoformat(ts)
-            except ValueError:
-                for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m/%d/%Y %H:%M:%S'):
-                    try:
-                        parsed_dt = datetime.strptime(ts, fmt)
-                        break
-                    except ValueError:
-                        continue
-        if parsed_dt is not None:
-            order_dates[order_id_int] = parsed_dt.date()
-
-    total_orders = len(order_ids)
-
+    # Both aggregates run in SQL over the order_timestamp and order_lines indexes;
+    # revenue uses the price each line was ordered at.
+    day_rows, top_rows = query_batch(conn, [
+        (
+            'SELECT date(o.order_timestamp) AS day, COUNT(DISTINCT o.id) AS orders, '
+            'COALESCE(SUM(l.qty * l.unit_price), 0) AS revenue '
+            'FROM orders o LEFT JOIN order_lines l ON l.order_id = o.id '
+            'WHERE o.order_timestamp >= ? AND o.order_timestamp < ? GROUP BY day',
+            (start_str, end_str),
+        ),
+        (
+            'SELECT l.item_id, m.name, SUM(l.qty) AS count '
+            'FROM orders o JOIN order_lines l ON l.order_id = o.id LEFT JOIN menu_items m ON m.id = l.item_id '
+            'WHERE o.order_timestamp >= ? AND o.order_timestamp < ? AND l.item_id IS NOT NULL '
+            'GROUP BY l.item_id ORDER BY count DESC, l.item_id LIMIT 5',
+            (start_str, end_str),
+        ),
+    ])
+
+    total_orders = 0
     total_revenue = 0.0
-    item_counts: Dict[int, int] = {}
     daily_revenue: Dict[str, float] = {}
     daily_orders: Dict[str, int] = {}
-
-    for order_day in order_dates.values():
-        day_key = order_day.isoformat()
-        daily_orders[day_key] = daily_orders.get(day_key, 0) + 1
-
-    if order_ids:
-        placeholders = ','.join('?' for _ in order_ids)
-        cur.execute(f'SELECT order_id, items FROM order_items WHERE order_id IN ({placeholders})', order_ids)
-        for row in cur.fetchall():
-            order_id = _row_value(row, 'order_id', 0)
-            items_json = _row_value(row, 'items', 1)
-            try:
-                order_id_int = int(order_id) if order_id is not None else None
-            except (TypeError, ValueError):
-                order_id_int = None
-            try:
-                parsed = json.loads(items_json)
-            except Exception:
-                continue
-            order_revenue = 0.0
-            day_key = None
-            if order_id_int is not None:
-                order_day = order_dates.get(order_id_int)
-            else:
-                order_day = None
-            if order_day is not None:
-                day_key = order_day.isoformat()
-            for entry in parsed or []:
-                item_id = entry.get('item_id')
-                qty = entry.get('qty') or 0
-                if not item_id:
-                    continue
-                price = menu_prices.get(item_id, 0.0)
-                line_revenue = price * qty
-                total_revenue += line_revenue
-                order_revenue += line_revenue
-                item_counts[item_id] = item_counts.get(item_id, 0) + qty
-            if day_key is not None:
-                daily_revenue[day_key] = daily_revenue.get(day_key, 0.0) + order_revenue
+    for row in day_rows:
+        day_key = _row_value(row, 'day', 0)
+        orders = int(_row_value(row, 'orders', 1) or 0)
+        revenue = float(_row_value(row, 'revenue', 2) or 0.0)
+        total_orders += orders
+        total_revenue += revenue
+        if day_key is not None:
+            daily_orders[day_key] = orders
+            daily_revenue[day_key] = revenue
 
     average_order_value = total_revenue / total_orders if total_orders else 0.0
 
@@ -145,55 +101,53 @@ def _compute_metrics(cur, menu_prices: Dict[int, float], menu_names: Dict[int, s
 
     top_selling = [
         {
-            'id': item_id,
-            'name': menu_names.get(item_id, 'Unknown Item'),
-            'count': count,
+            'id': _row_value(row, 'item_id', 0),
+            'name': _row_value(row, 'name', 1) or 'Unknown Item',
+            'count': _row_value(row, 'count', 2),
         }
-        for item_id, count in sorted(item_counts.items(), key=lambda x: -x[1])[:5]
+        for row in top_rows
     ]
 
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    cur.execute(
-        'SELECT assigned_user, COUNT(id) as assignment_count FROM shift_assignments WHERE shift_date BETWEEN ? AND ? GROUP BY assigned_user',
-        (start_date_str, end_date_str),
-    )
-    staff_utilization = []
-    for row in cur.fetchall():
-        user_id = _row_value(row, 'assigned_user', 0)
-        assignments = _row_value(row, 'assignment_count', 1)
-        if user_id is None and not assignments:
-            continue
-        staff_utilization.append({'user_id': user_id, 'assignments': assignments})
-
     return {
         'total_orders': total_orders,
         'total_revenue': round(total_revenue, 2),
         'average_order_value': round(average_order_value, 2),
         'daily_trend': daily_trend,
         'top_selling': top_selling,
-        'staff_utilization': staff_utilization,
     }
 
 
+def _staff_utilization(rows) -> List[Dict[str, Any]]:
+    staff_utilization = []
+    for row in rows:
+        user_id = _row_value(row, 'assigned_user', 0)
+        assignments = _row_value(row, 'assignment_count', 1)
+        if user_id is None and not assignments:
+            continue
+        staff_utilization.append({'user_id': user_id, 'assignments': assignments})
+    return staff_utilization
+
+
 @bp.route('/summary', methods=['GET'])
+@request_budget(20)
 @require_roles('Manager')
 def summary():
     conn = get_db()
-    cur = conn.cursor()
 
     timeframe_param = request.args.get('timeframe', 'this_week')
     timeframe, start_date, end_date = _resolve_timeframe(timeframe_param)
 
-    cur.execute('SELECT r.name, COUNT(u.id) FROM roles r LEFT JOIN users u ON u.role_id=r.id GROUP BY r.id')
-    users_by_role = {row[0]: row[1] for row in cur.fetchall()}
-
-    cur.execute('SELECT id, name, price FROM menu_items')
-    menu_rows = cur.fetchall()
-    menu_prices = {row[0]: row[2] or 0.0 for row in menu_rows}
-    menu_names = {row[0]: row[1] for row in menu_rows}
+    # The independent lookups share one round trip on rqlite.
+    role_rows, staff_rows = query_batch(conn, [
+        ('SELECT r.name, COUNT(u.id) FROM roles r LEFT JOIN users u ON u.role_id=r.id GROUP BY r.id', ()),
+        (
+            'SELECT assigned_user, COUNT(id) as assignment_count FROM shift_assignments WHERE shift_date BETWEEN ? AND ? GROUP BY assigned_user',
+            (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')),
+        ),
+    ])
+    users_by_role = {row[0]: row[1] for row in role_rows}
 
-    metrics = _compute_metrics(cur, menu_prices, menu_names, start_date, end_date)
+    metrics = _compute_metrics(conn, start_date, end_date)
 
     comparison = None
     if timeframe == 'this_week':
@@ -205,7 +159,7 @@ def summary():
 
     if comparison_target:
         normalized, comp_start, comp_end = _resolve_timeframe(comparison_target)
-        comparison_metrics = _compute_metrics(cur, menu_prices, menu_names, comp_start, comp_end)
+        comparison_metrics = _compute_metrics(conn, comp_start, comp_end)
         comparison = {
             'timeframe': normalized,
             'label': 'vs last week' if normalized == 'last_week' else 'vs this week',
@@ -226,7 +180,7 @@ def summary():
         'average_order_value': metrics['average_order_value'],
         'daily_trend': metrics['daily_trend'],
         'top_selling': metrics['top_selling'],
-        'staff_utilization': metrics['staff_utilization'],
+        'staff_utilization': _staff_utilization(staff_rows),
         'customer_satisfaction': 4.7,
         'customer_satisfaction_previous': None,
     }
@@ -1,42 +1,42 @@
-from flask import Flask
+from flask import Flask, jsonify, request
+import importlib
 import os
+import sqlite3
 from typing import Any, Optional
 
-# Optional extension holders (use Any to avoid importing stubs during static checks)
-CORS: Optional[Any] = None
-JWTManager: Optional[Any] = None
-Limiter: Optional[Any] = None
-get_remote_address: Optional[Any] = None
-
-try:
-    from flask_cors import CORS as _CORS
-    CORS = _CORS
-except Exception:
-    CORS = None
-
-try:
-    from flask_jwt_extended import JWTManager as _JWTManager
-    JWTManager = _JWTManager
-except Exception:
-    JWTManager = None
-
-try:
-    from flask_limiter import Limiter as _Limiter
-    from flask_limiter.util import get_remote_address as _get_remote_address
-    Limiter = _Limiter
-    get_remote_address = _get_remote_address
-except Exception:
-    Limiter = None
-    get_remote_address = None
-
-# Blueprints
-from auth import bp as auth_bp
-from menu import bp as menu_bp
-from schedule import bp as schedule_bp
-from schedule import ensure_schedule_schema, reset_schedule_state
-from analytics import bp as analytics_bp
-from uploads import bp as uploads_bp
-from orders import bp as orders_bp
+from utils import (
+    DeadlineExceeded,
+    HashingBusy,
+    clear_request_deadline,
+    release_db,
+    remaining_request_budget,
+    set_request_deadline,
+)
+
+
+def _optional(module: str, name: str) -> Optional[Any]:
+    """Return ``module.name`` if the optional extension is installed, else None."""
+    try:
+        return getattr(importlib.import_module(module), name)
+    except Exception:
+        return None
+
+
+def _register_blueprints(app: Flask) -> None:
+    # Imported here rather than at module level so ``import api`` stays cheap.
+    from auth import bp as auth_bp
+    from menu import bp as menu_bp
+    from schedule import bp as schedule_bp
+    from analytics import bp as analytics_bp
+    from uploads import bp as uploads_bp
+    from orders import bp as orders_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(menu_bp, url_prefix='/api/menu')
+    app.register_blueprint(schedule_bp, url_prefix='/api/schedules')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
+    app.register_blueprint(orders_bp, url_prefix='/api/orders')
 
 
 def create_app(test_config=None):
@@ -45,12 +45,39 @@ def create_app(test_config=None):
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev-secret'),
         JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', 'jwt-secret'),
         DB_PATH=os.environ.get('DB_PATH', os.path.join(os.path.dirname(__file__), 'data', 'app.db')),
+        # Seconds each request may spend before DB calls fail fast with 503.
+        REQUEST_TIME_BUDGET=float(os.environ.get('REQUEST_TIME_BUDGET', '10')),
+        # Warm caches at startup and after each worker fork; when off, /ready reports
+        # ready without waiting for a warmup that will not run.
+        WARMUP_ON_STARTUP=os.environ.get('WARMUP_ON_STARTUP', '1').lower() not in ('0', 'false', 'no'),
+        # Seconds a user's role stays cached for tokens that lack a current role claim.
+        ROLE_CACHE_TTL=float(os.environ.get('ROLE_CACHE_TTL', '60')),
+        # Seconds between catching up on revocations made by other processes.
+        REVOCATION_SYNC_INTERVAL=float(os.environ.get('REVOCATION_SYNC_INTERVAL', '2')),
+        # Seconds between deletes of expired revoked tokens (0 leaves it to `revocation.py --prune`).
+        REVOKED_TOKEN_PRUNE_INTERVAL=float(os.environ.get('REVOKED_TOKEN_PRUNE_INTERVAL', '3600')),
+        # Seconds a draft cart holds its stock after its last change, seconds of
+        # inactivity before the cart is deleted, and seconds between sweeps (0 disables).
+        CART_RESERVATION_TTL=float(os.environ.get('CART_RESERVATION_TTL', '600')),
+        CART_ABANDON_AFTER=float(os.environ.get('CART_ABANDON_AFTER', '3600')),
+        CART_SWEEP_INTERVAL=float(os.environ.get('CART_SWEEP_INTERVAL', '60')),
+        # Password hashing processes per app process (0 hashes on the request thread),
+        # jobs each process may queue, and seconds to wait for a slot before a 429.
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', '1')),
+        PASSWORD_HASH_QUEUE=int(os.environ.get('PASSWORD_HASH_QUEUE', '4')),
+        PASSWORD_HASH_WAIT=float(os.environ.get('PASSWORD_HASH_WAIT', '0.5')),
+        # Processes a bulk user import hashes with (defaults to one per core).
+        PASSWORD_HASH_BULK_WORKERS=int(os.environ.get('PASSWORD_HASH_BULK_WORKERS', str(os.cpu_count() or 1))),
+        # e.g. "200 per minute"; Flask-Limiter is only loaded when a default is set.
+        RATELIMIT_DEFAULT=os.environ.get('RATELIMIT_DEFAULT'),
     )
 
     if test_config:
         app.config.update(test_config)
 
     # Security and extensions (optional)
+    CORS = _optional('flask_cors', 'CORS')
+    JWTManager = _optional('flask_jwt_extended', 'JWTManager')
     if CORS:
         CORS(app)
     if JWTManager:
@@ -59,25 +86,51 @@ def create_app(test_config=None):
         @jwt.token_in_blocklist_loader
         def check_if_token_revoked(jwt_header, jwt_payload):
             try:
-                from utils import get_db
-                jti = jwt_payload.get('jti')
-                conn = get_db()
-                cur = conn.cursor()
-                cur.execute('SELECT jti FROM revoked_tokens WHERE jti=?', (jti,))
-                return cur.fetchone() is not None
+                from revocation import revoked_tokens
+                return revoked_tokens.is_revoked(jwt_payload.get('jti'))
             except Exception:
                 return False
-    if Limiter:
-        # Pass keywords to work across limiter versions
-        Limiter(key_func=get_remote_address, app=app)
-
-    # Register blueprints
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(menu_bp, url_prefix='/api/menu')
-    app.register_blueprint(schedule_bp, url_prefix='/api/schedules')
-    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
-    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
-    app.register_blueprint(orders_bp, url_prefix='/api/orders')
+    if app.config.get('RATELIMIT_DEFAULT'):
+        Limiter = _optional('flask_limiter', 'Limiter')
+        get_remote_address = _optional('flask_limiter.util', 'get_remote_address')
+        if Limiter and get_remote_address:
+            # Pass keywords to work across limiter versions
+            Limiter(key_func=get_remote_address, app=app)
+
+    @app.before_request
+    def start_request_budget():
+        view = app.view_functions.get(request.endpoint) if request.endpoint else None
+        budget = getattr(view, 'request_budget', None)
+        if budget is None:
+            budget = app.config.get('REQUEST_TIME_BUDGET')
+        set_request_deadline(budget)
+
+    @app.teardown_request
+    def clear_request_budget(exc=None):
+        clear_request_deadline()
+
+    @app.teardown_appcontext
+    def return_db_connection(exc=None):
+        # Hand the pooled sqlite connection back; an unfinished transaction is rolled back.
+        release_db()
+
+    @app.errorhandler(DeadlineExceeded)
+    def request_budget_exhausted(exc):
+        return jsonify({'msg': 'Service busy, please retry'}), 503
+
+    @app.errorhandler(HashingBusy)
+    def hashing_saturated(exc):
+        return jsonify({'msg': 'Too many sign-in attempts right now, please retry'}), 429, {'Retry-After': '1'}
+
+    @app.errorhandler(sqlite3.OperationalError)
+    def sqlite_operational_error(exc):
+        # The deadline progress handler interrupts sqlite once the budget is spent.
+        remaining = remaining_request_budget()
+        if str(exc) == 'interrupted' and remaining is not None and remaining <= 0:
+            return request_budget_exhausted(exc)
+        raise exc
+
+    _register_blueprints(app)
 
     @app.route('/ping')
     def ping():
@@ -87,17 +140,33 @@ def create_app(test_config=None):
     def health():
         return 'ok'
 
-    try:
-        ensure_schedule_schema()
-    except Exception:
-        # Schema synchronization is best-effort during app factory creation; detailed logging occurs in schedule module when invoked at runtime.
-        pass
+    @app.route('/ready')
+    def ready():
+        # Unlike /health, this stays 503 until the process has warmed up.
+        from warmup import readiness, warm_up
+
+        state = readiness()
+        if not app.config['WARMUP_ON_STARTUP'] and state['finished_at'] is None and not state['running']:
+            # Warmup is switched off and nothing has attempted it: there is nothing to wait for.
+            return jsonify({'status': 'ready', **state, 'ready': True}), 200
+        if not state['ready'] and state['error'] and not state['running']:
+            # The previous attempt failed (e.g. the database was unreachable); retry.
+            warm_up()
+            state = readiness()
+        body = {'status': 'ready' if state['ready'] else 'warming', **state}
+        return jsonify(body), 200 if state['ready'] else 503
 
     if app.config.get('TESTING'):
-        try:
-            reset_schedule_state()
-        except Exception:
-            pass
+        # Production factories do no DB work; app.py's startup phase migrates.
+        from migrations import ensure_migrated
+        from schedule import reset_schedule_state
+
+        with app.app_context():
+            ensure_migrated()
+            try:
+                reset_schedule_state()
+            except Exception:
+                pass
 
     return app
 
@@ -1,76 +1,64 @@
 import os
 import atexit
-import threading
-from pathlib import Path
 
 # Prefer app factory from api.py which registers blueprints and extensions
 from api import create_app
-from utils import close_db, get_db
+from migrations import ensure_migrated
+from seed_data import ensure_seed_data
+from utils import close_db, close_pools, get_db
+from warmup import readiness, warm_up
 
 app = create_app()
 
-_bootstrap_lock = threading.Lock()
-_bootstrap_done = False
-_SCHEMA_PATH = Path(__file__).with_name('db_schema.sql')
 
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, '1').lower() not in ('0', 'false', 'no')
 
-def _bootstrap_database() -> None:
-    global _bootstrap_done
-    if _bootstrap_done:
-        return
-    with _bootstrap_lock:
-        if _bootstrap_done:
-            return
+
+def bootstrap_database() -> None:
+    """Startup phase: migrate and seed before the first request is served.
+
+    ``MIGRATE_ON_STARTUP`` and ``SEED_ON_STARTUP`` switch each part off for
+    deployments that run ``python migrations.py`` or ``seed_data.py --if-needed``
+    (which migrates too) as a separate step. Seeding is guarded by a marker row
+    in the database, so every worker after the first one only pays for a single
+    lookup.
+    """
+    with app.app_context():
         try:
-            conn = get_db()
-            cur = conn.cursor()
-            try:
-                cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-                schema_present = cur.fetchone() is not None
-            except Exception:
-                schema_present = False
-
-            if not schema_present and _SCHEMA_PATH.exists():
-                with _SCHEMA_PATH.open('r', encoding='utf-8') as handle:
-                    conn.executescript(handle.read())
-                conn.commit()
-
-            cur.execute(
-                'CREATE TABLE IF NOT EXISTS fake_data ('
-                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
-                'message TEXT)'
-            )
-            conn.commit()
-
-            try:
-                from schedule import ensure_schedule_schema as _ensure_schedule_schema
-                _ensure_schedule_schema()
-            except Exception as schedule_exc:
-                print(f'Failed to synchronize schedule schema: {schedule_exc}')
-
-            try:
-                from seed_data import ensure_seed_data as _ensure_seed_data
-                _ensure_seed_data(conn)
-            except Exception as seed_exc:
-                print(f'Failed to ensure seed data: {seed_exc}')
-        except Exception as exc:
-            print(f'Failed to bootstrap database: {exc}')
-            return
-        _bootstrap_done = True
-
-
-@app.before_request
-def ensure_db():
-    _bootstrap_database()
+            if _env_flag('MIGRATE_ON_STARTUP'):
+                ensure_migrated()
+            if _env_flag('SEED_ON_STARTUP'):
+                ensure_seed_data(get_db())
+        except Exception:
+            app.logger.exception('Failed to bootstrap database')
+
+
+def warm_worker() -> None:
+    """Warm this process's DB pool and caches; /ready reports 200 afterwards.
+
+    Runs at startup and again in every gunicorn worker after fork, before the
+    worker accepts connections, unless ``WARMUP_ON_STARTUP`` is off.
+    """
+    if not app.config['WARMUP_ON_STARTUP']:
+        return
+    with app.app_context():
+        if not warm_up():
+            print(f"Warmup failed: {readiness()['error']}")
 
 
 def close_db_connections():
     close_db()
+    close_pools()
 
 
 atexit.register(close_db_connections)
 
 
+bootstrap_database()
+warm_worker()
+
+
 if __name__ == '__main__':
-    _bootstrap_database()
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs gunicorn -c gunicorn.conf.py app:app
+    app.run(host='0.0.0.0', port=5000)
@@ -1,5 +1,10 @@
+import csv
+import io
+import json
+
 from flask import Blueprint, request, jsonify, current_app
-from utils import get_db, hash_password, verify_password
+import password_pool
+from utils import get_db, hash_scheme, query_batch, request_budget
 
 bp = Blueprint('auth', __name__)
 
@@ -13,18 +18,11 @@ def role_required(role_name):
             try:
                 # local import to avoid hard dependency during test collection
                 from flask_jwt_extended import get_jwt_identity
+                from permissions import current_role
                 identity = get_jwt_identity()
-                try:
-                    identity = int(identity)
-                except Exception:
-                    pass
                 if not identity:
                     return jsonify({'msg': 'Missing identity'}), 401
-                conn = get_db()
-                cur = conn.cursor()
-                cur.execute('SELECT r.name FROM users u JOIN roles r ON u.role_id=r.id WHERE u.id=?', (identity,))
-                row = cur.fetchone()
-                if not row or row[0] != role_name:
+                if current_role() != role_name:
                     return jsonify({'msg': 'Insufficient permissions'}), 403
             except Exception:
                 return jsonify({'msg': 'Auth error'}), 401
@@ -61,7 +59,7 @@ def register():
     if cur.fetchone():
         return jsonify({'msg': 'Email already registered'}), 400
 
-    pw_hash = hash_password(password)
+    pw_hash = password_pool.hash_password(password)
     cur.execute('INSERT INTO users (first_name,last_name,email,role_id,signup_date,password_hash) VALUES (?,?,?,?,datetime("now"),?)', (
         first_name, last_name, email, role_id, pw_hash
     ))
@@ -69,7 +67,8 @@ def register():
     user_id = cur.lastrowid
     try:
         from flask_jwt_extended import create_access_token, create_refresh_token
-        access = create_access_token(identity=str(user_id))
+        from permissions import role_claims
+        access = create_access_token(identity=str(user_id), additional_claims=role_claims(role))
         refresh = create_refresh_token(identity=str(user_id))
     except Exception:
         access = refresh = None
@@ -85,23 +84,28 @@ def login():
         return jsonify({'msg': 'email and password required'}), 400
     conn = get_db()
     cur = conn.cursor()
-    cur.execute('SELECT id, email FROM users WHERE email=?', (email,))
+    # The role comes back with the hash so the token can carry it as a claim.
+    cur.execute(
+        'SELECT u.id, u.password_hash, r.name FROM users u LEFT JOIN roles r ON u.role_id=r.id WHERE u.email=?',
+        (email,),
+    )
     row = cur.fetchone()
-    if not row:
-        return jsonify({'msg': 'Invalid credentials'}), 401
-    user_id = row[0]
-    # Verify the stored password_hash
-    cur.execute('SELECT password_hash FROM users WHERE id=?', (user_id,))
-    row2 = cur.fetchone()
-    if not row2 or not row2[0]:
+    if not row or not row[1]:
         return jsonify({'msg': 'Invalid credentials'}), 401
-    stored = row2[0]
-    if not verify_password(password, stored):
+    user_id, stored, role = row[0], row[1], row[2]
+    valid, upgraded = password_pool.verify_and_upgrade(password, stored)
+    if not valid:
         return jsonify({'msg': 'Invalid credentials'}), 401
+    if upgraded:
+        # Move the stored hash to current parameters; skip if it changed meanwhile.
+        cur.execute('UPDATE users SET password_hash=? WHERE id=? AND password_hash=?', (upgraded, user_id, stored))
+        conn.commit()
 
     try:
         from flask_jwt_extended import create_access_token, create_refresh_token
-        access = create_access_token(identity=str(user_id))
+        from permissions import cache_role, role_claims
+        cache_role(user_id, role)
+        access = create_access_token(identity=str(user_id), additional_claims=role_claims(role))
         refresh = create_refresh_token(identity=str(user_id))
     except Exception as e:
         if current_app and current_app.config.get('TESTING'):
@@ -114,13 +118,15 @@ def login():
 def refresh_token():
     try:
         from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+        from permissions import lookup_role, role_claims
     except Exception:
         return jsonify({'msg': 'JWT not available'}), 501
 
     @jwt_required(refresh=True)
     def inner():
         uid = get_jwt_identity()
-        access = create_access_token(identity=str(uid))
+        # Re-resolve the role so a refreshed token reflects role changes.
+        access = create_access_token(identity=str(uid), additional_claims=role_claims(lookup_role(uid)))
         return jsonify({'access_token': access})
 
     return inner()
@@ -135,13 +141,19 @@ def logout():
 
     @jwt_required()
     def inner():
-        jti = get_jwt()['jti']
-        token_type = get_jwt().get('type')
-        uid = get_jwt().get('sub')
+        from revocation import revoked_tokens
+
+        claims = get_jwt()
+        jti = claims['jti']
+        expires_at = claims.get('exp')
         conn = get_db()
         cur = conn.cursor()
-        cur.execute('INSERT OR REPLACE INTO revoked_tokens (jti, token_type, user_identity) VALUES (?,?,?)', (jti, token_type, uid))
+        cur.execute(
+            'INSERT OR REPLACE INTO revoked_tokens (jti, token_type, user_identity, expires_at) VALUES (?,?,?,?)',
+            (jti, claims.get('type'), claims.get('sub'), expires_at),
+        )
         conn.commit()
+        revoked_tokens.add(jti, expires_at)
         return jsonify({'msg': 'token revoked'})
 
     return inner()
@@ -216,6 +228,132 @@ def me():
     return inner()
 
 
+# Bulk imports: rows accepted per request, and users inserted per transaction.
+MAX_IMPORT_ROWS = 10_000
+IMPORT_BATCH_SIZE = 500
+IMPORT_FIELDS = ('email', 'password', 'password_hash', 'first_name', 'last_name', 'role', 'phone_number', 'title')
+
+
+def _parse_import(body: str, content_type: str):
+    """Yield one dict (or an error string) per CSV/NDJSON data row."""
+    stripped = body.lstrip()
+    if 'ndjson' in content_type or 'jsonl' in content_type or ('csv' not in content_type and stripped.startswith('{')):
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield 'invalid JSON'
+                continue
+            yield record if isinstance(record, dict) else 'expected a JSON object'
+    else:
+        yield from csv.DictReader(io.StringIO(body))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@bp.route('/users/import', methods=['POST'])
+@request_budget(300)
+def import_users():
+    """Create users in bulk from CSV (with a header row) or NDJSON; Admin only.
+
+    Each row needs an email and either a password or an existing bcrypt/PBKDF2
+    password_hash; role defaults to User. Existing emails are skipped. The
+    response reports every row as created, exists or error, in input order.
+    """
+    from permissions import require_roles
+
+    @require_roles('Admin')
+    def inner():
+        try:
+            rows = list(_parse_import(request.get_data(as_text=True), request.content_type or ''))
+        except csv.Error as exc:
+            return jsonify({'msg': f'invalid CSV: {exc}'}), 400
+        if not rows:
+            return jsonify({'msg': 'no rows to import'}), 400
+        if len(rows) > MAX_IMPORT_ROWS:
+            return jsonify({'msg': f'at most {MAX_IMPORT_ROWS} rows per import'}), 413
+
+        conn = get_db()
+        emails = sorted({
+            row['email'].strip().lower() for row in rows
+            if isinstance(row, dict) and isinstance(row.get('email'), str) and row['email'].strip()
+        })
+        # Roles and the already-registered emails are read up front in one round trip.
+        lookups = query_batch(conn, [('SELECT id, name FROM roles', ())] + [
+            (f"SELECT lower(email) FROM users WHERE lower(email) IN ({','.join('?' * len(chunk))})", chunk)
+            for chunk in _chunks(emails, IMPORT_BATCH_SIZE)
+        ])
+        roles = {name.lower(): (role_id, name) for role_id, name in lookups[0]}
+        existing = {row[0] for result in lookups[1:] for row in result}
+
+        results = []
+        pending = []  # (result, row, email, role_id) for rows that still need inserting
+        seen = set()
+        for index, row in enumerate(rows, start=1):
+            result = {'row': index}
+            results.append(result)
+            if not isinstance(row, dict):
+                result.update(status='error', error=row)
+                continue
+            row = {key: (str(row[key]).strip() if row.get(key) is not None else '') for key in IMPORT_FIELDS}
+            email = row['email'].lower()
+            result['email'] = email
+            role = roles.get((row['role'] or 'User').lower())
+            if not email or '@' not in email:
+                result.update(status='error', error='email required')
+            elif not row['password'] and not row['password_hash']:
+                result.update(status='error', error='password or password_hash required')
+            elif row['password_hash'] and not hash_scheme(row['password_hash']):
+                result.update(status='error', error='unrecognised password_hash format')
+            elif role is None:
+                result.update(status='error', error=f"unknown role {row['role']!r}")
+            elif email in existing or email in seen:
+                result.update(status='exists')
+            else:
+                seen.add(email)
+                pending.append((result, row, email, role[0]))
+
+        to_hash = [entry for entry in pending if not entry[1]['password_hash']]
+        for entry, pw_hash in zip(to_hash, password_pool.hash_many([entry[1]['password'] for entry in to_hash])):
+            entry[1]['password_hash'] = pw_hash
+
+        cur = conn.cursor()
+        for batch in _chunks(pending, IMPORT_BATCH_SIZE):
+            cur.executemany(
+                'INSERT OR IGNORE INTO users (first_name,last_name,email,phone_number,role_id,title,signup_date,password_hash) '
+                "VALUES (?,?,?,?,?,?,datetime('now'),?)",
+                [
+                    (row['first_name'], row['last_name'], email, row['phone_number'] or None, role_id, row['title'] or None, row['password_hash'])
+                    for _, row, email, role_id in batch
+                ],
+            )
+            conn.commit()
+
+        # INSERT OR IGNORE skips emails registered concurrently; those report as existing.
+        created = {}
+        for result in query_batch(conn, [
+            (f"SELECT id, email, password_hash FROM users WHERE email IN ({','.join('?' * len(batch))})", [entry[2] for entry in batch])
+            for batch in _chunks(pending, IMPORT_BATCH_SIZE)
+        ]):
+            created.update({email: (user_id, pw_hash) for user_id, email, pw_hash in result})
+        for result, row, email, _ in pending:
+            user_id, pw_hash = created.get(email, (None, None))
+            if pw_hash == row['password_hash']:
+                result.update(status='created', id=user_id)
+            else:
+                result.update(status='exists')
+
+        counts = {status: sum(1 for result in results if result['status'] == status) for status in ('created', 'exists', 'error')}
+        return jsonify({**counts, 'results': results})
+
+    return inner()
+
+
 @bp.route('/status', methods=['GET'])
 def status():
     """Check the status of the auth service"""
@@ -0,0 +1,152 @@
+"""
+cart.py
+
+Draft carts: the items a customer is still choosing, with short-lived stock
+reservations, kept apart from orders until the cart is submitted.
+
+A cart line holds ``qty`` of an item for ``CART_RESERVATION_TTL`` seconds from
+the cart's last change. While it is held, nobody else can reserve that stock,
+but ``menu_items.qty_left`` is not touched until submit. A lapsed line stays in
+the cart and is reserved again (if stock allows) when the cart is next changed
+or submitted. Carts idle for ``CART_ABANDON_AFTER`` seconds are deleted by a
+background sweeper, at most every ``CART_SWEEP_INTERVAL`` seconds.
+
+The lines live in the ``cart_reservations`` table rather than process memory so
+every worker and container sees the same cart and the same holds.
+
+Run: python flask/cart.py --sweep
+"""
+import sys
+import threading
+import time
+from typing import Any, List, Optional
+
+from flask import current_app
+
+from utils import get_db
+
+_sweep_lock = threading.Lock()
+_swept_at: Optional[float] = None
+
+# Inserts or resizes a member's line only if the item exists and its stock, less
+# what other members hold right now, covers the new quantity.
+_RESERVE_SQL = (
+    'INSERT INTO cart_reservations (member_id, item_id, qty, reserved_until) '
+    'SELECT ?, m.id, ?, ? FROM menu_items m WHERE m.id=? AND (m.qty_left IS NULL OR m.qty_left - COALESCE(('
+    'SELECT SUM(r.qty) FROM cart_reservations r WHERE r.item_id=m.id AND r.member_id != ? AND r.reserved_until > ?'
+    '), 0) >= ?) '
+    'ON CONFLICT(member_id, item_id) DO UPDATE SET qty=excluded.qty, reserved_until=excluded.reserved_until'
+)
+
+
+def _config(key: str, default: float) -> float:
+    try:
+        return float(current_app.config.get(key, default))
+    except Exception:
+        return default
+
+
+def load_cart(conn: Any, member_id: Any) -> List[Any]:
+    """The member's lines joined with their menu rows, oldest first."""
+    cur = conn.cursor()
+    cur.execute(
+        'SELECT r.item_id, r.qty, r.reserved_until, m.name, m.price, m.description, m.img_link, m.qty_left '
+        'FROM cart_reservations r JOIN menu_items m ON m.id = r.item_id WHERE r.member_id=? ORDER BY r.rowid',
+        (member_id,),
+    )
+    return cur.fetchall()
+
+
+def reserve(conn: Any, member_id: Any, item_id: int, qty: int) -> bool:
+    """Set the member's line for ``item_id`` to ``qty`` (0 removes it) and hold it.
+
+    Lines still held are extended along with it; lapsed ones are left for
+    ``renew_lapsed`` since their stock may have gone to someone else meanwhile.
+    Returns False, changing nothing, when the stock left after other members'
+    holds is too small or the item does not exist.
+    """
+    now = time.time()
+    until = now + _config('CART_RESERVATION_TTL', 600.0)
+    cur = conn.cursor()
+    if qty > 0:
+        cur.execute(_RESERVE_SQL, (member_id, qty, until, item_id, member_id, now, qty))
+        # Only a line just written carries ``until``, so a refused reserve extends nothing.
+        conn.cursor().execute(
+            'UPDATE cart_reservations SET reserved_until=? WHERE member_id=? AND reserved_until > ? AND EXISTS ('
+            'SELECT 1 FROM cart_reservations WHERE member_id=? AND item_id=? AND reserved_until=?)',
+            (until, member_id, now, member_id, item_id, until),
+        )
+    else:
+        cur.execute('DELETE FROM cart_reservations WHERE member_id=? AND item_id=?', (member_id, item_id))
+        conn.cursor().execute(
+            'UPDATE cart_reservations SET reserved_until=? WHERE member_id=? AND reserved_until > ?',
+            (until, member_id, now),
+        )
+    conn.commit()
+    return qty <= 0 or cur.rowcount > 0
+
+
+def renew_lapsed(conn: Any, member_id: Any, lines: List[Any]) -> List[int]:
+    """Hold lapsed lines again if stock allows; return the item ids that could not be."""
+    now = time.time()
+    return [
+        line['item_id'] for line in lines
+        if line['reserved_until'] <= now and not reserve(conn, member_id, line['item_id'], line['qty'])
+    ]
+
+
+def clear(conn: Any, member_id: Any) -> None:
+    cur = conn.cursor()
+    cur.execute('DELETE FROM cart_reservations WHERE member_id=?', (member_id,))
+    conn.commit()
+
+
+def sweep_abandoned(conn: Any, now: Optional[float] = None) -> int:
+    """Delete carts untouched for ``CART_ABANDON_AFTER`` seconds; return how many lines went."""
+    # Every change pushes reserved_until to last touch + TTL, so the newest one dates the cart.
+    cutoff = (now or time.time()) - _config('CART_ABANDON_AFTER', 3600.0) + _config('CART_RESERVATION_TTL', 600.0)
+    cur = conn.cursor()
+    cur.execute(
+        'DELETE FROM cart_reservations WHERE member_id IN ('
+        'SELECT member_id FROM cart_reservations GROUP BY member_id HAVING MAX(reserved_until) <= ?)',
+        (cutoff,),
+    )
+    conn.commit()
+    return max(cur.rowcount, 0)
+
+
+def maybe_sweep() -> None:
+    """Start the sweeper thread if the last sweep is older than ``CART_SWEEP_INTERVAL``.
+
+    Called from cart requests, so it only ever runs in processes serving traffic.
+    """
+    global _swept_at
+    interval = _config('CART_SWEEP_INTERVAL', 60.0)
+    if interval <= 0:
+        return
+    with _sweep_lock:
+        now = time.monotonic()
+        if _swept_at is not None and now - _swept_at < interval:
+            return
+        _swept_at = now
+    app = current_app._get_current_object()
+
+    def run() -> None:
+        try:
+            with app.app_context():
+                sweep_abandoned(get_db())
+        except Exception as exc:
+            app.logger.warning('Sweeping abandoned carts failed: %s', exc)
+
+    threading.Thread(target=run, name='cart-sweeper', daemon=True).start()
+
+
+def main() -> None:
+    if '--sweep' not in sys.argv[1:]:
+        print('Usage: python cart.py --sweep')
+        return
+    print(f'Swept {sweep_abandoned(get_db())} lines from abandoned carts')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+check_import_time.py
+
+Import-time budget check for the app entrypoint, based on ``python -X importtime``.
+It imports ``app`` in a fresh interpreter with startup seeding and warmup turned
+off (so no DB work), prints the slowest modules and exits non-zero when the
+import exceeds the budget or pulls in a dependency that is supposed to load
+lazily.
+
+Run: python flask/check_import_time.py [--budget-ms 500] [--target app]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '500'))
+
+# Only specific endpoints, the rqlite backend or an explicit config need these.
+LAZY_MODULES = ('marshmallow', 'passlib', 'requests', 'flask_limiter')
+
+
+def measure(target: str = 'app') -> Dict[str, Tuple[int, int]]:
+    """Import ``target`` in a subprocess and return {module: (self_us, cumulative_us)}."""
+    env = dict(os.environ, MIGRATE_ON_STARTUP='0', SEED_ON_STARTUP='0', WARMUP_ON_STARTUP='0', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {target} failed:\n{proc.stderr}')
+
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header row
+        timings[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return timings
+
+
+def check(timings: Dict[str, Tuple[int, int]], target: str, budget_ms: float) -> List[str]:
+    """Return the budget violations in ``timings`` (empty when within budget)."""
+    problems = []
+    total_ms = timings.get(target, (0, 0))[1] / 1000
+    if total_ms > budget_ms:
+        problems.append(f'import {target} took {total_ms:.1f} ms (budget {budget_ms:.0f} ms)')
+    for module in LAZY_MODULES:
+        if module in timings:
+            problems.append(f'{module} is imported eagerly; it should load on first use')
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check the app import-time budget.')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--target', default='app')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    timings = measure(args.target)
+    print(f'Slowest modules importing {args.target} (cumulative ms):')
+    slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for module, (_, cumulative) in slowest:
+        print(f'  {cumulative / 1000:8.1f}  {module}')
+
+    problems = check(timings, args.target, args.budget_ms)
+    for problem in problems:
+        print('FAIL:', problem)
+    if problems:
+        sys.exit(1)
+    print('Import time within budget')
+
+
+if __name__ == '__main__':
+    main()
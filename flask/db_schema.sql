@@ -18,6 +18,8 @@ CREATE TABLE IF NOT EXISTS menu_items (
   discount REAL DEFAULT 0,
   FOREIGN KEY (type_id) REFERENCES types(id)
 );
+-- qty_left never goes negative: migration 8 adds the menu_items_stock_guard
+-- trigger (kept out of this file because rqlite's executescript splits on ';').
 
 -- Users
 CREATE TABLE IF NOT EXISTS users (
@@ -49,13 +51,44 @@ CREATE TABLE IF NOT EXISTS orders (
   FOREIGN KEY (member_id) REFERENCES users(id)
 );
 
--- Order items (many-to-many join table)
--- Order items: one row per order, items stored as JSON array of {"item_id", "qty"}
-CREATE TABLE IF NOT EXISTS order_items (
-  order_id INTEGER PRIMARY KEY,
-  items TEXT,
-  FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+-- Order lines: one row per item in an order, with the price and discount (%)
+-- the item had when it was ordered. The unique (order_id, item_id) index
+-- serves per-order lookups; idx_order_lines_item serves per-item aggregates.
+-- Deleting a menu item keeps its lines, with item_id set to NULL.
+CREATE TABLE IF NOT EXISTS order_lines (
+  id INTEGER PRIMARY KEY,
+  order_id INTEGER NOT NULL,
+  item_id INTEGER,
+  qty INTEGER NOT NULL CHECK (qty > 0),
+  unit_price REAL NOT NULL DEFAULT 0,
+  discount REAL NOT NULL DEFAULT 0,
+  UNIQUE (order_id, item_id),
+  FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+  FOREIGN KEY (item_id) REFERENCES menu_items(id) ON DELETE SET NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_lines_item ON order_lines (item_id);
+CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (order_timestamp);
+CREATE INDEX IF NOT EXISTS idx_orders_member_time ON orders (member_id, order_timestamp, id);
+
+-- Draft carts: stock a member holds while choosing, until reserved_until (unix
+-- seconds). Nothing here touches menu_items.qty_left until the cart is submitted.
+CREATE TABLE IF NOT EXISTS cart_reservations (
+  member_id INTEGER NOT NULL,
+  item_id INTEGER NOT NULL,
+  qty INTEGER NOT NULL CHECK (qty > 0),
+  reserved_until REAL NOT NULL,
+  PRIMARY KEY (member_id, item_id),
+  FOREIGN KEY (member_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (item_id) REFERENCES menu_items(id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS idx_cart_reservations_item ON cart_reservations (item_id, reserved_until);
+
+-- Read-only compatibility view with the old order_items shape: one row per
+-- order, items as a JSON array of {"item_id", "qty"}.
+CREATE VIEW IF NOT EXISTS order_items (order_id, items) AS
+  SELECT order_id, json_group_array(json_object('item_id', item_id, 'qty', qty))
+  FROM (SELECT order_id, item_id, qty FROM order_lines ORDER BY order_id, id)
+  GROUP BY order_id;
 
 -- Weekly schedule
 CREATE TABLE IF NOT EXISTS weekly_schedule (
@@ -67,12 +100,16 @@ CREATE TABLE IF NOT EXISTS weekly_schedule (
   FOREIGN KEY (approved_by) REFERENCES users(id)
 );
 
--- Revoked JWT tokens (simple blacklist)
+-- Revoked JWT tokens. id is the high-water mark processes sync their in-memory
+-- index from; rows can be pruned once expires_at (token exp, unix time) passes.
+-- The expires_at index is created by migration 7 so older tables convert first.
 CREATE TABLE IF NOT EXISTS revoked_tokens (
-  jti TEXT PRIMARY KEY,
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  jti TEXT NOT NULL UNIQUE,
   token_type TEXT,
   user_identity INTEGER,
-  revoked_at DATETIME DEFAULT (datetime('now'))
+  revoked_at DATETIME DEFAULT (datetime('now')),
+  expires_at INTEGER
 );
 
 -- Shifts table: defines a shift template
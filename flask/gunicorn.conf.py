@@ -0,0 +1,67 @@
+"""
+gunicorn.conf.py
+
+Production serving config: gunicorn -c gunicorn.conf.py app:app
+
+The app is preloaded in the master, so migrations and seeding (app.py's startup
+phase) run once per container and workers fork with the code already imported.
+Database handles are closed before each fork and reopened inside the worker.
+Every setting can be tuned through the environment variables below.
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = _env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+# More than one thread switches gunicorn to the gthread worker.
+threads = _env_int('GUNICORN_THREADS', 4)
+preload_app = True
+
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+# In-flight requests get this long to finish on SIGTERM/SIGHUP before a worker is killed.
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers periodically (jittered so they do not all restart at once).
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    # sqlite handles, the rqlite HTTP session, the hedged-read threads and the
+    # master's password-hashing processes (started by its warmup) must not be
+    # shared with children.
+    import password_pool
+    from utils import close_db, close_pools, shutdown_hedge_pool
+
+    close_db()
+    close_pools()
+    shutdown_hedge_pool()
+    password_pool.shutdown()
+
+
+def post_fork(server, worker):
+    from app import warm_worker
+
+    warm_worker()
+
+
+def worker_exit(server, worker):
+    # Workers leave through os._exit, which skips atexit handlers.
+    import password_pool
+    from app import close_db_connections
+
+    close_db_connections()
+    password_pool.shutdown()
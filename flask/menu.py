@@ -6,7 +6,7 @@ from typing import Any, Dict, Optional
 from flask import Blueprint, jsonify, request, send_from_directory
 from werkzeug.utils import secure_filename
 
-from utils import allowed_image, get_db
+from utils import allowed_image, get_db, read_consistency, request_budget
 
 try:  # pragma: no cover - used when running as a package
     from .permissions import require_roles
@@ -83,6 +83,7 @@ def _row_to_item(row: Any) -> Dict[str, Any]:
 
 @bp.route('/', methods=['GET'])
 @bp.route('', methods=['GET'])
+@request_budget(5)
 def list_items():
     conn = get_db()
     cur = conn.cursor()
@@ -113,8 +114,10 @@ def list_items():
 
     sql += ' ORDER BY m.id DESC'
 
-    cur.execute(sql, params)
-    rows = cur.fetchall()
+    # Menu listings tolerate replication lag; let rqlite answer from a follower.
+    with read_consistency(conn, 'none'):
+        cur.execute(sql, params)
+        rows = cur.fetchall()
     items = [_row_to_item(row) for row in rows]
     return jsonify({'items': items})
 
@@ -290,18 +293,14 @@ def update_item(item_id: int):
         return jsonify({'msg': 'no fields to update'}), 400
 
     params.append(item_id)
-    sql = f"UPDATE menu_items SET {', '.join(fields)} WHERE id=?"
-    cur.execute(sql, params)
-    conn.commit()
-
-    cur.execute(
-        'SELECT m.id, m.name, m.price, m.description, m.img_link, '
-        'm.qty_left, m.discount, m.type_id, t.name AS type_name '
-        'FROM menu_items m LEFT JOIN types t ON m.type_id = t.id '
-        'WHERE m.id=?',
-        (item_id,),
+    sql = (
+        f"UPDATE menu_items SET {', '.join(fields)} WHERE id=? "
+        'RETURNING id, name, price, description, img_link, qty_left, discount, type_id, '
+        '(SELECT name FROM types WHERE types.id = menu_items.type_id) AS type_name'
     )
+    cur.execute(sql, params)
     row = cur.fetchone()
+    conn.commit()
     if not row:
         return jsonify({'msg': 'item not found'}), 404
     return jsonify(_row_to_item(row))
@@ -368,8 +367,9 @@ def uploaded_file(filename: str):
 def list_types():
     conn = get_db()
     cur = conn.cursor()
-    cur.execute('SELECT id, name FROM types ORDER BY name')
-    rows = cur.fetchall()
+    with read_consistency(conn, 'none'):
+        cur.execute('SELECT id, name FROM types ORDER BY name')
+        rows = cur.fetchall()
     types = [dict(row) for row in rows]
     return jsonify({'types': types})
 
@@ -0,0 +1,407 @@
+"""
+migrations.py
+
+Numbered schema migrations tracked in the ``schema_migrations`` table.
+
+Pending migrations run once per database under a lock row that every process
+(and every rqlite client) contends on, so concurrent workers starting together
+do not race each other's ALTER TABLEs. Once a database is known to be current,
+``ensure_migrated()`` answers from memory without touching it.
+
+Migrations 1-4 capture the schema the app used to patch up on every request.
+They stay idempotent because databases created before this table existed
+already carry some or all of their changes.
+
+Run: python flask/migrations.py
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Set, Tuple
+
+from utils import RqliteError, db_identity, get_db
+
+SCHEMA_PATH = Path(__file__).with_name('db_schema.sql')
+LOCK_STALE_AFTER = 300.0
+LOCK_WAIT_TIMEOUT = 120.0
+
+_migrated: Set[str] = set()
+_migrated_lock = threading.Lock()
+
+
+class MigrationLockTimeout(RuntimeError):
+    pass
+
+
+def _add_column(conn: Any, table: str, column_def: str) -> bool:
+    """Add a column, returning False when it already exists."""
+    try:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column_def}')
+        # Commit right away so buffered (rqlite) connections report duplicates here.
+        conn.commit()
+        return True
+    except (sqlite3.OperationalError, RqliteError) as exc:
+        message = str(exc).lower()
+        if 'duplicate column' in message or 'already exists' in message:
+            conn.rollback()
+            return False
+        raise
+
+
+def _initial_schema(conn: Any) -> None:
+    with SCHEMA_PATH.open('r', encoding='utf-8') as handle:
+        conn.executescript(handle.read())
+    conn.execute('CREATE TABLE IF NOT EXISTS fake_data (id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT)')
+
+
+def _user_profile_columns(conn: Any) -> None:
+    _add_column(conn, 'users', 'title TEXT')
+    _add_column(conn, 'users', 'password_hash TEXT')
+
+
+def _schedule_columns(conn: Any) -> None:
+    _add_column(conn, 'shifts', 'recurrence_rule TEXT')
+    _add_column(conn, 'shifts', "default_status TEXT DEFAULT 'scheduled'")
+    _add_column(conn, 'shifts', 'default_duration INTEGER')
+
+    assignment_columns = (
+        'start_time TEXT',
+        'end_time TEXT',
+        "status TEXT DEFAULT 'scheduled'",
+        'notes TEXT',
+        'recurrence_parent_id INTEGER',
+        'schedule_week_start DATE',
+        'created_at DATETIME',
+        'updated_at DATETIME',
+    )
+    for definition in assignment_columns:
+        _add_column(conn, 'shift_assignments', definition)
+
+    conn.execute("UPDATE shift_assignments SET created_at = datetime('now') WHERE created_at IS NULL")
+    conn.execute("UPDATE shift_assignments SET status = 'scheduled' WHERE status IS NULL OR status = ''")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_user_date ON shift_assignments (assigned_user, shift_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_week ON shift_assignments (schedule_week_start)')
+
+
+def _staff_availability(conn: Any) -> None:
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS staff_availability ('
+        'id INTEGER PRIMARY KEY,'
+        'user_id INTEGER NOT NULL,'
+        'availability_date DATE NOT NULL,'
+        'is_available INTEGER NOT NULL DEFAULT 1,'
+        'notes TEXT,'
+        'updated_by INTEGER,'
+        'created_at DATETIME DEFAULT CURRENT_TIMESTAMP,'
+        'updated_at DATETIME,'
+        'FOREIGN KEY (user_id) REFERENCES users(id),'
+        'FOREIGN KEY (updated_by) REFERENCES users(id),'
+        'UNIQUE(user_id, availability_date)'
+        ')'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_staff_availability_week ON staff_availability (availability_date)')
+
+
+def _staff_notifications(conn: Any) -> None:
+    notifications_table_sql = (
+        "CREATE TABLE IF NOT EXISTS staff_notifications ("
+        "id INTEGER PRIMARY KEY,"
+        "user_id INTEGER NOT NULL,"
+        "assignment_id INTEGER,"
+        "title TEXT NOT NULL,"
+        "message TEXT NOT NULL,"
+        "shift_date DATE,"
+        "start_time TEXT,"
+        "end_time TEXT,"
+        "role TEXT,"
+        "status TEXT,"
+        "created_at DATETIME DEFAULT (datetime('now')),"
+        "acknowledged_at DATETIME,"
+        "FOREIGN KEY (user_id) REFERENCES users(id),"
+        "FOREIGN KEY (assignment_id) REFERENCES shift_assignments(id) ON DELETE CASCADE"
+        ")"
+    )
+    conn.execute(notifications_table_sql)
+
+    # Early databases created the table without the cascade; rebuild those.
+    cascade_ok = False
+    for fk in conn.execute('PRAGMA foreign_key_list(staff_notifications)').fetchall():
+        if fk[3] == 'assignment_id':
+            cascade_ok = str(fk[6] or '').upper() == 'CASCADE'
+            break
+    if not cascade_ok:
+        conn.execute('ALTER TABLE staff_notifications RENAME TO staff_notifications_legacy')
+        conn.execute(notifications_table_sql.replace('IF NOT EXISTS ', ''))
+        conn.execute(
+            'INSERT INTO staff_notifications ('
+            'id, user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at, acknowledged_at'
+            ') SELECT '
+            'id, user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at, acknowledged_at '
+            'FROM staff_notifications_legacy'
+        )
+        conn.execute('DROP TABLE staff_notifications_legacy')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_staff_notifications_user ON staff_notifications (user_id, acknowledged_at, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_staff_notifications_assignment ON staff_notifications (assignment_id)')
+
+
+def _app_meta(conn: Any) -> None:
+    conn.execute('CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+
+# Rows revoked before expiries were recorded are kept for the longest default
+# token lifetime (flask-jwt-extended refresh tokens: 30 days).
+LEGACY_REVOCATION_TTL = 30 * 24 * 3600
+
+
+def _revoked_token_expiry(conn: Any) -> None:
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(revoked_tokens)').fetchall()}
+    if 'expires_at' not in columns:
+        conn.execute('ALTER TABLE revoked_tokens RENAME TO revoked_tokens_legacy')
+        conn.execute(
+            'CREATE TABLE revoked_tokens ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            'jti TEXT NOT NULL UNIQUE,'
+            'token_type TEXT,'
+            'user_identity INTEGER,'
+            "revoked_at DATETIME DEFAULT (datetime('now')),"
+            'expires_at INTEGER'
+            ')'
+        )
+        conn.execute(
+            'INSERT INTO revoked_tokens (jti, token_type, user_identity, revoked_at, expires_at) '
+            "SELECT jti, token_type, user_identity, revoked_at, CAST(strftime('%s', COALESCE(revoked_at, 'now')) AS INTEGER) + ? "
+            'FROM revoked_tokens_legacy ORDER BY revoked_at',
+            (LEGACY_REVOCATION_TTL,),
+        )
+        conn.execute('DROP TABLE revoked_tokens_legacy')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens (expires_at)')
+
+
+def _stock_guard(conn: Any) -> None:
+    # Orders decrement qty_left in place; a shortfall aborts the whole transaction
+    # (including an rqlite batch, whose row counts only come back after commit).
+    conn.execute(
+        'CREATE TRIGGER IF NOT EXISTS menu_items_stock_guard BEFORE UPDATE OF qty_left ON menu_items '
+        "WHEN NEW.qty_left < 0 BEGIN SELECT RAISE(ABORT, 'insufficient stock'); END"
+    )
+
+
+ORDER_LINES_TABLE_SQL = (
+    'CREATE TABLE IF NOT EXISTS order_lines ('
+    'id INTEGER PRIMARY KEY,'
+    'order_id INTEGER NOT NULL,'
+    'item_id INTEGER,'
+    'qty INTEGER NOT NULL CHECK (qty > 0),'
+    'unit_price REAL NOT NULL DEFAULT 0,'
+    'discount REAL NOT NULL DEFAULT 0,'
+    'UNIQUE (order_id, item_id),'
+    'FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,'
+    'FOREIGN KEY (item_id) REFERENCES menu_items(id) ON DELETE SET NULL'
+    ')'
+)
+ORDER_ITEMS_VIEW_SQL = (
+    'CREATE VIEW IF NOT EXISTS order_items (order_id, items) AS '
+    "SELECT order_id, json_group_array(json_object('item_id', item_id, 'qty', qty)) "
+    'FROM (SELECT order_id, item_id, qty FROM order_lines ORDER BY order_id, id) GROUP BY order_id'
+)
+
+
+def _order_lines(conn: Any) -> None:
+    conn.execute(ORDER_LINES_TABLE_SQL)
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='order_items'").fetchone()
+    if legacy:
+        # Old lines carry no price, so they are priced at today's menu; orders placed
+        # from here on snapshot the price at the time of ordering. Lines for items
+        # no longer on the menu are kept with no item and a zero price.
+        conn.execute(
+            'INSERT OR IGNORE INTO order_lines (order_id, item_id, qty, unit_price, discount) '
+            "SELECT oi.order_id, m.id, SUM(CAST(json_extract(entry.value, '$.qty') AS INTEGER)), "
+            'COALESCE(m.price, 0), COALESCE(m.discount, 0) '
+            'FROM order_items oi JOIN orders o ON o.id = oi.order_id, json_each(oi.items) AS entry '
+            "LEFT JOIN menu_items m ON m.id = json_extract(entry.value, '$.item_id') "
+            "GROUP BY oi.order_id, CAST(json_extract(entry.value, '$.item_id') AS INTEGER) "
+            "HAVING SUM(CAST(json_extract(entry.value, '$.qty') AS INTEGER)) > 0 "
+            'ORDER BY oi.order_id, MIN(entry.id)'
+        )
+        conn.execute('DROP TABLE order_items')
+    # Readers of the old one-row-per-order JSON shape keep working through the view.
+    conn.execute(ORDER_ITEMS_VIEW_SQL)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_lines_item ON order_lines (item_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (order_timestamp)')
+
+
+def _order_history_index(conn: Any) -> None:
+    # Keyset pagination of a member's order history walks this index newest first.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_member_time ON orders (member_id, order_timestamp, id)')
+
+
+CART_RESERVATIONS_TABLE_SQL = (
+    'CREATE TABLE IF NOT EXISTS cart_reservations ('
+    'member_id INTEGER NOT NULL,'
+    'item_id INTEGER NOT NULL,'
+    'qty INTEGER NOT NULL CHECK (qty > 0),'
+    'reserved_until REAL NOT NULL,'
+    'PRIMARY KEY (member_id, item_id),'
+    'FOREIGN KEY (member_id) REFERENCES users(id) ON DELETE CASCADE,'
+    'FOREIGN KEY (item_id) REFERENCES menu_items(id) ON DELETE CASCADE'
+    ')'
+)
+
+
+def _cart_reservations(conn: Any) -> None:
+    conn.execute(CART_RESERVATIONS_TABLE_SQL)
+    # Each reservation sums the live holds on its item; the sweeper scans by expiry.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cart_reservations_item ON cart_reservations (item_id, reserved_until)')
+
+
+def _order_lines_keep_deleted_items(conn: Any) -> None:
+    # Lines snapshot their price, so deleting a menu item only unlinks its lines
+    # (ON DELETE SET NULL) instead of being refused. SQLite cannot alter a foreign
+    # key in place, so tables created by an earlier migration 9 are rebuilt.
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='order_lines'").fetchone()
+    if row is None or 'ON DELETE SET NULL' in row[0]:
+        return
+    # Drop the view first, or renaming the new table would rewrite it to the old one.
+    conn.execute('DROP VIEW IF EXISTS order_items')
+    conn.execute(ORDER_LINES_TABLE_SQL.replace('IF NOT EXISTS order_lines', 'order_lines_rebuilt'))
+    conn.execute(
+        'INSERT INTO order_lines_rebuilt (id, order_id, item_id, qty, unit_price, discount) '
+        'SELECT id, order_id, item_id, qty, unit_price, discount FROM order_lines'
+    )
+    conn.execute('DROP TABLE order_lines')
+    conn.execute('ALTER TABLE order_lines_rebuilt RENAME TO order_lines')
+    conn.execute(ORDER_ITEMS_VIEW_SQL)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_lines_item ON order_lines (item_id)')
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Any], None]]] = [
+    (1, 'initial_schema', _initial_schema),
+    (2, 'user_profile_columns', _user_profile_columns),
+    (3, 'schedule_columns', _schedule_columns),
+    (4, 'staff_availability', _staff_availability),
+    (5, 'staff_notifications', _staff_notifications),
+    (6, 'app_meta', _app_meta),
+    (7, 'revoked_token_expiry', _revoked_token_expiry),
+    (8, 'stock_guard', _stock_guard),
+    (9, 'order_lines', _order_lines),
+    (10, 'order_history_index', _order_history_index),
+    (11, 'cart_reservations', _cart_reservations),
+    (12, 'order_lines_keep_deleted_items', _order_lines_keep_deleted_items),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _applied_versions(conn: Any) -> Set[int]:
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY,'
+        'name TEXT NOT NULL,'
+        "applied_at DATETIME DEFAULT (datetime('now'))"
+        ')'
+    )
+    conn.commit()
+    return {int(row[0]) for row in conn.execute('SELECT version FROM schema_migrations').fetchall()}
+
+
+def _acquire_lock(conn: Any, owner: str, timeout: float) -> None:
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS schema_migration_lock ('
+        'id INTEGER PRIMARY KEY CHECK (id = 1),'
+        'owner TEXT NOT NULL,'
+        'acquired_at REAL NOT NULL'
+        ')'
+    )
+    conn.commit()
+    deadline = time.monotonic() + timeout
+    while True:
+        now = time.time()
+        # A holder that crashed mid-migration must not block deploys forever.
+        conn.execute('DELETE FROM schema_migration_lock WHERE acquired_at < ?', (now - LOCK_STALE_AFTER,))
+        conn.execute('INSERT OR IGNORE INTO schema_migration_lock (id, owner, acquired_at) VALUES (1, ?, ?)', (owner, now))
+        conn.commit()
+        row = conn.execute('SELECT owner FROM schema_migration_lock WHERE id = 1').fetchone()
+        if row is not None and row[0] == owner:
+            return
+        if time.monotonic() >= deadline:
+            raise MigrationLockTimeout(f'schema migration lock held by {row[0] if row else "unknown"}')
+        time.sleep(0.25)
+
+
+def _release_lock(conn: Any, owner: str) -> None:
+    conn.rollback()
+    conn.execute('DELETE FROM schema_migration_lock WHERE id = 1 AND owner = ?', (owner,))
+    conn.commit()
+
+
+@contextmanager
+def schema_lock(conn: Any, *, timeout: float = LOCK_WAIT_TIMEOUT) -> Iterator[None]:
+    """Hold the cross-process schema lock; also used to serialise seeding."""
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    _acquire_lock(conn, owner, timeout)
+    try:
+        yield
+    finally:
+        _release_lock(conn, owner)
+
+
+def get_meta(conn: Any, key: str) -> Optional[str]:
+    row = conn.execute('SELECT value FROM app_meta WHERE key = ?', (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def set_meta(conn: Any, key: str, value: str) -> None:
+    """Queue an app_meta upsert; the caller commits it with its own writes."""
+    conn.execute(
+        'INSERT INTO app_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+        (key, value),
+    )
+
+
+def migrate(conn: Any = None, *, lock_timeout: float = LOCK_WAIT_TIMEOUT) -> List[int]:
+    """Apply pending migrations and return the versions that were applied."""
+    if conn is None:
+        conn = get_db()
+    if {version for version, _, _ in MIGRATIONS} <= _applied_versions(conn):
+        return []
+
+    applied: List[int] = []
+    with schema_lock(conn, timeout=lock_timeout):
+        # Another process may have finished while we waited for the lock.
+        done = _applied_versions(conn)
+        for version, name, apply in MIGRATIONS:
+            if version in done:
+                continue
+            apply(conn)
+            conn.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+            applied.append(version)
+    return applied
+
+
+def ensure_migrated() -> None:
+    """Migrate the current database once per process; later calls are free."""
+    target = db_identity()
+    if target in _migrated:
+        return
+    with _migrated_lock:
+        if target in _migrated:
+            return
+        migrate()
+        _migrated.add(target)
+
+
+def main() -> None:
+    applied = migrate()
+    if applied:
+        print('Applied migrations:', ', '.join(str(version) for version in applied))
+    else:
+        print(f'Database already at version {LATEST_VERSION}')
+
+
+if __name__ == '__main__':
+    main()
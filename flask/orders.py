@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import base64
 import json
-from typing import Any, Callable, Dict, List, Optional
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from flask import Blueprint, jsonify, request, current_app
 
-from utils import get_db
+import cart
+from utils import get_db, query_batch, read_consistency, request_budget
 
 bp = Blueprint('orders', __name__)
 bp.strict_slashes = False
@@ -54,98 +58,152 @@ def _normalize_items(raw_items) -> List[Dict[str, int]]:
     return [{'item_id': iid, 'qty': aggregated[iid]} for iid in order]
 
 
-def _fetch_inventory_map(conn, item_ids: List[int]) -> Dict[int, Dict]:
+def _fetch_menu_names(conn, item_ids: List[int]) -> Dict[int, str]:
+    """Names of the menu items that exist. Stock is not read here: the guarded
+    decrement in ``_adjust_stock`` checks it inside the write transaction."""
     if not item_ids:
         return {}
     placeholders = ','.join('?' for _ in item_ids)
     cur = conn.cursor()
-    cur.execute(
-        f'SELECT id, name, price, description, img_link, qty_left FROM menu_items WHERE id IN ({placeholders})',
-        item_ids,
-    )
-    rows = cur.fetchall()
-    return {row['id']: dict(row) for row in rows}
+    cur.execute(f'SELECT id, name FROM menu_items WHERE id IN ({placeholders})', item_ids)
+    return {row['id']: row['name'] for row in cur.fetchall()}
 
 
-def _load_order_items(conn, order_id: int) -> List[Dict[str, int]]:
+def _adjust_stock(cur, item_id: int, qty: int) -> None:
+    """Queue a set-based stock change: positive ``qty`` reserves, negative releases.
+
+    Items without tracked stock (``qty_left`` NULL) are left alone. A reservation
+    larger than the stock left trips the ``menu_items_stock_guard`` trigger, which
+    aborts the whole transaction, so every line of an order applies or none do.
+    """
+    cur.execute('UPDATE menu_items SET qty_left = qty_left - ? WHERE id=? AND qty_left IS NOT NULL', (qty, item_id))
+
+
+def _is_stock_shortfall(exc: Exception) -> bool:
+    return 'insufficient stock' in str(exc).lower()
+
+
+def _shortfall_response(conn, items: List[Dict[str, int]]):
+    """409 naming the items that are short; only read after a rejected write."""
+    placeholders = ','.join('?' for _ in items)
     cur = conn.cursor()
-    cur.execute('SELECT items FROM order_items WHERE order_id=?', (order_id,))
-    row = cur.fetchone()
-    if not row or not row['items']:
-        return []
-    try:
-        raw_items = json.loads(row['items'])
-    except (TypeError, json.JSONDecodeError):  # pragma: no cover - defensive
-        return []
+    with read_consistency(conn, 'strong'):
+        cur.execute(f'SELECT id, name, qty_left FROM menu_items WHERE id IN ({placeholders})', [item['item_id'] for item in items])
+        stock = {row['id']: row for row in cur.fetchall()}
+    short = [
+        stock[item['item_id']]['name'] for item in items
+        if item['item_id'] in stock
+        and stock[item['item_id']]['qty_left'] is not None
+        and stock[item['item_id']]['qty_left'] < item['qty']
+    ]
+    return jsonify({'msg': f"Not enough stock for {', '.join(short) or 'the requested items'}"}), 409
 
-    normalized: List[Dict[str, int]] = []
-    for entry in raw_items:
-        if not isinstance(entry, dict):
-            continue
-        item_id_raw = entry.get('item_id')
-        qty_raw = entry.get('qty', 0)
-        if item_id_raw is None or qty_raw is None:
-            continue
-        try:
-            item_id = int(item_id_raw)
-            qty = int(qty_raw)
-        except (TypeError, ValueError):
-            continue
-        if item_id <= 0 or qty <= 0:
-            continue
-        normalized.append({'item_id': item_id, 'qty': qty})
-    return normalized
 
+# Adding to an order snapshots the item's current price and discount; a line
+# that already exists keeps its original snapshot and only changes quantity.
+_ADD_LINE_SQL = (
+    'INSERT INTO order_lines (order_id, item_id, qty, unit_price, discount) '
+    'SELECT ?, id, ?, COALESCE(price, 0), COALESCE(discount, 0) FROM menu_items WHERE id=? '
+    'ON CONFLICT(order_id, item_id) DO UPDATE SET qty = qty + excluded.qty'
+)
+_SET_LINE_SQL = _ADD_LINE_SQL.replace('qty + excluded.qty', 'excluded.qty')
 
-def _merge_items(existing: List[Dict[str, int]], additions: List[Dict[str, int]]) -> List[Dict[str, int]]:
-    aggregated: Dict[int, int] = {}
-    order: List[int] = []
-    for entry in existing + additions:
-        item_id = entry['item_id']
-        qty = entry['qty']
-        if item_id not in aggregated:
-            aggregated[item_id] = qty
-            order.append(item_id)
-        else:
-            aggregated[item_id] += qty
-    return [{'item_id': iid, 'qty': aggregated[iid]} for iid in order]
+
+_LINE_COLUMNS = 'l.order_id, l.item_id, l.qty, l.unit_price, m.name, m.description, m.img_link, m.qty_left'
+
+
+def _line_payload(row) -> Dict:
+    return {
+        'item_id': row['item_id'],
+        'name': row['name'],
+        'price': row['unit_price'],
+        'description': row['description'],
+        'img_link': row['img_link'],
+        'qty': row['qty'],
+        'qty_left': row['qty_left'],
+    }
 
 
 def _build_order_response(conn, order_id: int, *, order_closed: bool = False) -> Dict:
-    items = _load_order_items(conn, order_id)
-    inventory = _fetch_inventory_map(conn, [item['item_id'] for item in items])
-    detailed = []
-    for item in items:
-        info = inventory.get(item['item_id'])
-        if not info:
-            continue
-        detailed.append({
-            'item_id': info['id'],
-            'name': info.get('name'),
-            'price': info.get('price'),
-            'description': info.get('description'),
-            'img_link': info.get('img_link'),
-            'qty': item['qty'],
-            'qty_left': info.get('qty_left'),
-        })
-    cur = conn.cursor()
-    cur.execute('SELECT order_timestamp FROM orders WHERE id=?', (order_id,))
-    ts_row = cur.fetchone()
-    order_ts = ts_row['order_timestamp'] if ts_row else None
+    with read_consistency(conn, 'strong'):
+        line_rows, ts_rows = query_batch(conn, [
+            (
+                f'SELECT {_LINE_COLUMNS} FROM order_lines l LEFT JOIN menu_items m ON m.id = l.item_id '
+                'WHERE l.order_id=? ORDER BY l.id',
+                (order_id,),
+            ),
+            ('SELECT order_timestamp FROM orders WHERE id=?', (order_id,)),
+        ])
+    order_ts = ts_rows[0]['order_timestamp'] if ts_rows else None
     return {
         'order_id': order_id,
-        'items': detailed,
+        'items': [_line_payload(row) for row in line_rows],
         'order_timestamp': order_ts,
         'order_closed': order_closed,
     }
 
 
-def _write_order_items(conn, order_id: int, items: List[Dict[str, int]]) -> None:
-    cur = conn.cursor()
-    if items:
-        cur.execute('INSERT OR REPLACE INTO order_items (order_id, items) VALUES (?, ?)', (order_id, json.dumps(items)))
-    else:
-        cur.execute('DELETE FROM order_items WHERE order_id=?', (order_id,))
+def _encode_cursor(order_timestamp: Any, order_id: int) -> str:
+    raw = json.dumps([order_timestamp, order_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token: str) -> Tuple[str, int]:
+    try:
+        order_timestamp, order_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return str(order_timestamp), int(order_id)
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor') from None
+
+
+MAX_BATCH_ORDERS = 200
+# Attempts at a batch whose stock changed between the read and the write.
+BATCH_STOCK_RETRIES = 3
+
+
+def _parse_order_timestamp(raw: Any) -> Optional[str]:
+    """Normalise an ISO-8601 time to the ``datetime('now')`` format (UTC); None means now.
+
+    A trailing ``Z`` or offset is converted to UTC; a naive time is taken as UTC already.
+    """
+    if raw in (None, ''):
+        return None
+    text = str(raw)
+    if text[-1:] in ('Z', 'z'):
+        # fromisoformat only accepts a "Z" suffix from Python 3.11.
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError('order_timestamp must be an ISO-8601 date and time') from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _allocate_batch(orders: List[Dict], stock: Dict[int, Any]) -> List[Dict]:
+    """Accept orders in input order while the stock read up front covers them.
+
+    Rejected orders get a ``msg``; the accepted ones are returned.
+    """
+    remaining = {item_id: row['qty_left'] for item_id, row in stock.items()}
+    accepted = []
+    for order in orders:
+        missing = [str(item['item_id']) for item in order['items'] if item['item_id'] not in stock]
+        short = [
+            stock[item['item_id']]['name'] for item in order['items']
+            if not missing and remaining[item['item_id']] is not None and remaining[item['item_id']] < item['qty']
+        ]
+        if missing:
+            order['result'].update(status='rejected', msg=f"Menu item(s) not found: {', '.join(missing)}")
+        elif short:
+            order['result'].update(status='rejected', msg=f"Not enough stock for {', '.join(short)}")
+        else:
+            for item in order['items']:
+                if remaining[item['item_id']] is not None:
+                    remaining[item['item_id']] -= item['qty']
+            accepted.append(order)
+    return accepted
 
 
 def _ensure_jwt():
@@ -179,36 +237,32 @@ def create_order():
         conn = get_db()
         cur = conn.cursor()
 
-        inventory = _fetch_inventory_map(conn, [item['item_id'] for item in items])
-        missing = [str(item['item_id']) for item in items if item['item_id'] not in inventory]
+        names = _fetch_menu_names(conn, [item['item_id'] for item in items])
+        missing = [str(item['item_id']) for item in items if item['item_id'] not in names]
         if missing:
             return jsonify({'msg': f"Menu item(s) not found: {', '.join(missing)}"}), 404
 
-        for item in items:
-            stock = inventory[item['item_id']].get('qty_left')
-            if stock is not None:
-                try:
-                    available = int(stock)
-                except (TypeError, ValueError):
-                    available = 0
-                if available < item['qty']:
-                    return jsonify({'msg': f"Not enough stock for {inventory[item['item_id']]['name']}"}), 409
-
         try:
-            cur.execute('INSERT INTO orders (member_id, order_timestamp) VALUES (?, datetime("now"))', (user_id_int,))
-            order_id = cur.lastrowid or 0
-            if not order_id:
-                raise ValueError('Failed to determine order id')
-            cur.execute('INSERT OR REPLACE INTO order_items (order_id, items) VALUES (?, ?)', (order_id, json.dumps(items)))
-
+            # The lines find the new order by subquery rather than by its id so every
+            # statement can be sent to the database as a single transactional batch.
+            # Writes are serialized, so the member's newest order is the one just
+            # inserted (last_insert_rowid() would move on after the first line).
+            order_cur = conn.cursor()
+            order_cur.execute('INSERT INTO orders (member_id, order_timestamp) VALUES (?, datetime("now"))', (user_id_int,))
+            cur.executemany(
+                _ADD_LINE_SQL.replace('SELECT ?, id', 'SELECT (SELECT MAX(id) FROM orders WHERE member_id=?), id'),
+                [(user_id_int, item['qty'], item['item_id']) for item in items],
+            )
             for item in items:
-                stock = inventory[item['item_id']].get('qty_left')
-                if stock is not None:
-                    new_stock = max(0, int(stock) - item['qty'])
-                    cur.execute('UPDATE menu_items SET qty_left=? WHERE id=?', (new_stock, item['item_id']))
+                _adjust_stock(cur, item['item_id'], item['qty'])
             conn.commit()
-        except Exception as exc:  # pragma: no cover - failure path
+            order_id = order_cur.lastrowid or 0
+            if not order_id:
+                raise ValueError('Failed to determine order id')
+        except Exception as exc:
             conn.rollback()
+            if _is_stock_shortfall(exc):
+                return _shortfall_response(conn, items)
             current_app.logger.exception('Failed to create order: %s', exc)
             return jsonify({'msg': 'Failed to create order'}), 500
 
@@ -218,6 +272,114 @@ def create_order():
     return inner()
 
 
+@bp.route('/batch', methods=['POST'])
+@request_budget(60)
+def create_orders_batch():
+    """Create many orders at once, e.g. a POS terminal replaying its offline queue.
+
+    Expects ``orders: [{items, order_timestamp?, ref?}]``. Stock is read once
+    for the whole batch and orders are accepted in input order while it lasts;
+    the accepted ones and their stock changes commit in one transaction. The
+    response reports every order as created (with its id) or rejected, in
+    input order, echoing ``ref`` so the terminal can match them up.
+    """
+    jwt_required_fn = jwt_required
+    get_identity_fn = get_jwt_identity
+    if not jwt_required_fn or not get_identity_fn:
+        return jsonify({'msg': 'JWT extension not available'}), 501
+
+    @jwt_required_fn()
+    def inner():
+        payload = request.get_json(silent=True) or {}
+        raw_orders = payload.get('orders')
+        if not isinstance(raw_orders, list) or not raw_orders:
+            return jsonify({'msg': 'orders array required'}), 400
+        if len(raw_orders) > MAX_BATCH_ORDERS:
+            return jsonify({'msg': f'at most {MAX_BATCH_ORDERS} orders per batch'}), 413
+
+        user_id = get_identity_fn()
+        try:
+            user_id_int = int(user_id)
+        except (TypeError, ValueError):
+            user_id_int = user_id
+
+        results = []
+        orders = []
+        for index, entry in enumerate(raw_orders, start=1):
+            result = {'order': index}
+            results.append(result)
+            if not isinstance(entry, dict):
+                result.update(status='rejected', msg='each order must be an object with items')
+                continue
+            if entry.get('ref') is not None:
+                result['ref'] = entry['ref']
+            try:
+                items = _normalize_items(entry.get('items'))
+                order_ts = _parse_order_timestamp(entry.get('order_timestamp'))
+            except ValueError as exc:
+                result.update(status='rejected', msg=str(exc))
+                continue
+            orders.append({'result': result, 'items': items, 'order_timestamp': order_ts})
+
+        conn = get_db()
+        item_ids = sorted({item['item_id'] for order in orders for item in order['items']})
+        accepted: List[Dict] = []
+        for attempt in range(BATCH_STOCK_RETRIES):
+            stock: Dict[int, Any] = {}
+            if item_ids:
+                with read_consistency(conn, 'strong'):
+                    cur = conn.cursor()
+                    cur.execute(f"SELECT id, name, qty_left FROM menu_items WHERE id IN ({','.join('?' * len(item_ids))})", item_ids)
+                    stock = {row['id']: row for row in cur.fetchall()}
+            accepted = _allocate_batch(orders, stock)
+            if not accepted:
+                break
+
+            totals: Dict[int, int] = {}
+            for order in accepted:
+                for item in order['items']:
+                    totals[item['item_id']] = totals.get(item['item_id'], 0) + item['qty']
+            try:
+                cur = conn.cursor()
+                order_curs = []
+                for order in accepted:
+                    order_cur = conn.cursor()
+                    order_cur.execute(
+                        'INSERT INTO orders (member_id, order_timestamp) VALUES (?, COALESCE(?, datetime("now")))',
+                        (user_id_int, order['order_timestamp']),
+                    )
+                    order_curs.append(order_cur)
+                    # Same as create_order: the member's newest order is the one just inserted.
+                    cur.executemany(
+                        _ADD_LINE_SQL.replace('SELECT ?, id', 'SELECT (SELECT MAX(id) FROM orders WHERE member_id=?), id'),
+                        [(user_id_int, item['qty'], item['item_id']) for item in order['items']],
+                    )
+                for item_id, qty in totals.items():
+                    _adjust_stock(cur, item_id, qty)
+                conn.commit()
+            except Exception as exc:
+                conn.rollback()
+                if _is_stock_shortfall(exc) and attempt + 1 < BATCH_STOCK_RETRIES:
+                    # Another order took stock after the read; re-read and allocate again.
+                    for order in orders:
+                        order['result'].pop('msg', None)
+                        order['result'].pop('status', None)
+                    continue
+                if _is_stock_shortfall(exc):
+                    return jsonify({'msg': 'Stock kept changing during the batch; retry it'}), 409
+                current_app.logger.exception('Failed to create order batch: %s', exc)
+                return jsonify({'msg': 'Failed to create orders'}), 500
+
+            for order, order_cur in zip(accepted, order_curs):
+                order['result'].update(status='created', order_id=order_cur.lastrowid)
+            break
+
+        counts = {status: sum(1 for result in results if result['status'] == status) for status in ('created', 'rejected')}
+        return jsonify({**counts, 'results': results}), 200
+
+    return inner()
+
+
 @bp.route('/', methods=['GET'])
 @bp.route('', methods=['GET'])
 def list_orders():
@@ -242,23 +404,46 @@ def list_orders():
             requested_limit = 20
         limit = min(requested_limit, 50)
 
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute(
-            'SELECT id FROM orders WHERE member_id=? ORDER BY order_timestamp DESC, id DESC LIMIT ?',
-            (user_id_int, limit),
-        )
-        rows = cur.fetchall() or []
-
-        orders = []
-        for row in rows:
-            order_id = row['id']
-            order_data = _build_order_response(conn, order_id)
-            if order_data.get('order_closed'):
-                order_data.setdefault('status', 'submitted')
-            orders.append(order_data)
+        # Keyset pagination over (order_timestamp, id), newest first, served by
+        # idx_orders_member_time; pass next_cursor back as ?cursor= for the next page.
+        page_sql = 'SELECT id, order_timestamp FROM orders WHERE member_id=?'
+        page_params: List[Any] = [user_id_int]
+        if request.args.get('cursor'):
+            try:
+                page_params.extend(_decode_cursor(request.args['cursor']))
+            except ValueError as exc:
+                return jsonify({'msg': str(exc)}), 400
+            page_sql += ' AND (order_timestamp, id) < (?, ?)'
+        page_sql += ' ORDER BY order_timestamp DESC, id DESC LIMIT ?'
 
-        return jsonify({'orders': orders, 'count': len(orders)})
+        # The page and all of its lines come back in one round trip, however many orders it holds.
+        conn = get_db()
+        with read_consistency(conn, 'strong'):
+            order_rows, line_rows = query_batch(conn, [
+                (page_sql, page_params + [limit + 1]),
+                (
+                    f'SELECT {_LINE_COLUMNS} FROM order_lines l LEFT JOIN menu_items m ON m.id = l.item_id '
+                    f'WHERE l.order_id IN (SELECT id FROM ({page_sql})) ORDER BY l.order_id, l.id',
+                    page_params + [limit],
+                ),
+            ])
+
+        lines: Dict[int, List[Dict]] = {}
+        for row in line_rows:
+            lines.setdefault(row['order_id'], []).append(_line_payload(row))
+
+        page = order_rows[:limit]
+        orders = [
+            {
+                'order_id': row['id'],
+                'items': lines.get(row['id'], []),
+                'order_timestamp': row['order_timestamp'],
+                'order_closed': False,
+            }
+            for row in page
+        ]
+        next_cursor = _encode_cursor(page[-1]['order_timestamp'], page[-1]['id']) if len(order_rows) > limit else None
+        return jsonify({'orders': orders, 'count': len(orders), 'next_cursor': next_cursor})
 
     return inner()
 
@@ -287,42 +472,32 @@ def add_items(order_id: int):
         conn = get_db()
         cur = conn.cursor()
 
-        cur.execute('SELECT member_id FROM orders WHERE id=?', (order_id,))
-        owner_row = cur.fetchone()
-        if not owner_row:
+        item_ids = [item['item_id'] for item in additions]
+        # Ownership and the menu lookup share one round trip on rqlite.
+        owner_rows, menu_rows = query_batch(conn, [
+            ('SELECT member_id FROM orders WHERE id=?', (order_id,)),
+            (f"SELECT id FROM menu_items WHERE id IN ({','.join('?' for _ in item_ids)})", item_ids),
+        ])
+        if not owner_rows:
             return jsonify({'msg': 'Order not found'}), 404
-        if owner_row['member_id'] != user_id_int:
+        if owner_rows[0]['member_id'] != user_id_int:
             return jsonify({'msg': 'Forbidden'}), 403
 
-        existing = _load_order_items(conn, order_id)
-        merged = _merge_items(existing, additions)
-
-        inventory = _fetch_inventory_map(conn, [item['item_id'] for item in additions])
-        missing = [str(item['item_id']) for item in additions if item['item_id'] not in inventory]
+        known = {row['id'] for row in menu_rows}
+        missing = [str(item_id) for item_id in item_ids if item_id not in known]
         if missing:
             return jsonify({'msg': f"Menu item(s) not found: {', '.join(missing)}"}), 404
 
-        for item in additions:
-            stock = inventory[item['item_id']].get('qty_left')
-            if stock is not None:
-                try:
-                    available = int(stock)
-                except (TypeError, ValueError):
-                    available = 0
-                if available < item['qty']:
-                    return jsonify({'msg': f"Not enough stock for {inventory[item['item_id']]['name']}"}), 409
-
         try:
             cur.execute('UPDATE orders SET order_timestamp=datetime("now") WHERE id=?', (order_id,))
-            _write_order_items(conn, order_id, merged)
+            cur.executemany(_ADD_LINE_SQL, [(order_id, item['qty'], item['item_id']) for item in additions])
             for item in additions:
-                stock = inventory[item['item_id']].get('qty_left')
-                if stock is not None:
-                    new_stock = max(0, int(stock) - item['qty'])
-                    cur.execute('UPDATE menu_items SET qty_left=? WHERE id=?', (new_stock, item['item_id']))
+                _adjust_stock(cur, item['item_id'], item['qty'])
             conn.commit()
-        except Exception as exc:  # pragma: no cover - failure path
+        except Exception as exc:
             conn.rollback()
+            if _is_stock_shortfall(exc):
+                return _shortfall_response(conn, additions)
             current_app.logger.exception('Failed to update order %s: %s', order_id, exc)
             return jsonify({'msg': 'Failed to update order'}), 500
 
@@ -366,19 +541,18 @@ def update_item(order_id: int, item_id: int):
         conn = get_db()
         cur = conn.cursor()
 
-        cur.execute('SELECT member_id FROM orders WHERE id=?', (order_id,))
-        owner_row = cur.fetchone()
-        if not owner_row:
+        owner_rows, line_rows, menu_rows = query_batch(conn, [
+            ('SELECT member_id FROM orders WHERE id=?', (order_id,)),
+            ('SELECT item_id, qty FROM order_lines WHERE order_id=?', (order_id,)),
+            ('SELECT id FROM menu_items WHERE id=?', (item_id,)),
+        ])
+        if not owner_rows:
             return jsonify({'msg': 'Order not found'}), 404
-        if owner_row['member_id'] != user_id_int:
+        if owner_rows[0]['member_id'] != user_id_int:
             return jsonify({'msg': 'Forbidden'}), 403
 
-        existing = _load_order_items(conn, order_id)
-        current_qty = 0
-        for entry in existing:
-            if entry['item_id'] == item_id:
-                current_qty = entry['qty']
-                break
+        current_qty = next((row['qty'] for row in line_rows if row['item_id'] == item_id), 0)
+        other_lines = sum(1 for row in line_rows if row['item_id'] != item_id)
 
         if operation == 'decrement' and current_qty == 0:
             return jsonify({'msg': 'Item is not in the order'}), 409
@@ -403,55 +577,30 @@ def update_item(order_id: int, item_id: int):
             response = _build_order_response(conn, order_id)
             return jsonify(response), 200
 
-        inventory = _fetch_inventory_map(conn, [item_id])
-        info = inventory.get(item_id)
-        if not info:
+        if not menu_rows:
             return jsonify({'msg': 'Menu item not found'}), 404
 
-        stock_val = info.get('qty_left')
-        if delta > 0 and stock_val is not None:
-            try:
-                available = int(stock_val)
-            except (TypeError, ValueError):
-                available = 0
-            if available < delta:
-                return jsonify({'msg': f"Not enough stock for {info.get('name')}"}), 409
-
         try:
-            updated_items: List[Dict[str, int]] = []
-            replaced = False
-            for entry in existing:
-                if entry['item_id'] == item_id:
-                    if new_qty > 0:
-                        updated_items.append({'item_id': item_id, 'qty': new_qty})
-                        replaced = True
-                else:
-                    updated_items.append(entry)
-            if not replaced and new_qty > 0:
-                updated_items.append({'item_id': item_id, 'qty': new_qty})
-
-            if stock_val is not None:
-                try:
-                    current_stock = int(stock_val)
-                except (TypeError, ValueError):
-                    current_stock = 0
-                new_stock = current_stock - delta
-                cur.execute('UPDATE menu_items SET qty_left=? WHERE id=?', (new_stock, item_id))
-
-            if updated_items:
-                _write_order_items(conn, order_id, updated_items)
+            _adjust_stock(cur, item_id, delta)
+            if new_qty > 0:
+                cur.execute(_SET_LINE_SQL, (order_id, new_qty, item_id))
+            else:
+                cur.execute('DELETE FROM order_lines WHERE order_id=? AND item_id=?', (order_id, item_id))
+
+            if new_qty > 0 or other_lines:
                 cur.execute('UPDATE orders SET order_timestamp=datetime("now") WHERE id=?', (order_id,))
                 conn.commit()
                 response = _build_order_response(conn, order_id)
                 return jsonify(response), 200
 
-            _write_order_items(conn, order_id, [])
             cur.execute('DELETE FROM orders WHERE id=?', (order_id,))
             conn.commit()
             response = _build_order_response(conn, order_id, order_closed=True)
             return jsonify(response), 200
-        except Exception as exc:  # pragma: no cover - failure path
+        except Exception as exc:
             conn.rollback()
+            if _is_stock_shortfall(exc):
+                return _shortfall_response(conn, [{'item_id': item_id, 'qty': delta}])
             current_app.logger.exception('Failed to update order item %s on order %s: %s', item_id, order_id, exc)
             return jsonify({'msg': 'Failed to update order item'}), 500
 
@@ -475,15 +624,16 @@ def submit_order(order_id: int):
 
         conn = get_db()
         cur = conn.cursor()
-        cur.execute('SELECT member_id FROM orders WHERE id=?', (order_id,))
-        row = cur.fetchone()
-        if not row:
+        owner_rows, line_rows = query_batch(conn, [
+            ('SELECT member_id FROM orders WHERE id=?', (order_id,)),
+            ('SELECT 1 FROM order_lines WHERE order_id=? LIMIT 1', (order_id,)),
+        ])
+        if not owner_rows:
             return jsonify({'msg': 'Order not found'}), 404
-        if row['member_id'] != user_id_int:
+        if owner_rows[0]['member_id'] != user_id_int:
             return jsonify({'msg': 'Forbidden'}), 403
 
-        items = _load_order_items(conn, order_id)
-        if not items:
+        if not line_rows:
             return jsonify({'msg': 'Cannot submit an empty order'}), 400
 
         try:
@@ -530,3 +680,197 @@ def get_order(order_id: int):
         return jsonify(response), 200
 
     return inner(order_id)
+
+
+def _cart_response(conn, member_id) -> Dict:
+    with read_consistency(conn, 'strong'):
+        lines = cart.load_cart(conn, member_id)
+    now = time.time()
+    return {
+        'items': [
+            {
+                'item_id': row['item_id'],
+                'name': row['name'],
+                'price': row['price'],
+                'description': row['description'],
+                'img_link': row['img_link'],
+                'qty': row['qty'],
+                'qty_left': row['qty_left'],
+                'reserved': row['reserved_until'] > now,
+            }
+            for row in lines
+        ],
+        'reserved_until': max((row['reserved_until'] for row in lines), default=None),
+    }
+
+
+@bp.route('/cart', methods=['GET'])
+def get_cart():
+    jwt_required_fn = jwt_required
+    get_identity_fn = get_jwt_identity
+    if not jwt_required_fn or not get_identity_fn:
+        return jsonify({'msg': 'JWT extension not available'}), 501
+
+    @jwt_required_fn()
+    def inner():
+        user_id = get_identity_fn()
+        try:
+            user_id_int = int(user_id)
+        except (TypeError, ValueError):
+            user_id_int = user_id
+
+        cart.maybe_sweep()
+        return jsonify(_cart_response(get_db(), user_id_int)), 200
+
+    return inner()
+
+
+@bp.route('/cart/items/<int:item_id>', methods=['PATCH'])
+def update_cart_item(item_id: int):
+    """Change one cart line. Only ``cart_reservations`` is written; stock is held, not taken."""
+    jwt_required_fn = jwt_required
+    get_identity_fn = get_jwt_identity
+    if not jwt_required_fn or not get_identity_fn:
+        return jsonify({'msg': 'JWT extension not available'}), 501
+
+    @jwt_required_fn()
+    def inner(item_id: int):
+        payload = request.get_json(silent=True) or {}
+        operation = (payload.get('operation') or 'set').lower()
+        if operation not in {'set', 'increment', 'decrement'}:
+            return jsonify({'msg': 'operation must be one of set, increment, decrement'}), 400
+
+        try:
+            step = int(payload.get('qty', 1))
+        except (TypeError, ValueError):
+            return jsonify({'msg': 'qty must be an integer'}), 400
+
+        if operation in {'increment', 'decrement'} and step <= 0:
+            step = 1
+        if operation == 'set' and step < 0:
+            return jsonify({'msg': 'qty must be zero or positive for set operation'}), 400
+
+        user_id = get_identity_fn()
+        try:
+            user_id_int = int(user_id)
+        except (TypeError, ValueError):
+            user_id_int = user_id
+
+        cart.maybe_sweep()
+        conn = get_db()
+        line_rows, menu_rows = query_batch(conn, [
+            ('SELECT qty FROM cart_reservations WHERE member_id=? AND item_id=?', (user_id_int, item_id)),
+            ('SELECT name FROM menu_items WHERE id=?', (item_id,)),
+        ])
+        if not menu_rows:
+            return jsonify({'msg': 'Menu item not found'}), 404
+
+        current_qty = line_rows[0]['qty'] if line_rows else 0
+        if operation == 'decrement' and current_qty == 0:
+            return jsonify({'msg': 'Item is not in the cart'}), 409
+
+        if operation == 'increment':
+            new_qty = current_qty + step
+        elif operation == 'decrement':
+            new_qty = max(current_qty - step, 0)
+        else:  # set
+            new_qty = step
+
+        if not cart.reserve(conn, user_id_int, item_id, new_qty):
+            return jsonify({'msg': f"Not enough stock for {menu_rows[0]['name']}"}), 409
+        return jsonify(_cart_response(conn, user_id_int)), 200
+
+    return inner(item_id)
+
+
+@bp.route('/cart', methods=['DELETE'])
+def clear_cart():
+    jwt_required_fn = jwt_required
+    get_identity_fn = get_jwt_identity
+    if not jwt_required_fn or not get_identity_fn:
+        return jsonify({'msg': 'JWT extension not available'}), 501
+
+    @jwt_required_fn()
+    def inner():
+        user_id = get_identity_fn()
+        try:
+            user_id_int = int(user_id)
+        except (TypeError, ValueError):
+            user_id_int = user_id
+
+        cart.clear(get_db(), user_id_int)
+        return jsonify({'items': [], 'reserved_until': None}), 200
+
+    return inner()
+
+
+@bp.route('/cart/submit', methods=['POST'])
+def submit_cart():
+    """Turn the cart into an order: lines, stock and cart cleanup in one transaction."""
+    jwt_required_fn = jwt_required
+    get_identity_fn = get_jwt_identity
+    if not jwt_required_fn or not get_identity_fn:
+        return jsonify({'msg': 'JWT extension not available'}), 501
+
+    @jwt_required_fn()
+    def inner():
+        user_id = get_identity_fn()
+        try:
+            user_id_int = int(user_id)
+        except (TypeError, ValueError):
+            user_id_int = user_id
+
+        conn = get_db()
+        with read_consistency(conn, 'strong'):
+            lines = cart.load_cart(conn, user_id_int)
+        if not lines:
+            return jsonify({'msg': 'Cannot submit an empty cart'}), 400
+
+        # A lapsed hold may have been taken by another cart since; hold it again first.
+        lost = set(cart.renew_lapsed(conn, user_id_int, lines))
+        if lost:
+            names = ', '.join(row['name'] for row in lines if row['item_id'] in lost)
+            return jsonify({'msg': f'Not enough stock for {names}'}), 409
+
+        items = [{'item_id': row['item_id'], 'qty': row['qty']} for row in lines]
+        try:
+            # Everything reads the cart rows inside the transaction, so a change made
+            # from another tab in the meantime is submitted whole or not at all.
+            order_cur = conn.cursor()
+            order_cur.execute(
+                "INSERT INTO orders (member_id, order_timestamp) SELECT ?, datetime('now') "
+                'WHERE EXISTS (SELECT 1 FROM cart_reservations WHERE member_id=?)',
+                (user_id_int, user_id_int),
+            )
+            cur = conn.cursor()
+            cur.execute(
+                'INSERT INTO order_lines (order_id, item_id, qty, unit_price, discount) '
+                'SELECT (SELECT MAX(id) FROM orders WHERE member_id=?), m.id, r.qty, COALESCE(m.price, 0), COALESCE(m.discount, 0) '
+                'FROM cart_reservations r JOIN menu_items m ON m.id = r.item_id WHERE r.member_id=? ORDER BY r.rowid',
+                (user_id_int, user_id_int),
+            )
+            # The held stock is taken in one statement; the stock guard still aborts on a shortfall.
+            cur.execute(
+                'UPDATE menu_items SET qty_left = qty_left - ('
+                'SELECT r.qty FROM cart_reservations r WHERE r.member_id=? AND r.item_id=menu_items.id) '
+                'WHERE qty_left IS NOT NULL AND id IN (SELECT item_id FROM cart_reservations WHERE member_id=?)',
+                (user_id_int, user_id_int),
+            )
+            cur.execute('DELETE FROM cart_reservations WHERE member_id=?', (user_id_int,))
+            conn.commit()
+            order_id = order_cur.lastrowid if order_cur.rowcount else 0
+        except Exception as exc:
+            conn.rollback()
+            if _is_stock_shortfall(exc):
+                return _shortfall_response(conn, items)
+            current_app.logger.exception('Failed to submit cart: %s', exc)
+            return jsonify({'msg': 'Failed to submit cart'}), 500
+
+        if not order_id:
+            return jsonify({'msg': 'Cannot submit an empty cart'}), 400
+        response = _build_order_response(conn, order_id, order_closed=True)
+        response['status'] = 'submitted'
+        response['msg'] = 'Order submitted successfully'
+        return jsonify(response), 201
+
+    return inner()
@@ -0,0 +1,137 @@
+"""
+password_pool.py
+
+Runs password hashing in a small process pool so a burst of logins cannot tie
+up every request thread (and the GIL) with bcrypt or PBKDF2 work.
+
+At most ``PASSWORD_HASH_QUEUE`` jobs per process are queued or running; a
+request that cannot get a slot within ``PASSWORD_HASH_WAIT`` seconds gets
+``HashingBusy``, which the app turns into a 429. Waiting on a job counts
+against the request's time budget. ``PASSWORD_HASH_WORKERS=0`` hashes on the
+request thread instead (still bounded by the queue limit).
+
+The pool is per process and started on first use or during warmup; gunicorn's
+pre_fork hook shuts down the master's so each worker starts its own.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from flask import current_app
+
+import utils
+from utils import DeadlineExceeded, HashingBusy, remaining_request_budget
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_settings: Optional[Tuple[int, int, float]] = None
+
+
+def _setting(key: str, default: str, cast: Callable[[str], Any]) -> Any:
+    config = {}
+    try:
+        config = current_app.config
+    except RuntimeError:
+        pass  # outside an app context (scripts), use the environment
+    return cast(config.get(key, os.environ.get(key, default)))
+
+
+def _resolve_settings() -> Tuple[int, int, float]:
+    workers = max(_setting('PASSWORD_HASH_WORKERS', '1', int), 0)
+    queue = max(_setting('PASSWORD_HASH_QUEUE', '4', int), 1)
+    wait = max(_setting('PASSWORD_HASH_WAIT', '0.5', float), 0.0)
+    return workers, queue, wait
+
+
+def start() -> None:
+    """Create this process's pool if it does not exist yet."""
+    global _executor, _slots, _settings
+    with _lock:
+        if _settings is not None:
+            return
+        _settings = _resolve_settings()
+        workers, queue, _ = _settings
+        _slots = threading.BoundedSemaphore(queue)
+        if workers:
+            # spawn, not fork: request threads may hold locks at the time.
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def warm() -> None:
+    """Start the pool and wait for a worker process to be up."""
+    _run(utils.hash_scheme, '')
+
+
+def shutdown() -> None:
+    """Stop the pool (before forking, at worker exit); the next call starts a new one."""
+    global _executor, _slots, _settings
+    with _lock:
+        executor, _executor, _slots, _settings = _executor, None, None, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn: Callable[..., Any], *args: Any) -> Any:
+    start()
+    slots, executor, (_, _, wait) = _slots, _executor, _settings
+    remaining = remaining_request_budget()
+    if remaining is not None:
+        wait = min(wait, max(remaining, 0.0))
+    if not slots.acquire(timeout=wait):
+        raise HashingBusy('Too many password checks in progress')
+
+    if executor is None:
+        try:
+            return fn(*args)
+        finally:
+            slots.release()
+
+    try:
+        future = executor.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        # A pool child died or the pool was shut down: rebuild it next time, hash inline now.
+        slots.release()
+        shutdown()
+        return fn(*args)
+    # The slot stays taken until the job finishes, even if this request gives up on it.
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=remaining_request_budget())
+    except FutureTimeout:
+        raise DeadlineExceeded('Request time budget exhausted while hashing') from None
+    except BrokenProcessPool:
+        shutdown()
+        return fn(*args)
+
+
+def hash_password(password: str) -> str:
+    """``utils.hash_password`` run in the pool."""
+    return _run(utils.hash_password, password)
+
+
+def verify_and_upgrade(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """``utils.verify_and_upgrade`` run in the pool."""
+    return _run(utils.verify_and_upgrade, password, hashed)
+
+
+def hash_many(passwords: Sequence[str]) -> List[str]:
+    """Hash a batch of passwords across ``PASSWORD_HASH_BULK_WORKERS`` processes.
+
+    Meant for admin bulk imports: it uses its own short-lived pool rather than
+    the login queue, and blocks until every hash is done or the budget runs out.
+    """
+    workers = min(max(_setting('PASSWORD_HASH_BULK_WORKERS', str(os.cpu_count() or 1), int), 0), len(passwords))
+    if workers <= 1:
+        return [utils.hash_password(password) for password in passwords]
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(utils.hash_password, passwords, timeout=remaining_request_budget(), chunksize=chunksize))
+    except FutureTimeout:
+        raise DeadlineExceeded('Request time budget exhausted while hashing') from None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,15 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from typing import Set
+from typing import Any, Dict, Optional, Set, Tuple
 from flask import jsonify, current_app
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended import get_jwt, verify_jwt_in_request, get_jwt_identity
 from utils import get_db
 
+# Access tokens carry the user's role under this claim so checks need no query.
+ROLE_CLAIM = 'role'
+ROLE_CACHE_MAX_ENTRIES = 4096
+
+# user id -> (role, expires_at); consulted for tokens without a role claim and on refresh.
+_role_cache: 'OrderedDict[str, Tuple[Optional[str], float]]' = OrderedDict()
+_role_cache_lock = threading.Lock()
+
 
 def _expand_allowed(roles) -> Set[str]:
     # Always allow Admins to perform manager-level actions
     return set(roles) | {'Admin'}
 
 
+def _role_cache_ttl() -> float:
+    try:
+        return float(current_app.config.get('ROLE_CACHE_TTL', 60))
+    except Exception:
+        return 60.0
+
+
+def role_claims(role: Optional[str]) -> Dict[str, Any]:
+    """Extra JWT claims for a user with ``role``; pass as ``additional_claims``."""
+    return {ROLE_CLAIM: role} if role else {}
+
+
+def cache_role(user_id: Any, role: Optional[str]) -> None:
+    key = str(user_id)
+    with _role_cache_lock:
+        _role_cache[key] = (role, time.monotonic() + _role_cache_ttl())
+        _role_cache.move_to_end(key)
+        while len(_role_cache) > ROLE_CACHE_MAX_ENTRIES:
+            _role_cache.popitem(last=False)
+
+
+def lookup_role(user_id: Any) -> Optional[str]:
+    """Return the user's role name from the in-process cache, querying on a miss."""
+    key = str(user_id)
+    with _role_cache_lock:
+        cached = _role_cache.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('SELECT r.name FROM users u JOIN roles r ON u.role_id=r.id WHERE u.id=?', (user_id,))
+    row = cur.fetchone()
+    role = row[0] if row else None
+    cache_role(key, role)
+    return role
+
+
+def current_role() -> Optional[str]:
+    """Role of the authenticated user: the token claim, else the role cache.
+
+    The claim is trusted until the access token expires, so a role changed in
+    the database takes effect once the user's token is refreshed: within the
+    access token lifetime (``JWT_ACCESS_TOKEN_EXPIRES``) plus ``ROLE_CACHE_TTL``,
+    as the refresh reads the role through this process's cache.
+
+    Must be called after the JWT has been verified for this request.
+    """
+    uid = get_jwt_identity()
+    role = get_jwt().get(ROLE_CLAIM)
+    if role:
+        return role
+    return lookup_role(uid)
+
+
 def require_roles(*roles):
     allowed = _expand_allowed(roles)
 
@@ -25,11 +90,7 @@ def require_roles(*roles):
                 return jsonify({'msg': 'auth required'}), 401
 
             try:
-                conn = get_db()
-                cur = conn.cursor()
-                cur.execute('SELECT r.name FROM users u JOIN roles r ON u.role_id=r.id WHERE u.id=?', (uid,))
-                row = cur.fetchone()
-                role = row[0] if row else None
+                role = current_role()
             except Exception as e:
                 current_app.logger.exception('permissions.require_roles DB error')
                 return jsonify({'msg': 'internal error'}), 500
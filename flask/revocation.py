@@ -0,0 +1,130 @@
+"""
+revocation.py
+
+In-memory index of revoked JWTs, so the blocklist check is a set lookup.
+
+Each process keeps the unexpired JTIs from ``revoked_tokens`` in memory and
+catches up at most every ``REVOCATION_SYNC_INTERVAL`` seconds by reading only
+rows above the highest id it has seen. Logouts handled by this process are
+added immediately; a logout handled elsewhere is seen within one interval.
+Expired rows are deleted by a background thread every
+``REVOKED_TOKEN_PRUNE_INTERVAL`` seconds, or by ``python revocation.py --prune``.
+
+Run: python flask/revocation.py --prune
+"""
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from utils import db_identity, get_db
+
+
+def _config(key: str, default: float) -> float:
+    try:
+        return float(current_app.config.get(key, default))
+    except Exception:
+        return default
+
+
+def prune_expired(conn: Any, now: Optional[float] = None) -> int:
+    """Delete revocations whose token has expired and return how many went."""
+    cur = conn.cursor()
+    cur.execute('DELETE FROM revoked_tokens WHERE expires_at IS NOT NULL AND expires_at <= ?', (int(now or time.time()),))
+    conn.commit()
+    return max(cur.rowcount, 0)
+
+
+class RevokedTokenIndex:
+    """Unexpired revoked JTIs for the current database, synced by high-water mark."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, identity: Optional[str]) -> None:
+        self._identity = identity
+        self._expiry: Dict[str, Optional[int]] = {}
+        self._high_water = 0
+        self._synced_at: Optional[float] = None
+        self._pruned_at = time.monotonic()
+
+    def add(self, jti: str, expires_at: Optional[int]) -> None:
+        with self._lock:
+            self._expiry[jti] = expires_at
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        identity = db_identity()
+        with self._lock:
+            if identity != self._identity:
+                # A different database (tests, reconfiguration): start over.
+                self._reset(identity)
+            stale = self._synced_at is None or time.monotonic() - self._synced_at >= _config('REVOCATION_SYNC_INTERVAL', 2.0)
+        if stale:
+            self.sync()
+        with self._lock:
+            if jti not in self._expiry:
+                return False
+            expires_at = self._expiry[jti]
+        return expires_at is None or expires_at > time.time()
+
+    def sync(self) -> None:
+        """Load revocations added since the last sync and drop expired entries."""
+        if not self._sync_lock.acquire(blocking=self._synced_at is None):
+            return  # another thread is already syncing; use the current view
+        try:
+            now = time.time()
+            cur = get_db().cursor()
+            cur.execute(
+                'SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY id',
+                (self._high_water, int(now)),
+            )
+            rows = cur.fetchall()
+            with self._lock:
+                for row in rows:
+                    self._expiry[row[1]] = row[2]
+                    self._high_water = max(self._high_water, int(row[0]))
+                self._expiry = {
+                    jti: expires_at
+                    for jti, expires_at in self._expiry.items()
+                    if expires_at is None or expires_at > now
+                }
+                self._synced_at = time.monotonic()
+                prune_due = time.monotonic() - self._pruned_at >= _config('REVOKED_TOKEN_PRUNE_INTERVAL', 3600.0) > 0
+                if prune_due:
+                    self._pruned_at = time.monotonic()
+        finally:
+            self._sync_lock.release()
+        if prune_due:
+            self._start_pruner()
+
+    def _start_pruner(self) -> None:
+        app = current_app._get_current_object()
+
+        def run() -> None:
+            try:
+                with app.app_context():
+                    prune_expired(get_db())
+            except Exception as exc:
+                app.logger.warning('Pruning revoked tokens failed: %s', exc)
+
+        threading.Thread(target=run, name='revoked-token-pruner', daemon=True).start()
+
+
+revoked_tokens = RevokedTokenIndex()
+
+
+def main() -> None:
+    if '--prune' not in sys.argv[1:]:
+        print('Usage: python revocation.py --prune')
+        return
+    print(f'Pruned {prune_expired(get_db())} expired revoked tokens')
+
+
+if __name__ == '__main__':
+    main()
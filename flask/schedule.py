@@ -4,7 +4,6 @@ from datetime import date, datetime, timedelta
 from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, cast
 
 from flask import Blueprint, jsonify, request
-from marshmallow import ValidationError
 
 jwt_module = None
 jwt_required = None
@@ -17,13 +16,12 @@ try:  # pragma: no cover - optional dependency during tooling
 except Exception:
     jwt_module = None
 
-from utils import RqliteError, get_db
-from schemas import ShiftSchema
+from utils import get_db, read_consistency
 
 try:
-    from .permissions import require_roles
+    from .permissions import current_role, require_roles
 except Exception:  # pragma: no cover - fallback for local execution
-    from permissions import require_roles
+    from permissions import current_role, require_roles
 
 bp = Blueprint('schedule', __name__)
 
@@ -31,6 +29,9 @@ STATUS_VALUES = {'scheduled', 'confirmed', 'pending', 'open'}
 WORKING_DAY_START_HOUR = 9
 WORKING_DAY_END_HOUR = 22
 MIN_SHIFT_DURATION_MINUTES = 6 * 60
+# A year of days; keeps an availability update inside one rqlite bulk chunk
+# (RQLITE_BULK_SIZE, 500) so it applies all-or-nothing.
+MAX_AVAILABILITY_ENTRIES = 366
 
 
 def _normalize_date_token(value: Any) -> str:
@@ -69,135 +70,6 @@ def _normalize_date_token(value: Any) -> str:
     return token
 
 
-def ensure_schedule_schema() -> None:
-    """Ensure the database has the latest scheduling columns/indexes."""
-    conn = get_db()
-    cur = conn.cursor()
-
-    def _safe_add_column(table: str, column_def: str) -> bool:
-        try:
-            cur.execute(f'ALTER TABLE {table} ADD COLUMN {column_def}')
-            return True
-        except Exception as exc:
-            message = str(exc).lower()
-            duplicate_tokens = (
-                'duplicate column name',
-                'duplicate column',
-                'already exists',
-            )
-            if any(token in message for token in duplicate_tokens):
-                return False
-            if isinstance(exc, RqliteError) and any(token in message for token in duplicate_tokens):
-                return False
-            if isinstance(exc, sqlite3.OperationalError) and any(token in message for token in duplicate_tokens):
-                return False
-            raise
-
-    _safe_add_column('shifts', 'recurrence_rule TEXT')
-    _safe_add_column('shifts', "default_status TEXT DEFAULT 'scheduled'")
-    _safe_add_column('shifts', 'default_duration INTEGER')
-
-    shift_columns = {
-        'start_time': 'start_time TEXT',
-        'end_time': 'end_time TEXT',
-        'status': "status TEXT DEFAULT 'scheduled'",
-        'notes': 'notes TEXT',
-        'recurrence_parent_id': 'recurrence_parent_id INTEGER',
-        'schedule_week_start': 'schedule_week_start DATE',
-        'created_at': 'created_at DATETIME',
-        'updated_at': 'updated_at DATETIME'
-    }
-    added_columns: Dict[str, bool] = {}
-    for column, definition in shift_columns.items():
-        if _safe_add_column('shift_assignments', definition):
-            added_columns[column] = True
-
-    if added_columns.get('created_at'):
-        cur.execute("UPDATE shift_assignments SET created_at = datetime('now') WHERE created_at IS NULL")
-    if added_columns.get('status'):
-        cur.execute("UPDATE shift_assignments SET status = 'scheduled' WHERE status IS NULL OR status = ''")
-
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_user_date ON shift_assignments (assigned_user, shift_date)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_week ON shift_assignments (schedule_week_start)')
-
-    cur.execute(
-        'CREATE TABLE IF NOT EXISTS staff_availability ('
-        'id INTEGER PRIMARY KEY,'
-        'user_id INTEGER NOT NULL,'
-        'availability_date DATE NOT NULL,'
-        'is_available INTEGER NOT NULL DEFAULT 1,'
-        'notes TEXT,'
-        'updated_by INTEGER,'
-    'created_at DATETIME DEFAULT CURRENT_TIMESTAMP,'
-        'updated_at DATETIME,'
-        'FOREIGN KEY (user_id) REFERENCES users(id),'
-        'FOREIGN KEY (updated_by) REFERENCES users(id),'
-        'UNIQUE(user_id, availability_date)'
-        ')'
-    )
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_staff_availability_week ON staff_availability (availability_date)')
-
-    notifications_table_sql = (
-        "CREATE TABLE IF NOT EXISTS staff_notifications ("
-        "id INTEGER PRIMARY KEY,"
-        "user_id INTEGER NOT NULL,"
-        "assignment_id INTEGER,"
-        "title TEXT NOT NULL,"
-        "message TEXT NOT NULL,"
-        "shift_date DATE,"
-        "start_time TEXT,"
-        "end_time TEXT,"
-        "role TEXT,"
-        "status TEXT,"
-        "created_at DATETIME DEFAULT (datetime('now')),"
-        "acknowledged_at DATETIME,"
-        "FOREIGN KEY (user_id) REFERENCES users(id),"
-        "FOREIGN KEY (assignment_id) REFERENCES shift_assignments(id) ON DELETE CASCADE"
-        ")"
-    )
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='staff_notifications'")
-    table_exists = cur.fetchone() is not None
-    if not table_exists:
-        cur.execute(notifications_table_sql)
-    else:
-        cur.execute('PRAGMA foreign_key_list(staff_notifications)')
-        fk_rows = cur.fetchall()
-        cascade_ok = False
-        for fk in fk_rows:
-            try:
-                column_name = fk['from']  # type: ignore[index]
-                on_delete = fk['on_delete']  # type: ignore[index]
-            except (TypeError, IndexError, KeyError):
-                column_name = fk[3] if len(fk) > 3 else None  # type: ignore[index]
-                on_delete = fk[6] if len(fk) > 6 else None  # type: ignore[index]
-            if column_name == 'assignment_id':
-                cascade_ok = str(on_delete or '').upper() == 'CASCADE'
-                break
-        if not cascade_ok:
-            cur.execute('ALTER TABLE staff_notifications RENAME TO staff_notifications_legacy')
-            cur.execute(notifications_table_sql.replace('IF NOT EXISTS ', ''))
-            cur.execute(
-                'INSERT INTO staff_notifications ('
-                'id, user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at, acknowledged_at'
-                ') SELECT '
-                'id, user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at, acknowledged_at '
-                'FROM staff_notifications_legacy'
-            )
-            cur.execute('DROP TABLE staff_notifications_legacy')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_staff_notifications_user ON staff_notifications (user_id, acknowledged_at, created_at)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_staff_notifications_assignment ON staff_notifications (assignment_id)')
-
-    conn.commit()
-
-
-@bp.before_app_request
-def _ensure_schedule_schema_before_request() -> None:
-    try:
-        ensure_schedule_schema()
-    except Exception:
-        pass
-
-
 def reset_schedule_state(*, include_assignments: bool = True, include_notifications: bool = True) -> None:
     """Utility to clear schedule-related tables; primarily used in tests."""
     conn = get_db()
@@ -270,14 +142,6 @@ def _coerce_int(value: Any) -> Optional[int]:
         return None
 
 
-def _fetch_role(user_id: Any) -> Optional[str]:
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute('SELECT r.name FROM users u JOIN roles r ON u.role_id=r.id WHERE u.id=?', (user_id,))
-    row = cur.fetchone()
-    return row[0] if row else None
-
-
 def _serialize_assignment(row: Dict[str, Any]) -> Dict[str, Any]:
     staff_first = row.get('first_name') or ''
     staff_last = row.get('last_name') or ''
@@ -500,20 +364,7 @@ def _insert_assignment_notification(
     if user_id is None or assignment_id is None:
         return
 
-    readable = _format_notification_datetime(shift_date, start_time)
-    role_label = (role or 'Shift').strip() or 'Shift'
-    action_token = action.lower()
-
-    if action_token == 'assigned':
-        title = 'New shift assigned'
-        message = f"You've been assigned to {role_label} on {readable}."
-    elif action_token == 'reassigned':
-        title = 'Shift reassigned'
-        message = f"You're now scheduled for {role_label} on {readable}."
-    else:
-        title = 'Shift updated'
-        message = f"Details for your {role_label} on {readable} were updated."
-
+    title, message = _notification_text(action, role, shift_date, start_time)
     cursor.execute(
         'INSERT INTO staff_notifications '
         '(user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at) '
@@ -533,6 +384,24 @@ def _insert_assignment_notification(
     )
 
 
+def _notification_text(action: str, role: Optional[str], shift_date: Optional[str], start_time: Optional[str]) -> Tuple[str, str]:
+    readable = _format_notification_datetime(shift_date, start_time)
+    role_label = (role or 'Shift').strip() or 'Shift'
+    action_token = action.lower()
+
+    if action_token == 'assigned':
+        title = 'New shift assigned'
+        message = f"You've been assigned to {role_label} on {readable}."
+    elif action_token == 'reassigned':
+        title = 'Shift reassigned'
+        message = f"You're now scheduled for {role_label} on {readable}."
+    else:
+        title = 'Shift updated'
+        message = f"Details for your {role_label} on {readable} were updated."
+
+    return title, message
+
+
 @bp.route('/week', methods=['GET'])
 def weekly_schedule():
     if jwt_required is None or get_jwt_identity is None:
@@ -544,7 +413,7 @@ def weekly_schedule():
     @jwt_req()
     def inner():
         uid = get_identity()
-        role = _fetch_role(uid)
+        role = current_role()
         requested_week = _parse_date(request.args.get('week_start'))
         week_start = requested_week or _start_of_week()
         include_all = role in {'Manager', 'Admin'}
@@ -626,68 +495,87 @@ def create_assignment():
     if error:
         return jsonify({'msg': error}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
-    created_ids = []
-    notification_messages: List[str] = []
-    parent_id: Optional[int] = None
-
     for assignment in assignments:
         conflicts = _find_conflicts(assignment)
         if conflicts:
             return jsonify({'msg': 'Shift conflicts with an existing assignment', 'conflicts': conflicts}), 409
 
-        now_iso = datetime.utcnow().isoformat()
-        cur.execute(
-            'INSERT INTO shift_assignments '
-            '(shift_id, assigned_user, shift_date, start_time, end_time, role, status, notes, recurrence_parent_id, schedule_week_start, created_at, updated_at) '
-            'VALUES (?,?,?,?,?,?,?,?,?,?,?,?)',
-            (
-                assignment.get('shift_id'),
-                assignment.get('staff_id'),
+    conn = get_db()
+    cur = conn.cursor()
+
+    # Every recurrence shares the same staff member, so resolve the name once
+    # instead of reading between the buffered inserts.
+    staff_name = ''
+    staff_id = assignments[0].get('staff_id') if assignments else None
+    if staff_id:
+        cur.execute('SELECT first_name, last_name FROM users WHERE id=?', (staff_id,))
+        row = cur.fetchone()
+        if row:
+            staff_name = ((row[0] or '') + ' ' + (row[1] or '')).strip()
+
+    now_iso = datetime.utcnow().isoformat()
+    insert_sql = (
+        'INSERT INTO shift_assignments '
+        '(shift_id, assigned_user, shift_date, start_time, end_time, role, status, notes, recurrence_parent_id, schedule_week_start, created_at, updated_at) '
+        'VALUES (?,?,?,?,?,?,?,?,?,?,?,?)'
+    )
+
+    def assignment_values(assignment: Dict[str, Any], parent: Optional[int]) -> Tuple[Any, ...]:
+        return (
+            assignment.get('shift_id'),
+            assignment.get('staff_id'),
+            assignment.get('shift_date'),
+            assignment.get('start'),
+            assignment.get('end'),
+            assignment.get('role'),
+            assignment.get('status'),
+            assignment.get('notes'),
+            parent,
+            assignment.get('schedule_week_start'),
+            now_iso,
+            now_iso,
+        )
+
+    # Only the first row's id is needed up front; the recurrences reference it
+    # and go out together in one bulk insert.
+    cur.execute(insert_sql, assignment_values(assignments[0], None))
+    parent_id = cur.lastrowid
+    cur.execute('UPDATE shift_assignments SET recurrence_parent_id=? WHERE id=?', (parent_id, parent_id))
+    if len(assignments) > 1:
+        cur.executemany(insert_sql, [assignment_values(assignment, parent_id) for assignment in assignments[1:]])
+
+    assigned_user_id = _coerce_int(staff_id)
+    if assigned_user_id:
+        notification_rows = []
+        for assignment in assignments:
+            title, message = _notification_text('assigned', assignment.get('role'), assignment.get('shift_date'), assignment.get('start'))
+            notification_rows.append((
+                assigned_user_id,
+                title,
+                message,
                 assignment.get('shift_date'),
                 assignment.get('start'),
                 assignment.get('end'),
                 assignment.get('role'),
                 assignment.get('status'),
-                assignment.get('notes'),
-                parent_id,
-                assignment.get('schedule_week_start'),
                 now_iso,
-                now_iso,
-            )
+                parent_id,
+                assignment.get('shift_date'),
+            ))
+        cur.executemany(
+            'INSERT INTO staff_notifications '
+            '(user_id, assignment_id, title, message, shift_date, start_time, end_time, role, status, created_at) '
+            'SELECT ?, id, ?, ?, ?, ?, ?, ?, ?, ? FROM shift_assignments WHERE recurrence_parent_id=? AND shift_date=?',
+            notification_rows,
         )
-        assignment_id = cur.lastrowid
-        if parent_id is None:
-            parent_id = assignment_id
-            cur.execute('UPDATE shift_assignments SET recurrence_parent_id=? WHERE id=?', (parent_id, assignment_id))
-        created_ids.append(assignment_id)
-
-        staff_name = ''
-        if assignment.get('staff_id'):
-            cur.execute('SELECT first_name, last_name FROM users WHERE id=?', (assignment['staff_id'],))
-            row = cur.fetchone()
-            if row:
-                staff_name = ((row[0] or '') + ' ' + (row[1] or '')).strip()
-
-        assigned_user_id = _coerce_int(assignment.get('staff_id'))
-        if assigned_user_id:
-            _insert_assignment_notification(
-                cur,
-                user_id=assigned_user_id,
-                assignment_id=assignment_id,
-                action='assigned',
-                role=assignment.get('role'),
-                status=assignment.get('status'),
-                shift_date=assignment.get('shift_date'),
-                start_time=assignment.get('start'),
-                end_time=assignment.get('end'),
-            )
 
-        notification_messages.append(_simulate_notification('assigned a new', assignment, staff_name))
+    notification_messages = [_simulate_notification('assigned a new', assignment, staff_name) for assignment in assignments]
 
     conn.commit()
 
+    cur.execute('SELECT id FROM shift_assignments WHERE recurrence_parent_id=? ORDER BY id', (parent_id,))
+    created_ids = [row[0] for row in cur.fetchall()]
+
     return jsonify({'created_ids': created_ids, 'notifications': notification_messages}), 201
 
 
@@ -800,15 +688,18 @@ def update_assignment(assignment_id: int):
     params.append(datetime.utcnow().isoformat())
     params.append(assignment_id)
 
-    cur.execute(f"UPDATE shift_assignments SET {', '.join(updates)}, updated_at=? WHERE id=?", params)
+    cur.execute(
+        f"UPDATE shift_assignments SET {', '.join(updates)}, updated_at=? WHERE id=? "
+        'RETURNING shift_date, start_time, end_time, role, status',
+        params,
+    )
+    updated_row = cur.fetchone()
     if normalized_staff_id is not None and (previous_staff_id is None or previous_staff_id != normalized_staff_id):
         action_label = 'assigned'
     else:
         action_label = 'updated'
 
     if normalized_staff_id is not None:
-        cur.execute('SELECT shift_date, start_time, end_time, role, status FROM shift_assignments WHERE id=?', (assignment_id,))
-        updated_row = cur.fetchone()
         if updated_row:
             _insert_assignment_notification(
                 cur,
@@ -890,25 +781,23 @@ def claim_assignment(assignment_id: int):
     cur.execute(
         'UPDATE shift_assignments SET assigned_user=?, status=?, schedule_week_start=?, updated_at=? '
         'WHERE id=? AND assigned_user IS NULL '
-        'AND LOWER(COALESCE(status, "")) = "open"',
+        'AND LOWER(COALESCE(status, "")) = "open" '
+        'RETURNING *, '
+        '(SELECT first_name FROM users WHERE users.id = assigned_user) AS first_name, '
+        '(SELECT last_name FROM users WHERE users.id = assigned_user) AS last_name, '
+        '(SELECT email FROM users WHERE users.id = assigned_user) AS staff_email, '
+        '(SELECT name FROM shifts WHERE shifts.id = shift_id) AS shift_name, '
+        '(SELECT role_required FROM shifts WHERE shifts.id = shift_id) AS role_required',
         (staff_id, 'scheduled', schedule_week_start, now_iso, assignment_id)
     )
+    updated_row = cur.fetchone()
 
-    if cur.rowcount == 0:
+    if updated_row is None:
         return jsonify({'msg': 'Shift is no longer available'}), 409
 
     conn.commit()
 
-    cur.execute(
-        'SELECT sa.*, u.first_name, u.last_name, u.email as staff_email, s.name as shift_name, s.role_required '
-        'FROM shift_assignments sa '
-        'LEFT JOIN users u ON sa.assigned_user = u.id '
-        'LEFT JOIN shifts s ON sa.shift_id = s.id '
-        'WHERE sa.id=?',
-        (assignment_id,)
-    )
-    updated_row = cur.fetchone()
-    assignment_data = _serialize_assignment(dict(updated_row)) if updated_row else None
+    assignment_data = _serialize_assignment(dict(updated_row))
 
     return jsonify({'msg': 'Shift claimed', 'assignment': assignment_data}), 200
 
@@ -1017,6 +906,10 @@ def acknowledge_notification(notification_id: int):
 @require_roles('Manager')
 def create_shift_template():
     uid = get_jwt_identity() if get_jwt_identity else None
+    # marshmallow is slow to import and only this endpoint validates with it.
+    from marshmallow import ValidationError
+    from schemas import ShiftSchema
+
     data = request.get_json() or {}
     try:
         payload = ShiftSchema().load(data)
@@ -1046,8 +939,9 @@ def create_shift_template():
 def list_shift_templates():
     conn = get_db()
     cur = conn.cursor()
-    cur.execute('SELECT id, name, role_required, start_time, end_time, created_by, recurrence_rule, default_status, default_duration FROM shifts')
-    rows = cur.fetchall()
+    with read_consistency(conn, 'none'):
+        cur.execute('SELECT id, name, role_required, start_time, end_time, created_by, recurrence_rule, default_status, default_duration FROM shifts')
+        rows = cur.fetchall()
     result = []
     for row in rows:
         result.append({
@@ -1150,7 +1044,7 @@ def availability_overview():
         if uid is None:
             return jsonify({'msg': 'Invalid user identity'}), 401
 
-        role = _fetch_role(uid)
+        role = current_role()
         requested_week = _parse_date(request.args.get('week_start')) or _start_of_week()
         week_end = requested_week + timedelta(days=6)
         target_user = _coerce_int(request.args.get('user_id'))
@@ -1224,11 +1118,13 @@ def update_availability():
         if uid is None:
             return jsonify({'msg': 'Invalid user identity'}), 401
 
-        role = _fetch_role(uid)
+        role = current_role()
         data = request.get_json() or {}
         entries_payload = data.get('entries')
         if not isinstance(entries_payload, list) or not entries_payload:
             return jsonify({'msg': 'entries must be a non-empty list'}), 400
+        if len(entries_payload) > MAX_AVAILABILITY_ENTRIES:
+            return jsonify({'msg': f'at most {MAX_AVAILABILITY_ENTRIES} entries per update'}), 413
 
         target_user = data.get('user_id')
         coerced_target = _coerce_int(target_user) if target_user is not None else uid
@@ -1242,6 +1138,7 @@ def update_availability():
         cur = conn.cursor()
 
         saved: List[Dict[str, Any]] = []
+        rows: List[Tuple[Any, ...]] = []
         now_iso = datetime.utcnow().isoformat()
 
         for entry in entries_payload:
@@ -1255,14 +1152,7 @@ def update_availability():
 
             notes = (entry.get('notes') or '').strip()
 
-            cur.execute(
-                'INSERT INTO staff_availability (user_id, availability_date, is_available, notes, updated_by, updated_at) '
-                'VALUES (?,?,?,?,?,?) '
-                'ON CONFLICT(user_id, availability_date) DO UPDATE SET '
-                'is_available=excluded.is_available, notes=excluded.notes, updated_by=excluded.updated_by, updated_at=excluded.updated_at',
-                (coerced_target, availability_date.isoformat(), flag, notes, uid, now_iso)
-            )
-
+            rows.append((coerced_target, availability_date.isoformat(), flag, notes, uid, now_iso))
             saved.append({
                 'user_id': coerced_target,
                 'date': availability_date.isoformat(),
@@ -1270,6 +1160,13 @@ def update_availability():
                 'notes': notes,
             })
 
+        cur.executemany(
+            'INSERT INTO staff_availability (user_id, availability_date, is_available, notes, updated_by, updated_at) '
+            'VALUES (?,?,?,?,?,?) '
+            'ON CONFLICT(user_id, availability_date) DO UPDATE SET '
+            'is_available=excluded.is_available, notes=excluded.notes, updated_by=excluded.updated_by, updated_at=excluded.updated_at',
+            rows,
+        )
         conn.commit()
 
         return jsonify({'updated': len(saved), 'entries': saved})
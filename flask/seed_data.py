@@ -4,15 +4,18 @@ seed_data.py
 Idempotent script to ensure roles include Admin/Manager/Staff/User and to create
 dummy users and menu items requested by the user.
 
-Run: python flask/seed_data.py
+Run: python flask/seed_data.py              (wipe and reseed the local sqlite DB)
+     python flask/seed_data.py --if-needed  (seed once, guarded by the app_meta marker)
 """
-import json
 import os
 import random
 import sqlite3
+import sys
 from datetime import datetime, timedelta, date
-from typing import Optional, List, Dict, Any
-from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+from migrations import get_meta, migrate, schema_lock, set_meta
+from utils import get_db, query_batch
 
 ROOT = os.path.dirname(__file__)
 DB = os.environ.get('DB_PATH', os.path.join(ROOT, 'data', 'app.db'))
@@ -31,14 +34,36 @@ CAT_IMAGES = {
 }
 
 
-def _is_duplicate_column_error(exc: Exception) -> bool:
-    message = str(exc).lower()
-    duplicate_tokens = (
-        'duplicate column name',
-        'duplicate column',
-        'already exists',
-    )
-    return any(token in message for token in duplicate_tokens)
+SEED_MARKER = 'seed_version'
+# Bump when the seed content changes so existing databases pick it up once.
+SEED_VERSION = '1'
+
+MENU_TYPES = ['Appetizer', 'Main', 'Dessert', 'Beverage']
+
+SEED_USERS: List[Dict[str, Optional[str]]] = [
+    {'first_name':'Alice','last_name':'Admin','email':'alice.admin@example.com','phone_number':'+10000000001','role':'Admin','title':'System Administrator'},
+    {'first_name':'Maya','last_name':'Manager','email':'maya.manager@example.com','phone_number':'+10000000002','role':'Manager','title':'Operations Manager'},
+    {'first_name':'Sam','last_name':'Staff','email':'sam.staff@example.com','phone_number':'+10000000003','role':'Staff','title':'Floor Staff'},
+    {'first_name':'Tina','last_name':'Staff','email':'tina.staff@example.com','phone_number':'+10000000004','role':'Staff','title':'Kitchen Staff'},
+    {'first_name':'Raj','last_name':'Staff','email':'raj.staff@example.com','phone_number':'+10000000005','role':'Staff','title':'Service Staff'},
+] + [
+    {'first_name':f'User{i}','last_name':'Customer', 'email':f'user{i}@example.com','phone_number':f'+1000000001{i}','role':'User','title':None}
+    for i in range(1, 6)
+]
+
+MENU_ITEMS = [
+    ('Heirloom Burrata Salad', 12.5, 'Heirloom tomatoes, burrata, basil oil, balsamic pearls', 'https://images.unsplash.com/photo-1473093295043-cdd812d0e601?auto=format&fit=crop&w=1200&q=80', 18),
+    ('Housemade Mushroom Tagliatelle', 18.0, 'Hand-cut pasta, wild mushrooms, parmesan cream', 'https://images.unsplash.com/photo-1525755662778-989d0524087e?auto=format&fit=crop&w=1200&q=80', 20),
+    ('Herb-Crusted Salmon', 21.0, 'Pan-seared salmon with lemon beurre blanc and asparagus', 'https://images.unsplash.com/photo-1514516345957-556ca7d90aaf?auto=format&fit=crop&w=1200&q=80', 12),
+    ('Wood-Fired Margherita Pizza', 15.0, 'San Marzano tomatoes, fresh mozzarella, basil', 'https://images.unsplash.com/photo-1548365328-96c4a0899736?auto=format&fit=crop&w=1200&q=80', 20),
+    ('Smoked Brisket Sliders', 13.5, 'House-smoked brisket, pickled onions, brioche buns', 'https://images.unsplash.com/photo-1540396890193-eb385829f230?auto=format&fit=crop&w=1200&q=80', 24),
+    ('Lobster Bisque', 11.0, 'Silky bisque finished with cognac cream and chive oil', 'https://images.unsplash.com/photo-1481931098730-318b6f776db0?auto=format&fit=crop&w=1200&q=80', 16),
+    ('Seared Scallops', 23.0, 'Butternut puree, crispy prosciutto, brown butter crumble', 'https://images.unsplash.com/photo-1543353071-10c8ba85a904?auto=format&fit=crop&w=1200&q=80', 10),
+    ('Seasonal Roasted Vegetables', 9.0, 'Charred broccolini, rainbow carrots, smoked almonds', 'https://images.unsplash.com/photo-1604908815795-01f72b5f52ff?auto=format&fit=crop&w=1200&q=80', 22),
+    ('Passionfruit Pavlova', 9.5, 'Crisp meringue, vanilla chantilly, fresh passionfruit', 'https://images.unsplash.com/photo-1499636136210-6f4ee915583e?auto=format&fit=crop&w=1200&q=80', 15),
+    ('Tiramisu Affogato', 8.0, 'Espresso-soaked ladyfingers, mascarpone cream, espresso shot', 'https://images.unsplash.com/photo-1506443432602-ac2fcd6f54e1?auto=format&fit=crop&w=1200&q=80', 17),
+    ('Citrus Spritz Mocktail', 6.5, 'Blood orange, grapefruit, rosemary, sparkling water', 'https://images.unsplash.com/photo-1613470207930-3e9958f55d2c?auto=format&fit=crop&w=1200&q=80', 30),
+]
 
 
 def _is_unique_constraint_error(exc: Exception) -> bool:
@@ -51,156 +76,37 @@ def _is_unique_constraint_error(exc: Exception) -> bool:
     return any(token in message for token in unique_tokens)
 
 
-def _table_has_rows(cur: sqlite3.Cursor, table: str) -> bool:
-    cur.execute(f'SELECT 1 FROM {table} LIMIT 1')
-    return cur.fetchone() is not None
-
-
-def _column_exists(cur: sqlite3.Cursor, table: str, column: str) -> bool:
-    cur.execute(f"PRAGMA table_info({table})")
-    return any(row[1] == column for row in cur.fetchall())
-
-
-def _add_column(cur: sqlite3.Cursor, table: str, column_def: str) -> None:
-    cur.execute(f'ALTER TABLE {table} ADD COLUMN {column_def}')
-
-def ensure_title_column(conn):
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(users)")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'title' not in cols:
-        print('Adding title column to users')
-        try:
-            cur.execute('ALTER TABLE users ADD COLUMN title TEXT')
-            conn.commit()
-        except Exception as exc:
-            if _is_duplicate_column_error(exc):
-                print('title column already present (detected during ALTER)')
-                conn.rollback()
-            else:
-                raise
-    else:
-        print('title column already present')
-
-
-def ensure_password_hash_column(conn):
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(users)")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'password_hash' not in cols:
-        print('Adding password_hash column to users')
-        try:
-            cur.execute('ALTER TABLE users ADD COLUMN password_hash TEXT')
-            conn.commit()
-        except Exception as exc:
-            if _is_duplicate_column_error(exc):
-                print('password_hash column already present (detected during ALTER)')
-                conn.rollback()
-            else:
-                raise
-    else:
-        print('password_hash column already present')
-
-
 def update_missing_passwords(conn, default_password='password'):
     # Set a default password hash for users missing password_hash (idempotent)
     from utils import hash_password
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM users WHERE password_hash IS NULL OR password_hash = ''")
-    rows = [r[0] for r in cur.fetchall()]
-    if not rows:
-        print('No users need password updates')
-        return
     pw_hash = hash_password(default_password)
-    for uid in rows:
-        cur.execute('UPDATE users SET password_hash=? WHERE id=?', (pw_hash, uid))
-        print('Updated password for user id', uid)
-    conn.commit()
+    conn.execute("UPDATE users SET password_hash=? WHERE password_hash IS NULL OR password_hash = ''", (pw_hash,))
+    print('Backfilled missing password hashes')
 
 def ensure_roles(conn):
     cur = conn.cursor()
     roles = ['Admin','Manager','Staff','User']
-    for r in roles:
-        cur.execute('INSERT OR IGNORE INTO roles (name) VALUES (?)', (r,))
-    conn.commit()
+    cur.executemany('INSERT OR IGNORE INTO roles (name) VALUES (?)', [(r,) for r in roles])
 
 
 def ensure_types(conn):
     cur = conn.cursor()
-    types = ['Appetizer', 'Main', 'Dessert', 'Beverage']
-    for item in types:
-        cur.execute('INSERT OR IGNORE INTO types (name) VALUES (?)', (item,))
-    conn.commit()
-
-
-def ensure_shift_schema(conn: sqlite3.Connection) -> None:
-    """Ensure the scheduling tables include the latest columns and indexes."""
-    cur = conn.cursor()
-
-    if not _column_exists(cur, 'shifts', 'recurrence_rule'):
-        _add_column(cur, 'shifts', 'recurrence_rule TEXT')
-    if not _column_exists(cur, 'shifts', 'default_status'):
-        _add_column(cur, 'shifts', "default_status TEXT DEFAULT 'scheduled'")
-    if not _column_exists(cur, 'shifts', 'default_duration'):
-        _add_column(cur, 'shifts', 'default_duration INTEGER')
-
-    assignment_columns = {
-        'start_time': 'start_time TEXT',
-        'end_time': 'end_time TEXT',
-        'status': "status TEXT DEFAULT 'scheduled'",
-        'notes': 'notes TEXT',
-        'recurrence_parent_id': 'recurrence_parent_id INTEGER',
-        'schedule_week_start': 'schedule_week_start DATE',
-        'created_at': 'created_at DATETIME',
-        'updated_at': 'updated_at DATETIME',
-    }
-
-    added_columns: Dict[str, bool] = {}
-    for column, definition in assignment_columns.items():
-        if not _column_exists(cur, 'shift_assignments', column):
-            _add_column(cur, 'shift_assignments', definition)
-            added_columns[column] = True
-
-    if added_columns.get('created_at'):
-        cur.execute("UPDATE shift_assignments SET created_at = datetime('now') WHERE created_at IS NULL")
-    if added_columns.get('status'):
-        cur.execute("UPDATE shift_assignments SET status = 'scheduled' WHERE status IS NULL OR status = ''")
-
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_user_date ON shift_assignments (assigned_user, shift_date)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_shift_assignments_week ON shift_assignments (schedule_week_start)')
-    cur.execute(
-        'CREATE TABLE IF NOT EXISTS staff_availability ('
-        'id INTEGER PRIMARY KEY,'
-        'user_id INTEGER NOT NULL,'
-        'availability_date DATE NOT NULL,'
-        'is_available INTEGER NOT NULL DEFAULT 1,'
-        'notes TEXT,'
-        'updated_by INTEGER,'
-    'created_at DATETIME DEFAULT CURRENT_TIMESTAMP,'
-        'updated_at DATETIME,'
-        'FOREIGN KEY (user_id) REFERENCES users(id),'
-        'FOREIGN KEY (updated_by) REFERENCES users(id),'
-        'UNIQUE(user_id, availability_date)'
-        ')'
-    )
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_staff_availability_week ON staff_availability (availability_date)')
-    conn.commit()
+    cur.executemany('INSERT OR IGNORE INTO types (name) VALUES (?)', [(item,) for item in MENU_TYPES])
 
 
 def cleanup_legacy_schedule_data(conn: sqlite3.Connection) -> None:
     """Remove legacy schedule rows that are incompatible with the new schema."""
     cur = conn.cursor()
     cur.execute("DELETE FROM shift_assignments WHERE start_time IS NULL OR start_time = '' OR end_time IS NULL OR end_time = ''")
-    conn.commit()
 
 
 def reset_database(conn: sqlite3.Connection) -> None:
     """Clear dynamic tables so reseeding always starts from a clean slate."""
     cur = conn.cursor()
-    print('Resetting tables: order_items, orders, staff_availability, shift_assignments, shifts, users')
+    print('Resetting tables: order_lines, orders, staff_availability, shift_assignments, shifts, users')
     cur.execute('PRAGMA foreign_keys = OFF')
     tables = [
-        'order_items',
+        'order_lines',
         'orders',
         'staff_availability',
         'shift_assignments',
@@ -214,121 +120,55 @@ def reset_database(conn: sqlite3.Connection) -> None:
     cur.execute('PRAGMA foreign_keys = ON')
     conn.commit()
 
-def seed_users(conn):
-    cur = conn.cursor()
-    # Determine role ids
-    cur.execute("SELECT id, name FROM roles")
-    role_rows = cur.fetchall()
-    role_map = {row[1]: row[0] for row in role_rows}
-
-    users: List[Dict[str, Optional[str]]] = []
-    # 1 admin
-    users.append({'first_name':'Alice','last_name':'Admin','email':'alice.admin@example.com','phone_number':'+10000000001','role':'Admin','title':'System Administrator'})
-    # 1 manager
-    users.append({'first_name':'Maya','last_name':'Manager','email':'maya.manager@example.com','phone_number':'+10000000002','role':'Manager','title':'Operations Manager'})
-    # 3 staff
-    users.append({'first_name':'Sam','last_name':'Staff','email':'sam.staff@example.com','phone_number':'+10000000003','role':'Staff','title':'Floor Staff'})
-    users.append({'first_name':'Tina','last_name':'Staff','email':'tina.staff@example.com','phone_number':'+10000000004','role':'Staff','title':'Kitchen Staff'})
-    users.append({'first_name':'Raj','last_name':'Staff','email':'raj.staff@example.com','phone_number':'+10000000005','role':'Staff','title':'Service Staff'})
-    # 5 users
-    for i in range(1,6):
-        users.append({'first_name':f'User{i}','last_name':'Customer', 'email':f'user{i}@example.com','phone_number':f'+1000000001{i}','role':'User','title':None})
-
-    # Insert users if email not present
+def seed_users(conn, existing_emails: Set[str]):
     # Prefer secure password for seeded users (password: 'password')
     from utils import hash_password
-    for u in users:
-        email = u.get('email')
-        u['profile_pic'] = CAT_IMAGES.get(email) if email else None
-    for u in users:
-        role_id = role_map.get(u['role'])
-        pw_hash = hash_password('password')
-        try:
-            cur.execute(
-                'INSERT INTO users (first_name,last_name,email,phone_number,role_id,title,signup_date,password_hash,profile_pic) VALUES (?,?,?,?,?,?,?,?,?)',
-                (
-                    u['first_name'],
-                    u['last_name'],
-                    u['email'],
-                    u['phone_number'],
-                    role_id,
-                    u['title'],
-                    datetime.utcnow().isoformat(),
-                    pw_hash,
-                    u.get('profile_pic'),
-                ),
-            )
-            print('Inserted user:', u['email'])
-        except Exception as exc:
-            if _is_unique_constraint_error(exc):
-                print('User exists, skipping insert:', u['email'])
-            else:
-                raise
-
-        if role_id is not None:
-            cur.execute(
-                'UPDATE users SET role_id=? WHERE email=? AND (role_id IS NULL OR role_id != ?)',
-                (role_id, u['email'], role_id),
-            )
-
-        if u.get('profile_pic'):
-            cur.execute(
-                'UPDATE users SET profile_pic=? WHERE email=? AND (profile_pic IS NULL OR profile_pic != ?)',
-                (u['profile_pic'], u['email'], u['profile_pic']),
-            )
-        if u.get('title'):
-            cur.execute(
-                'UPDATE users SET title=? WHERE email=? AND (title IS NULL OR title != ?)',
-                (u['title'], u['email'], u['title']),
-            )
-    conn.commit()
-
-
-def _extract_row_value(row: Any, key: str, index: int) -> Any:
-    if isinstance(row, MappingABC):
-        return row.get(key)
-    if isinstance(row, SequenceABC):
-        try:
-            return row[index]
-        except (IndexError, TypeError):
-            return None
-    return None
-
-
-def _lookup_user_ids(conn: sqlite3.Connection, emails: List[str]) -> Dict[str, Optional[int]]:
-    if not emails:
-        return {}
     cur = conn.cursor()
-    placeholders = ','.join('?' for _ in emails)
-    cur.execute(f'SELECT email, id FROM users WHERE email IN ({placeholders})', tuple(emails))
-    rows = cur.fetchall()
-    mapping: Dict[str, Optional[int]] = {email: None for email in emails}
-    for row in rows:
-        email_val = _extract_row_value(row, 'email', 0)
-        id_val = _extract_row_value(row, 'id', 1)
-        if email_val is None:
-            continue
-        try:
-            email_key = str(email_val)
-        except Exception:
+    now_iso = datetime.utcnow().isoformat()
+    # Every demo account shares the same password, so hash it once per run.
+    pw_hash = hash_password('password') if len(existing_emails) < len(SEED_USERS) else None
+    new_rows = []
+    refresh_rows = []
+    for u in SEED_USERS:
+        email = u['email']
+        profile_pic = CAT_IMAGES.get(email) if email else None
+        if email in existing_emails:
+            print('User exists, skipping insert:', email)
+            refresh_rows.append((u['role'], u['title'], profile_pic, email))
             continue
-        if id_val is None:
-            mapping[email_key] = None
-        else:
-            try:
-                mapping[email_key] = int(id_val)
-            except (TypeError, ValueError):
-                mapping[email_key] = None
-    return mapping
+        new_rows.append((
+            u['first_name'],
+            u['last_name'],
+            email,
+            u['phone_number'],
+            u['role'],
+            u['title'],
+            now_iso,
+            pw_hash,
+            profile_pic,
+        ))
+        print('Inserted user:', email)
+
+    cur.executemany(
+        'INSERT OR IGNORE INTO users (first_name,last_name,email,phone_number,role_id,title,signup_date,password_hash,profile_pic) '
+        'VALUES (?,?,?,?,(SELECT id FROM roles WHERE name=?),?,?,?,?)',
+        new_rows,
+    )
+    # Existing accounts keep their data but pick up the curated role, title and picture.
+    cur.executemany(
+        'UPDATE users SET '
+        'role_id=COALESCE((SELECT id FROM roles WHERE name=?), role_id), '
+        'title=COALESCE(?, title), '
+        'profile_pic=COALESCE(?, profile_pic) '
+        'WHERE email=?',
+        refresh_rows,
+    )
 
 
-def seed_shift_templates(conn: sqlite3.Connection) -> Dict[str, int]:
-    """Seed reusable shift templates and return a name-to-id mapping."""
-    ensure_shift_schema(conn)
+def seed_shift_templates(conn: sqlite3.Connection) -> None:
+    """Upsert the reusable shift templates by name."""
     cur = conn.cursor()
-
     admin_email = 'alice.admin@example.com'
-    admin_id = _lookup_user_ids(conn, [admin_email]).get(admin_email)
 
     templates: List[Dict[str, Any]] = [
         {
@@ -365,49 +205,43 @@ def seed_shift_templates(conn: sqlite3.Connection) -> Dict[str, int]:
         },
     ]
 
-    name_to_id: Dict[str, int] = {}
-    for template in templates:
-        cur.execute('SELECT id FROM shifts WHERE name=?', (template['name'],))
-        row = cur.fetchone()
-        if row:
-            cur.execute(
-                'UPDATE shifts SET role_required=?, start_time=?, end_time=?, created_by=?, recurrence_rule=?, default_status=?, default_duration=? WHERE id=?',
-                (
-                    template['role_required'],
-                    template['start_time'],
-                    template['end_time'],
-                    admin_id,
-                    template['recurrence_rule'],
-                    'scheduled',
-                    template['default_duration'],
-                    row[0],
-                ),
+    cur.executemany(
+        'UPDATE shifts SET role_required=?, start_time=?, end_time=?, created_by=(SELECT id FROM users WHERE email=?), '
+        'recurrence_rule=?, default_status=?, default_duration=? WHERE name=?',
+        [
+            (
+                template['role_required'],
+                template['start_time'],
+                template['end_time'],
+                admin_email,
+                template['recurrence_rule'],
+                'scheduled',
+                template['default_duration'],
+                template['name'],
             )
-            name_to_id[template['name']] = row[0]
-            print('Updated shift template:', template['name'])
-            continue
-        cur.execute(
-            'INSERT INTO shifts (name, role_required, start_time, end_time, created_by, recurrence_rule, default_status, default_duration)\n'
-            'VALUES (?,?,?,?,?,?,?,?)',
+            for template in templates
+        ],
+    )
+    cur.executemany(
+        'INSERT INTO shifts (name, role_required, start_time, end_time, created_by, recurrence_rule, default_status, default_duration) '
+        'SELECT ?,?,?,?,(SELECT id FROM users WHERE email=?),?,?,? WHERE NOT EXISTS (SELECT 1 FROM shifts WHERE name=?)',
+        [
             (
                 template['name'],
                 template['role_required'],
                 template['start_time'],
                 template['end_time'],
-                admin_id,
+                admin_email,
                 template['recurrence_rule'],
                 'scheduled',
                 template['default_duration'],
-            ),
-        )
-        last_id = cur.lastrowid
-        if last_id is None:
-            raise RuntimeError('Failed to insert shift template')
-        name_to_id[template['name']] = int(last_id)
-        print('Inserted shift template:', template['name'])
-
-    conn.commit()
-    return name_to_id
+                template['name'],
+            )
+            for template in templates
+        ],
+    )
+    for template in templates:
+        print('Ensured shift template:', template['name'])
 
 
 def _start_of_week(target: Optional[date] = None) -> date:
@@ -419,24 +253,10 @@ def _combine_iso(day: date, time_str: str) -> str:
     return f"{day.isoformat()}T{time_str}:00"
 
 
-def seed_shift_assignments(conn: sqlite3.Connection, shift_ids: Dict[str, int], *, preserve_existing: bool = False) -> None:
-    ensure_shift_schema(conn)
+def seed_shift_assignments(conn: sqlite3.Connection) -> None:
+    """Replace all shift assignments with the demo rota around the current week."""
     cur = conn.cursor()
-
-    if preserve_existing and _table_has_rows(cur, 'shift_assignments'):
-        print('Shift assignments already present, skipping reseed')
-        return
-
-    if not preserve_existing:
-        cur.execute('DELETE FROM shift_assignments')
-
-    staff_emails = [
-        'maya.manager@example.com',
-        'sam.staff@example.com',
-        'tina.staff@example.com',
-        'raj.staff@example.com',
-    ]
-    user_map = _lookup_user_ids(conn, staff_emails)
+    cur.execute('DELETE FROM shift_assignments')
 
     current_week_start = _start_of_week()
     week_offsets = [-2, -1, 0, 1]
@@ -567,6 +387,7 @@ def seed_shift_assignments(conn: sqlite3.Connection, shift_ids: Dict[str, int],
     ]
 
     now_iso = datetime.utcnow().isoformat()
+    assignment_rows = []
     for week_index, offset in enumerate(week_offsets):
         week_start = current_week_start + timedelta(weeks=offset)
         week_label = f"Week of {week_start.strftime('%b %d')}"
@@ -574,242 +395,264 @@ def seed_shift_assignments(conn: sqlite3.Connection, shift_ids: Dict[str, int],
 
         for item_index, base in enumerate(base_items):
             status = statuses[item_index % len(statuses)]
-            shift_id = shift_ids.get(base['shift'])
-            if not shift_id:
-                continue
-
             shift_date = week_start + timedelta(days=base['day_offset'])
             start_iso = _combine_iso(shift_date, base['start_time'])
             end_iso = _combine_iso(shift_date, base['end_time'])
             assigned_email = base['staff_email'] if status != 'open' else None
-            assigned_user = user_map.get(assigned_email) if assigned_email else None
 
             note_variants = base['note_variants']
             note_text = note_variants[(week_index + item_index) % len(note_variants)]
             note = f"{week_label} • {note_text}"
 
-            cur.execute(
-                'INSERT INTO shift_assignments (shift_id, assigned_user, shift_date, start_time, end_time, role, status, notes, schedule_week_start, created_at, updated_at) '
-                'VALUES (?,?,?,?,?,?,?,?,?,?,?)',
-                (
-                    shift_id,
-                    assigned_user,
-                    shift_date.isoformat(),
-                    start_iso,
-                    end_iso,
-                    base['role'],
-                    status,
-                    note,
-                    week_start.isoformat(),
-                    now_iso,
-                    now_iso,
-                ),
-            )
+            assignment_rows.append((
+                base['shift'],
+                assigned_email,
+                shift_date.isoformat(),
+                start_iso,
+                end_iso,
+                base['role'],
+                status,
+                note,
+                week_start.isoformat(),
+                now_iso,
+                now_iso,
+            ))
             print('Inserted shift assignment:', week_label, shift_date, '->', status)
 
-    conn.commit()
+    cur.executemany(
+        'INSERT INTO shift_assignments (shift_id, assigned_user, shift_date, start_time, end_time, role, status, notes, schedule_week_start, created_at, updated_at) '
+        'VALUES ((SELECT id FROM shifts WHERE name=? ORDER BY id LIMIT 1),(SELECT id FROM users WHERE email=?),?,?,?,?,?,?,?,?,?)',
+        assignment_rows,
+    )
 
 
-def seed_staff_availability(conn: sqlite3.Connection, *, preserve_existing: bool = False) -> None:
-    ensure_shift_schema(conn)
+def seed_staff_availability(conn: sqlite3.Connection) -> None:
+    """Replace the current week's availability with the demo pattern."""
     cur = conn.cursor()
 
     week_start = _start_of_week()
     week_end = week_start + timedelta(days=6)
-    if preserve_existing:
-        cur.execute('SELECT COUNT(*) FROM staff_availability WHERE availability_date BETWEEN ? AND ?', (week_start.isoformat(), week_end.isoformat()))
-        existing = cur.fetchone()
-        if existing and existing[0]:
-            print('Staff availability already present for current week, skipping reseed')
-            return
-    else:
-        cur.execute('DELETE FROM staff_availability WHERE availability_date BETWEEN ? AND ?', (week_start.isoformat(), week_end.isoformat()))
+    cur.execute('DELETE FROM staff_availability WHERE availability_date BETWEEN ? AND ?', (week_start.isoformat(), week_end.isoformat()))
 
     staff_patterns = {
         'sam.staff@example.com': {0: True, 1: True, 2: False, 4: True},
         'tina.staff@example.com': {0: True, 2: True, 3: True},
         'raj.staff@example.com': {1: False, 2: True, 5: True},
     }
-
-    updater_id = _lookup_user_ids(conn, ['maya.manager@example.com']).get('maya.manager@example.com')
-    staff_ids = _lookup_user_ids(conn, list(staff_patterns.keys()))
     now_iso = datetime.utcnow().isoformat()
 
+    availability_rows = []
     for email, pattern in staff_patterns.items():
-        user_id = staff_ids.get(email)
-        if not user_id:
-            continue
         for offset, available in pattern.items():
             day = week_start + timedelta(days=offset)
             notes = 'Available for shift' if available else 'Requesting time off'
-            cur.execute(
-                'INSERT OR REPLACE INTO staff_availability (user_id, availability_date, is_available, notes, updated_by, updated_at) '
-                'VALUES (?,?,?,?,?,?)',
-                (user_id, day.isoformat(), 1 if available else 0, notes, updater_id, now_iso),
-            )
+            availability_rows.append((day.isoformat(), 1 if available else 0, notes, 'maya.manager@example.com', now_iso, email))
 
-    conn.commit()
+    cur.executemany(
+        'INSERT OR REPLACE INTO staff_availability (user_id, availability_date, is_available, notes, updated_by, updated_at) '
+        'SELECT id,?,?,?,(SELECT id FROM users WHERE email=?),? FROM users WHERE email=?',
+        availability_rows,
+    )
 
-def seed_menu_items(conn, *, preserve_existing: bool = False):
+def seed_menu_items(conn):
+    """Replace the menu with the curated collection."""
     cur = conn.cursor()
-    # Get type ids
-    cur.execute('SELECT id, name FROM types')
-    types = [r[0] for r in cur.fetchall()]
-    # Reset existing items to ensure we always seed the curated collection
-    if preserve_existing and _table_has_rows(cur, 'menu_items'):
-        print('Menu items already present, skipping reseed')
-        return
-    if not preserve_existing:
-        print('Clearing existing menu items to reseed curated offerings')
-        cur.execute('DELETE FROM menu_items')
-
-    sample_items = [
-        ('Heirloom Burrata Salad', 12.5, 'Heirloom tomatoes, burrata, basil oil, balsamic pearls', 'https://images.unsplash.com/photo-1473093295043-cdd812d0e601?auto=format&fit=crop&w=1200&q=80', 18),
-        ('Housemade Mushroom Tagliatelle', 18.0, 'Hand-cut pasta, wild mushrooms, parmesan cream', 'https://images.unsplash.com/photo-1525755662778-989d0524087e?auto=format&fit=crop&w=1200&q=80', 20),
-        ('Herb-Crusted Salmon', 21.0, 'Pan-seared salmon with lemon beurre blanc and asparagus', 'https://images.unsplash.com/photo-1514516345957-556ca7d90aaf?auto=format&fit=crop&w=1200&q=80', 12),
-        ('Wood-Fired Margherita Pizza', 15.0, 'San Marzano tomatoes, fresh mozzarella, basil', 'https://images.unsplash.com/photo-1548365328-96c4a0899736?auto=format&fit=crop&w=1200&q=80', 20),
-        ('Smoked Brisket Sliders', 13.5, 'House-smoked brisket, pickled onions, brioche buns', 'https://images.unsplash.com/photo-1540396890193-eb385829f230?auto=format&fit=crop&w=1200&q=80', 24),
-        ('Lobster Bisque', 11.0, 'Silky bisque finished with cognac cream and chive oil', 'https://images.unsplash.com/photo-1481931098730-318b6f776db0?auto=format&fit=crop&w=1200&q=80', 16),
-        ('Seared Scallops', 23.0, 'Butternut puree, crispy prosciutto, brown butter crumble', 'https://images.unsplash.com/photo-1543353071-10c8ba85a904?auto=format&fit=crop&w=1200&q=80', 10),
-        ('Seasonal Roasted Vegetables', 9.0, 'Charred broccolini, rainbow carrots, smoked almonds', 'https://images.unsplash.com/photo-1604908815795-01f72b5f52ff?auto=format&fit=crop&w=1200&q=80', 22),
-        ('Passionfruit Pavlova', 9.5, 'Crisp meringue, vanilla chantilly, fresh passionfruit', 'https://images.unsplash.com/photo-1499636136210-6f4ee915583e?auto=format&fit=crop&w=1200&q=80', 15),
-        ('Tiramisu Affogato', 8.0, 'Espresso-soaked ladyfingers, mascarpone cream, espresso shot', 'https://images.unsplash.com/photo-1506443432602-ac2fcd6f54e1?auto=format&fit=crop&w=1200&q=80', 17),
-        ('Citrus Spritz Mocktail', 6.5, 'Blood orange, grapefruit, rosemary, sparkling water', 'https://images.unsplash.com/photo-1613470207930-3e9958f55d2c?auto=format&fit=crop&w=1200&q=80', 30),
-    ]
+    print('Clearing existing menu items to reseed curated offerings')
+    cur.execute('DELETE FROM menu_items')
 
-    for name, price, desc, img, qty in sample_items:
-        type_id = random.choice(types) if types else None
-        cur.execute(
-            'INSERT INTO menu_items (name,price,description,img_link,qty_left,type_id,discount) VALUES (?,?,?,?,?,?,?)',
-            (name, price, desc, img, qty, type_id, 0),
-        )
+    item_rows = []
+    for name, price, desc, img, qty in MENU_ITEMS:
+        item_rows.append((name, price, desc, img, qty, random.choice(MENU_TYPES)))
         print('Inserted menu item:', name)
-    conn.commit()
+    cur.executemany(
+        'INSERT INTO menu_items (name,price,description,img_link,qty_left,type_id,discount) '
+        'VALUES (?,?,?,?,?,(SELECT id FROM types WHERE name=?),0)',
+        item_rows,
+    )
+
+
+# One line per statement; the order is found by (member, timestamp) and the
+# price and discount are snapshotted from the menu row.
+ORDER_LINE_SQL = (
+    'INSERT INTO order_lines (order_id, item_id, qty, unit_price, discount) '
+    'SELECT o.id, m.id, ?, COALESCE(m.price, 0), COALESCE(m.discount, 0) FROM orders o, menu_items m '
+    'WHERE o.member_id=(SELECT id FROM users WHERE email=?) AND o.order_timestamp=? '
+    'AND m.id=(SELECT id FROM menu_items WHERE name=? ORDER BY id LIMIT 1)'
+)
 
 
-def seed_orders(conn, *, preserve_existing: bool = False):
+def seed_orders(conn, menu_names: List[str]):
+    """Replace order history with a few weeks of demo orders over ``menu_names``."""
     cur = conn.cursor()
-    if preserve_existing and _table_has_rows(cur, 'orders'):
-        print('Orders already present, skipping reseed')
-        return
-    if not preserve_existing:
-        cur.execute('DELETE FROM order_items')
-        cur.execute('DELETE FROM orders')
-    cur.execute("SELECT id FROM roles WHERE name='User'")
-    row = cur.fetchone()
-    user_role_id = row[0] if row else None
-    cur.execute('SELECT id FROM users WHERE role_id=? ORDER BY id', (user_role_id,))
-    user_ids = [r[0] for r in cur.fetchall()]
-
-    cur.execute('SELECT id FROM menu_items ORDER BY id')
-    item_ids = [r[0] for r in cur.fetchall()]
-    if not user_ids or not item_ids:
+    cur.execute('DELETE FROM order_lines')
+    cur.execute('DELETE FROM orders')
+
+    customer_emails = [u['email'] for u in SEED_USERS if u['role'] == 'User']
+    if not customer_emails or not menu_names:
         print('No users or menu items to create orders')
         return
 
     now = datetime.utcnow()
     base_time = now.replace(hour=11, minute=30, second=0, microsecond=0)
     week_offsets = [-3, -2, -1, 0]
-    created_orders = 0
 
-    def build_items(seed_index: int) -> List[Dict[str, int]]:
-        selections: List[Dict[str, int]] = []
+    def build_items(seed_index: int) -> List[Tuple[str, int]]:
+        selections: List[Tuple[str, int]] = []
         for offset in range(2):
-            item_id = item_ids[(seed_index + offset) % len(item_ids)]
-            quantity = (seed_index + offset) % 3 + 1
-            selections.append({'item_id': item_id, 'qty': quantity})
-        if seed_index % 2 == 0 and len(item_ids) > 2:
-            item_id = item_ids[(seed_index + 2) % len(item_ids)]
-            selections.append({'item_id': item_id, 'qty': 1})
+            name = menu_names[(seed_index + offset) % len(menu_names)]
+            selections.append((name, (seed_index + offset) % 3 + 1))
+        if seed_index % 2 == 0 and len(menu_names) > 2:
+            selections.append((menu_names[(seed_index + 2) % len(menu_names)], 1))
         return selections
 
-    for user_index, uid in enumerate(user_ids[:5]):
+    order_rows: List[Tuple[str, str]] = []
+    # Lines are keyed by (member, timestamp) instead of last_insert_rowid()
+    # so orders and their lines can be sent as two bulk statements.
+    line_rows: List[Tuple[int, str, str, str]] = []
+
+    def add_order(email: str, order_time: datetime, seed_index: int) -> None:
+        timestamp = order_time.isoformat()
+        order_rows.append((email, timestamp))
+        line_rows.extend((qty, email, timestamp, name) for name, qty in build_items(seed_index))
+
+    for user_index, email in enumerate(customer_emails[:5]):
         for week_index, offset in enumerate(week_offsets):
             order_time = base_time + timedelta(weeks=offset, days=user_index % 3, hours=week_index * 2)
-            if order_time > now:
-                continue
-            cur.execute('INSERT INTO orders (member_id, order_timestamp) VALUES (?,?)', (uid, order_time.isoformat()))
-            order_id = cur.lastrowid
-            items = build_items(user_index + week_index)
-            cur.execute('INSERT OR REPLACE INTO order_items (order_id, items) VALUES (?,?)', (order_id, json.dumps(items)))
-            created_orders += 1
-
-    weekend_users = user_ids[:3] if len(user_ids) >= 3 else user_ids
+            if order_time <= now:
+                add_order(email, order_time, user_index + week_index)
+
     for week_index, offset in enumerate(week_offsets):
-        for uid in weekend_users:
+        for user_index, email in enumerate(customer_emails[:3]):
             order_time = base_time + timedelta(weeks=offset, days=5, hours=18 + week_index)
-            if order_time > now:
-                continue
-            cur.execute('INSERT INTO orders (member_id, order_timestamp) VALUES (?,?)', (uid, order_time.isoformat()))
-            order_id = cur.lastrowid
-            seed_index = (uid + week_index) % len(item_ids)
-            items = build_items(seed_index)
-            cur.execute('INSERT OR REPLACE INTO order_items (order_id, items) VALUES (?,?)', (order_id, json.dumps(items)))
-            created_orders += 1
+            if order_time <= now:
+                add_order(email, order_time, (user_index + week_index) % len(menu_names))
 
-    conn.commit()
-    print(f'Seeded {created_orders} orders spanning {len(week_offsets)} weeks')
+    cur.executemany(
+        'INSERT INTO orders (member_id, order_timestamp) VALUES ((SELECT id FROM users WHERE email=?),?)',
+        order_rows,
+    )
+    cur.executemany(ORDER_LINE_SQL, line_rows)
+    print(f'Seeded {len(order_rows)} orders spanning {len(week_offsets)} weeks')
 
 
-def _should_reseed_assignments(conn: sqlite3.Connection) -> bool:
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) FROM shift_assignments')
-    total = cur.fetchone()
-    total_count = int(total[0]) if total and total[0] is not None else 0
+def _should_reseed_assignments(total_count: int, eligible_count: int, missing_count: int) -> bool:
     if total_count == 0:
         return True
-
-    cur.execute("SELECT COUNT(*) FROM shift_assignments WHERE status IS NULL OR LOWER(status) != 'open'")
-    eligible = cur.fetchone()
-    eligible_count = int(eligible[0]) if eligible and eligible[0] is not None else 0
     if eligible_count == 0:
         return False
+    return missing_count >= eligible_count
 
-    cur.execute(
-        "SELECT COUNT(*) FROM shift_assignments WHERE (status IS NULL OR LOWER(status) != 'open') AND (assigned_user IS NULL OR assigned_user = '')"
-    )
-    missing = cur.fetchone()
-    missing_count = int(missing[0]) if missing and missing[0] is not None else 0
 
-    return missing_count >= eligible_count
+def _seed_snapshot(conn, *, preserve_existing: bool) -> Dict[str, Any]:
+    """Read everything the seeders branch on before the first write is queued.
 
+    rqlite flushes buffered writes whenever a read goes out, so keeping the
+    reads up front lets the whole seed reach the leader as one transaction.
+    """
+    emails = [u['email'] for u in SEED_USERS]
+    week_start = _start_of_week()
+    placeholders = ','.join('?' for _ in emails)
+    users, passwords, assignments, availability, menu, orders = query_batch(conn, [
+        (f'SELECT email FROM users WHERE email IN ({placeholders})', emails),
+        ("SELECT COUNT(*) FROM users WHERE password_hash IS NULL OR password_hash = ''", None),
+        (
+            'SELECT COUNT(*), '
+            "COALESCE(SUM(CASE WHEN status IS NULL OR LOWER(status) != 'open' THEN 1 ELSE 0 END), 0), "
+            "COALESCE(SUM(CASE WHEN (status IS NULL OR LOWER(status) != 'open') "
+            "AND (assigned_user IS NULL OR assigned_user = '') THEN 1 ELSE 0 END), 0) "
+            'FROM shift_assignments',
+            None,
+        ),
+        (
+            'SELECT COUNT(*) FROM staff_availability WHERE availability_date BETWEEN ? AND ?',
+            (week_start.isoformat(), (week_start + timedelta(days=6)).isoformat()),
+        ),
+        ('SELECT name FROM menu_items ORDER BY id', None),
+        ('SELECT 1 FROM orders LIMIT 1', None),
+    ])
+
+    counts = assignments[0] if assignments else (0, 0, 0)
+    seed_menu = not preserve_existing or not menu
+    return {
+        'existing_emails': {str(row[0]) for row in users},
+        'missing_passwords': bool(passwords and passwords[0][0]),
+        'seed_assignments': not preserve_existing or _should_reseed_assignments(*(int(value or 0) for value in counts)),
+        'seed_availability': not preserve_existing or not (availability and availability[0][0]),
+        'seed_menu': seed_menu,
+        'menu_names': [name for name, *_ in MENU_ITEMS] if seed_menu else [str(row[0]) for row in menu],
+        'seed_orders': not preserve_existing or not orders,
+    }
 
-def ensure_seed_data(conn) -> None:
-    """Ensure the database has the default seed data without wiping existing rows."""
-    ensure_title_column(conn)
-    ensure_password_hash_column(conn)
-    ensure_types(conn)
-    ensure_roles(conn)
-    ensure_shift_schema(conn)
-    cleanup_legacy_schedule_data(conn)
-    update_missing_passwords(conn)
-    seed_users(conn)
-    shift_ids = seed_shift_templates(conn)
-    preserve_assignments = not _should_reseed_assignments(conn)
-    seed_shift_assignments(conn, shift_ids, preserve_existing=preserve_assignments)
-    seed_staff_availability(conn, preserve_existing=True)
-    seed_menu_items(conn, preserve_existing=True)
-    seed_orders(conn, preserve_existing=True)
+
+def seed_all(conn, *, preserve_existing: bool) -> None:
+    """Write the whole seed, plus the seed marker, as a single transaction."""
+    snapshot = _seed_snapshot(conn, preserve_existing=preserve_existing)
+    try:
+        ensure_types(conn)
+        ensure_roles(conn)
+        cleanup_legacy_schedule_data(conn)
+        if snapshot['missing_passwords']:
+            update_missing_passwords(conn)
+        seed_users(conn, snapshot['existing_emails'])
+        seed_shift_templates(conn)
+        if snapshot['seed_assignments']:
+            seed_shift_assignments(conn)
+        else:
+            print('Shift assignments already present, skipping reseed')
+        if snapshot['seed_availability']:
+            seed_staff_availability(conn)
+        else:
+            print('Staff availability already present for current week, skipping reseed')
+        if snapshot['seed_menu']:
+            seed_menu_items(conn)
+        else:
+            print('Menu items already present, skipping reseed')
+        if snapshot['seed_orders']:
+            seed_orders(conn, snapshot['menu_names'])
+        else:
+            print('Orders already present, skipping reseed')
+        set_meta(conn, SEED_MARKER, SEED_VERSION)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def is_seeded(conn) -> bool:
+    return get_meta(conn, SEED_MARKER) == SEED_VERSION
+
+
+def ensure_seed_data(conn=None) -> bool:
+    """Seed the database once across all processes; returns True if this call seeded it.
+
+    The ``app_meta`` seed marker is written in the same transaction as the seed
+    rows, and concurrent callers serialise on the schema lock, so only the
+    first process to start after a deploy does any work.
+    """
+    if conn is None:
+        conn = get_db()
+    migrate(conn)
+    if is_seeded(conn):
+        return False
+    with schema_lock(conn):
+        # Another process may have seeded while we waited for the lock.
+        if is_seeded(conn):
+            return False
+        seed_all(conn, preserve_existing=True)
+    return True
 
 def main():
+    if '--if-needed' in sys.argv[1:]:
+        print('Seeded database' if ensure_seed_data() else 'Database already seeded')
+        return
     if not os.path.exists(DB):
         print('DB not found, run init_db.py first')
         return
     conn = sqlite3.connect(DB)
-    ensure_title_column(conn)
-    ensure_password_hash_column(conn)
-    ensure_types(conn)
-    ensure_roles(conn)
-    ensure_shift_schema(conn)
-    cleanup_legacy_schedule_data(conn)
-    reset_database(conn)
-    update_missing_passwords(conn)
-    seed_users(conn)
-    shift_ids = seed_shift_templates(conn)
-    seed_shift_assignments(conn, shift_ids)
-    seed_staff_availability(conn)
-    seed_menu_items(conn)
-    seed_orders(conn)
+    migrate(conn)
+    with schema_lock(conn):
+        reset_database(conn)
+        seed_all(conn, preserve_existing=False)
     conn.close()
     print('Seeding complete')
     # Print one user per role for quick login testing
@@ -58,3 +58,57 @@ def test_login_refresh_logout_flow(client):
     assert rv.status_code == 200
     me2 = rv.get_json()
     assert me2.get('email') == email
+
+
+def _login(client, email):
+    rv = client.post('/api/auth/login', json={'email': email, 'password': 'password'})
+    assert rv.status_code == 200
+    return rv.get_json()['access_token']
+
+
+def test_role_claim_authorizes_without_role_query(app, client, monkeypatch):
+    import permissions
+    from flask_jwt_extended import decode_token
+
+    access = _login(client, 'maya.manager@example.com')
+    with app.app_context():
+        assert decode_token(access)['role'] == 'Manager'
+
+    def no_role_query(user_id):
+        raise AssertionError('role lookup should not run for a current claim')
+
+    monkeypatch.setattr(permissions, 'lookup_role', no_role_query)
+    rv = client.get('/api/schedules/staff', headers={'Authorization': f'Bearer {access}'})
+    assert rv.status_code == 200
+
+
+def test_admin_bulk_import_reports_each_row(client):
+    import uuid
+
+    admin = _login(client, 'alice.admin@example.com')
+    manager = _login(client, 'maya.manager@example.com')
+    new_email = f'import-{uuid.uuid4().hex[:8]}@example.com'
+    body = (
+        'email,password,first_name,role\n'
+        f'{new_email},s3cret,Ivy,Staff\n'
+        'maya.manager@example.com,password,Maya,Manager\n'
+        f'{new_email.upper()},other,Dup,Staff\n'
+        'no-role@example.com,password,Nora,Chef\n'
+        ',password,Blank,Staff\n'
+    )
+
+    rv = client.post('/api/auth/users/import', data=body, content_type='text/csv', headers={'Authorization': f'Bearer {manager}'})
+    assert rv.status_code == 403
+
+    rv = client.post('/api/auth/users/import', data=body, content_type='text/csv', headers={'Authorization': f'Bearer {admin}'})
+    assert rv.status_code == 200
+    report = rv.get_json()
+    assert [row['status'] for row in report['results']] == ['created', 'exists', 'exists', 'error', 'error']
+    assert (report['created'], report['exists'], report['error']) == (1, 2, 2)
+
+    rv = client.post('/api/auth/login', json={'email': new_email, 'password': 's3cret'})
+    assert rv.status_code == 200
+
+    ndjson = '{"email": "%s", "password": "x"}\nnot json\n' % new_email
+    rv = client.post('/api/auth/users/import', data=ndjson, content_type='application/x-ndjson', headers={'Authorization': f'Bearer {admin}'})
+    assert [row['status'] for row in rv.get_json()['results']] == ['exists', 'error']
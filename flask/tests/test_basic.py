@@ -22,3 +22,16 @@ def test_menu_list(client):
     assert resp.status_code == 200
     data = resp.get_json()
     assert 'items' in data
+
+
+def test_exhausted_request_budget_returns_503():
+    app = create_app({'TESTING': True, 'REQUEST_TIME_BUDGET': 0})
+    resp = app.test_client().get('/api/schedules/shifts')
+    assert resp.status_code == 503
+
+
+def test_route_budget_overrides_default():
+    app = create_app({'TESTING': True, 'REQUEST_TIME_BUDGET': 0})
+    # /api/menu/ declares its own budget, so it is unaffected by the default
+    resp = app.test_client().get('/api/menu/')
+    assert resp.status_code == 200
@@ -0,0 +1,35 @@
+import os
+import runpy
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import utils  # noqa: E402
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+def test_settings_follow_environment(monkeypatch):
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('GUNICORN_THREADS', '2')
+    monkeypatch.setenv('GUNICORN_MAX_REQUESTS', 'not-a-number')
+    conf = runpy.run_path(CONF_PATH)
+
+    assert conf['workers'] == 3
+    assert conf['threads'] == 2
+    assert conf['max_requests'] == 2000
+    assert conf['preload_app'] is True
+
+
+def test_pre_fork_drops_parent_connections(monkeypatch, tmp_path):
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'fork.db'))
+    conf = runpy.run_path(CONF_PATH)
+
+    utils.get_db()
+    utils._hedge_executor()
+    assert utils._sqlite_pools
+    conf['pre_fork'](None, None)
+
+    assert getattr(utils.conn_local, 'connection', None) is None
+    assert not utils._sqlite_pools
+    assert utils._hedge_pool is None
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'migrate.db'))
+    yield conn
+    conn.close()
+
+
+def test_migrate_applies_each_version_once(conn):
+    assert migrations.migrate(conn) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.migrate(conn) == []
+
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    assert {'title', 'password_hash'} <= columns
+    assert conn.execute('SELECT COUNT(*) FROM schema_migration_lock').fetchone()[0] == 0
+
+
+def test_migrate_waits_for_lock_held_elsewhere(conn):
+    conn.execute(
+        'CREATE TABLE schema_migration_lock (id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT NOT NULL, acquired_at REAL NOT NULL)'
+    )
+    conn.execute("INSERT INTO schema_migration_lock VALUES (1, 'other-host:1:abcd', ?)", (time.time(),))
+    conn.commit()
+
+    with pytest.raises(migrations.MigrationLockTimeout):
+        migrations.migrate(conn, lock_timeout=0.1)
+
+
+def test_migrate_takes_over_stale_lock(conn):
+    conn.execute(
+        'CREATE TABLE schema_migration_lock (id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT NOT NULL, acquired_at REAL NOT NULL)'
+    )
+    stale = time.time() - migrations.LOCK_STALE_AFTER - 1
+    conn.execute("INSERT INTO schema_migration_lock VALUES (1, 'crashed:1:abcd', ?)", (stale,))
+    conn.commit()
+
+    assert migrations.migrate(conn, lock_timeout=0.1)
+
+
+def test_order_items_json_moves_to_order_lines(conn):
+    conn.execute('CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL NOT NULL DEFAULT 0, qty_left INTEGER, discount REAL DEFAULT 0)')
+    conn.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, member_id INTEGER, order_timestamp DATETIME)')
+    conn.execute('CREATE TABLE order_items (order_id INTEGER PRIMARY KEY, items TEXT)')
+    conn.executemany('INSERT INTO menu_items (id, name, price) VALUES (?, ?, ?)', [(1, 'Soup', 4.5), (2, 'Bread', 2.0)])
+    conn.execute("INSERT INTO orders (id, member_id, order_timestamp) VALUES (1, 7, '2024-01-01 12:00:00')")
+    conn.execute(
+        'INSERT INTO order_items VALUES (1, ?)',
+        ('[{"item_id": 2, "qty": 1}, {"item_id": 1, "qty": 2}, {"item_id": 2, "qty": 2}, {"item_id": 99, "qty": 1}]',),
+    )
+    conn.commit()
+
+    migrations.migrate(conn)
+
+    lines = conn.execute('SELECT order_id, item_id, qty, unit_price FROM order_lines ORDER BY id').fetchall()
+    assert lines == [(1, 2, 3, 2.0), (1, 1, 2, 4.5), (1, None, 1, 0)]
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name='order_items'").fetchone()[0] == 'view'
+    assert conn.execute('SELECT items FROM order_items WHERE order_id=1').fetchone()[0] == (
+        '[{"item_id":2,"qty":3},{"item_id":1,"qty":2},{"item_id":null,"qty":1}]'
+    )
+
+
+def test_order_lines_are_rebuilt_to_outlive_menu_items(conn):
+    # An order_lines table as the first version of migration 9 created it.
+    migrations.migrate(conn)
+    conn.execute('DROP VIEW order_items')
+    conn.execute('DROP TABLE order_lines')
+    conn.execute('DELETE FROM schema_migrations WHERE version = 12')
+    conn.execute(migrations.ORDER_LINES_TABLE_SQL.replace('item_id INTEGER,', 'item_id INTEGER NOT NULL,').replace(' ON DELETE SET NULL', ''))
+    conn.execute(migrations.ORDER_ITEMS_VIEW_SQL)
+    conn.execute("INSERT INTO menu_items (id, name, price) VALUES (1, 'Soup', 4.5)")
+    conn.execute("INSERT INTO users (id, first_name, email) VALUES (7, 'Lee', 'lee@example.com')")
+    conn.execute("INSERT INTO orders (id, member_id) VALUES (1, 7)")
+    conn.execute('INSERT INTO order_lines (order_id, item_id, qty, unit_price) VALUES (1, 1, 2, 4.5)')
+    conn.commit()
+
+    assert migrations.migrate(conn) == [12]
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('DELETE FROM menu_items WHERE id = 1')
+    assert conn.execute('SELECT order_id, item_id, qty, unit_price FROM order_lines').fetchall() == [(1, None, 2, 4.5)]
+    assert conn.execute('SELECT items FROM order_items').fetchone()[0] == '[{"item_id":null,"qty":2}]'
@@ -1,6 +1,7 @@
 import os
 import sqlite3
 import sys
+import time
 from pathlib import Path
 
 import pytest  # type: ignore
@@ -206,3 +207,219 @@ def test_create_and_update_order(app, client, order_context):
         cur.execute('SELECT qty_left FROM menu_items WHERE id=?', (item_id,))
         qty_after_submit = cur.fetchone()['qty_left']
         assert qty_after_submit == 3
+
+
+def test_order_with_short_line_is_rejected_whole(app, client, order_context):
+    headers = order_context['headers']
+    item_id = order_context['item_id']
+
+    with app.app_context():
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute(
+            'INSERT INTO menu_items (name, price, description, qty_left) VALUES (?,?,?,?)',
+            ('Scarce Dish', 20.0, 'Only one left', 1),
+        )
+        scarce_id = cur.lastrowid
+        conn.commit()
+
+    payload = {'items': [{'item_id': item_id, 'qty': 2}, {'item_id': scarce_id, 'qty': 2}]}
+    resp = client.post('/api/orders/', json=payload, headers=headers)
+    assert resp.status_code == 409
+    assert resp.get_json()['msg'] == 'Not enough stock for Scarce Dish'
+
+    with app.app_context():
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute('SELECT id, qty_left FROM menu_items WHERE id IN (?, ?) ORDER BY id', (item_id, scarce_id))
+        assert [row['qty_left'] for row in cur.fetchall()] == [5, 1]
+        cur.execute('SELECT COUNT(*) FROM orders')
+        assert cur.fetchone()[0] == 0
+
+    resp = client.post('/api/orders/', json={'items': [{'item_id': scarce_id, 'qty': 1}]}, headers=headers)
+    assert resp.status_code == 201
+    order_id = resp.get_json()['order_id']
+    resp = client.patch(f'/api/orders/{order_id}/items/{scarce_id}', json={'operation': 'increment', 'qty': 1}, headers=headers)
+    assert resp.status_code == 409
+
+
+def test_deleting_an_ordered_menu_item_keeps_the_order(app, client, order_context):
+    item_id = order_context['item_id']
+    resp = client.post('/api/orders/', json={'items': [{'item_id': item_id, 'qty': 2}]}, headers=order_context['headers'])
+    order_id = resp.get_json()['order_id']
+
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT OR IGNORE INTO roles (name) VALUES ('Manager')")
+        conn.execute("UPDATE users SET role_id=(SELECT id FROM roles WHERE name='Manager') WHERE id=?", (order_context['user_id'],))
+        conn.commit()
+    token = client.post('/api/auth/login', json={'email': 'tester@example.com', 'password': 'test-password'}).get_json()['access_token']
+
+    resp = client.delete(f'/api/menu/{item_id}', headers={'Authorization': f'Bearer {token}'})
+    assert resp.status_code == 200
+
+    order = client.get(f'/api/orders/{order_id}', headers=order_context['headers']).get_json()
+    assert [(line['item_id'], line['qty'], line['price']) for line in order['items']] == [(None, 2, 12.5)]
+
+
+def test_order_history_pages_by_keyset(app, client, order_context):
+    headers = order_context['headers']
+    item_id = order_context['item_id']
+    user_id = order_context['user_id']
+
+    timestamps = ['2024-01-01 10:00:00', '2024-01-02 10:00:00', '2024-01-02 10:00:00', '2024-01-03 10:00:00', '2024-01-04 10:00:00']
+    with app.app_context():
+        conn = get_db()
+        cur = conn.cursor()
+        for qty, timestamp in enumerate(timestamps, start=1):
+            cur.execute('INSERT INTO orders (member_id, order_timestamp) VALUES (?, ?)', (user_id, timestamp))
+            cur.execute(
+                'INSERT INTO order_lines (order_id, item_id, qty, unit_price) VALUES (?, ?, ?, 12.5)',
+                (cur.lastrowid, item_id, qty),
+            )
+        conn.commit()
+        cur.execute('SELECT id FROM orders ORDER BY order_timestamp DESC, id DESC')
+        expected = [row['id'] for row in cur.fetchall()]
+
+    seen = []
+    cursor = None
+    while True:
+        query = '/api/orders?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        resp = client.get(query, headers=headers)
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data['count'] <= 2
+        for order in data['orders']:
+            assert [item['item_id'] for item in order['items']] == [item_id]
+        seen.extend(order['order_id'] for order in data['orders'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == expected
+    assert client.get('/api/orders?cursor=not-a-cursor', headers=headers).status_code == 400
+
+
+def test_cart_holds_stock_until_submit(app, client, order_context):
+    headers = order_context['headers']
+    item_id = order_context['item_id']
+    now = time.time()
+
+    with app.app_context():
+        conn = get_db()
+        # Another member holds 2 of the 5 in stock; a lapsed hold counts for nothing.
+        conn.execute('INSERT INTO users (first_name, email) VALUES (?, ?)', ('Other', 'other@example.com'))
+        conn.execute(
+            'INSERT INTO cart_reservations (member_id, item_id, qty, reserved_until) '
+            "SELECT id, ?, 2, ? FROM users WHERE email='other@example.com'",
+            (item_id, now + 600),
+        )
+        conn.commit()
+
+    resp = client.patch(f'/api/orders/cart/items/{item_id}', json={'operation': 'increment', 'qty': 3}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert [(line['item_id'], line['qty'], line['reserved']) for line in body['items']] == [(item_id, 3, True)]
+
+    resp = client.patch(f'/api/orders/cart/items/{item_id}', json={'operation': 'increment'}, headers=headers)
+    assert resp.status_code == 409
+    resp = client.patch(f'/api/orders/cart/items/{item_id}', json={'operation': 'decrement'}, headers=headers)
+    assert resp.get_json()['items'][0]['qty'] == 2
+
+    with app.app_context():
+        conn = get_db()
+        assert conn.execute('SELECT qty_left FROM menu_items WHERE id=?', (item_id,)).fetchone()[0] == 5
+        assert conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == 0
+
+    resp = client.post('/api/orders/cart/submit', headers=headers)
+    assert resp.status_code == 201
+    order = resp.get_json()
+    assert order['status'] == 'submitted'
+    assert [(line['item_id'], line['qty'], line['price']) for line in order['items']] == [(item_id, 2, 12.5)]
+
+    assert client.get('/api/orders/cart', headers=headers).get_json()['items'] == []
+    assert client.post('/api/orders/cart/submit', headers=headers).status_code == 400
+    with app.app_context():
+        assert get_db().execute('SELECT qty_left FROM menu_items WHERE id=?', (item_id,)).fetchone()[0] == 3
+
+
+def test_abandoned_carts_are_swept(app, order_context):
+    import cart
+
+    user_id = order_context['user_id']
+    with app.app_context():
+        conn = get_db()
+        conn.execute(
+            'INSERT INTO cart_reservations (member_id, item_id, qty, reserved_until) VALUES (?, ?, 1, ?)',
+            (user_id, order_context['item_id'], time.time() + 600),
+        )
+        conn.commit()
+        assert cart.sweep_abandoned(conn) == 0
+        assert cart.sweep_abandoned(conn, now=time.time() + app.config['CART_ABANDON_AFTER'] + 1) == 1
+        assert conn.execute('SELECT COUNT(*) FROM cart_reservations').fetchone()[0] == 0
+
+
+def test_refused_reserve_leaves_other_holds_alone(app, order_context):
+    import cart
+
+    user_id = order_context['user_id']
+    held_until = time.time() + 60
+    with app.app_context():
+        conn = get_db()
+        conn.execute('INSERT INTO menu_items (name, price, qty_left) VALUES (?, ?, ?)', ('Side', 3.0, 10))
+        side_id = conn.execute("SELECT id FROM menu_items WHERE name='Side'").fetchone()[0]
+        conn.execute(
+            'INSERT INTO cart_reservations (member_id, item_id, qty, reserved_until) VALUES (?, ?, 1, ?)',
+            (user_id, side_id, held_until),
+        )
+        conn.commit()
+
+        assert cart.reserve(conn, user_id, order_context['item_id'], 6) is False
+        rows = conn.execute('SELECT item_id, reserved_until FROM cart_reservations WHERE member_id=?', (user_id,)).fetchall()
+        assert [(row[0], row[1]) for row in rows] == [(side_id, held_until)]
+
+        assert cart.reserve(conn, user_id, order_context['item_id'], 2) is True
+        assert conn.execute(
+            'SELECT reserved_until FROM cart_reservations WHERE member_id=? AND item_id=?', (user_id, side_id)
+        ).fetchone()[0] > held_until
+
+
+def test_batch_orders_apply_what_stock_allows(app, client, order_context):
+    headers = order_context['headers']
+    item_id = order_context['item_id']
+
+    payload = {'orders': [
+        {'ref': 'a', 'items': [{'item_id': item_id, 'qty': 3}], 'order_timestamp': '2024-05-01T12:30:00'},
+        {'ref': 'b', 'items': [{'item_id': item_id, 'qty': 3}]},
+        {'ref': 'c', 'items': [{'item_id': 999999, 'qty': 1}]},
+        {'ref': 'd', 'items': []},
+        {'ref': 'e', 'items': [{'item_id': item_id, 'qty': 2}]},
+    ]}
+    resp = client.post('/api/orders/batch', json=payload, headers=headers)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['created'], body['rejected']) == (2, 3)
+    assert [(result['ref'], result['status']) for result in body['results']] == [
+        ('a', 'created'), ('b', 'rejected'), ('c', 'rejected'), ('d', 'rejected'), ('e', 'created'),
+    ]
+    assert body['results'][1]['msg'] == 'Not enough stock for Test Dish'
+    assert body['results'][2]['msg'] == 'Menu item(s) not found: 999999'
+
+    first = client.get(f"/api/orders/{body['results'][0]['order_id']}", headers=headers).get_json()
+    assert first['order_timestamp'] == '2024-05-01 12:30:00'
+    assert [(line['item_id'], line['qty']) for line in first['items']] == [(item_id, 3)]
+    with app.app_context():
+        assert get_db().execute('SELECT qty_left FROM menu_items WHERE id=?', (item_id,)).fetchone()[0] == 0
+
+    assert client.post('/api/orders/batch', json={'orders': [{'items': [{'item_id': item_id}]}] * 201}, headers=headers).status_code == 413
+
+
+def test_order_timestamps_are_normalised_to_utc():
+    from orders import _parse_order_timestamp
+
+    assert _parse_order_timestamp('2024-05-01T12:30:00Z') == '2024-05-01 12:30:00'
+    assert _parse_order_timestamp('2024-05-01T14:30:00+02:00') == '2024-05-01 12:30:00'
+    assert _parse_order_timestamp('2024-05-01T12:30:00') == '2024-05-01 12:30:00'
+    assert _parse_order_timestamp('') is None
+    with pytest.raises(ValueError):
+        _parse_order_timestamp('yesterday')
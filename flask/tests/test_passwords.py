@@ -0,0 +1,83 @@
+import binascii
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import password_pool  # noqa: E402
+import utils  # noqa: E402
+from api import create_app  # noqa: E402
+
+
+def _legacy_hash(password):
+    salt = os.urandom(16)
+    return binascii.hexlify(salt + hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100_000)).decode('ascii')
+
+
+@pytest.fixture
+def app(tmp_path):
+    password_pool.shutdown()
+    app = create_app({'TESTING': True, 'DB_PATH': str(tmp_path / 'passwords.db'), 'PASSWORD_HASH_QUEUE': 1, 'PASSWORD_HASH_WAIT': 0})
+    yield app
+    password_pool.shutdown()
+
+
+def test_hash_scheme_is_detected_from_format():
+    legacy = _legacy_hash('secret')
+    assert utils.hash_scheme(legacy) == 'pbkdf2_legacy'
+    assert utils.hash_scheme('$2b$12$' + 'a' * 53) == 'bcrypt'
+    assert utils.hash_scheme('pbkdf2_sha256$100000$00$00') == 'pbkdf2_sha256'
+    assert utils.hash_scheme('plaintext') is None
+
+    assert utils.verify_password('secret', legacy)
+    assert not utils.verify_password('wrong', legacy)
+    assert not utils.verify_password('secret', 'plaintext')
+
+
+def test_login_upgrades_legacy_hash(app):
+    with app.app_context():
+        conn = utils.get_db()
+        conn.execute("INSERT INTO users (first_name, email, password_hash) VALUES ('Lee', 'lee@example.com', ?)", (_legacy_hash('secret'),))
+        conn.commit()
+
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'email': 'lee@example.com', 'password': 'wrong'}).status_code == 401
+    assert client.post('/api/auth/login', json={'email': 'lee@example.com', 'password': 'secret'}).status_code == 200
+
+    with app.app_context():
+        stored = utils.get_db().execute("SELECT password_hash FROM users WHERE email='lee@example.com'").fetchone()[0]
+    assert not utils.needs_rehash(stored)
+    assert client.post('/api/auth/login', json={'email': 'lee@example.com', 'password': 'secret'}).status_code == 200
+
+
+def test_pbkdf2_hash_is_kept_when_bcrypt_backend_is_broken(monkeypatch):
+    class BrokenBcrypt:
+        @staticmethod
+        def using(**kwargs):
+            raise RuntimeError('bcrypt backend unavailable')
+
+    monkeypatch.setattr(utils, 'bcrypt_handler', lambda: BrokenBcrypt)
+    stored = utils.hash_password('secret')
+    assert utils.hash_scheme(stored) == 'pbkdf2_sha256'
+    assert utils.verify_and_upgrade('secret', stored) == (True, None)
+
+    ok, upgraded = utils.verify_and_upgrade('secret', _legacy_hash('secret'))
+    assert ok and utils.hash_scheme(upgraded) == 'pbkdf2_sha256'
+
+
+def test_login_returns_429_when_hashing_queue_is_full(app):
+    with app.app_context():
+        conn = utils.get_db()
+        conn.execute("INSERT INTO users (first_name, email, password_hash) VALUES ('Lee', 'lee@example.com', ?)", (_legacy_hash('secret'),))
+        conn.commit()
+        password_pool.start()
+    assert password_pool._slots.acquire(timeout=0)
+    try:
+        rv = app.test_client().post('/api/auth/login', json={'email': 'lee@example.com', 'password': 'secret'})
+    finally:
+        password_pool._slots.release()
+    assert rv.status_code == 429
+    assert rv.headers['Retry-After'] == '1'
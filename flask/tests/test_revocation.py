@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import migrations  # noqa: E402
+from api import create_app  # noqa: E402
+from revocation import RevokedTokenIndex, prune_expired  # noqa: E402
+from utils import get_db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'TESTING': True, 'DB_PATH': str(tmp_path / 'revocation.db'), 'REVOCATION_SYNC_INTERVAL': 0})
+    with app.app_context():
+        yield app
+
+
+def _revoke(conn, jti, expires_at):
+    conn.execute('INSERT INTO revoked_tokens (jti, expires_at) VALUES (?, ?)', (jti, expires_at))
+    conn.commit()
+
+
+def test_index_syncs_new_revocations_and_ignores_expired(app):
+    conn = get_db()
+    index = RevokedTokenIndex()
+    now = int(time.time())
+    _revoke(conn, 'live', now + 600)
+    _revoke(conn, 'expired', now - 1)
+
+    assert index.is_revoked('live')
+    assert not index.is_revoked('expired')
+    assert not index.is_revoked('other')
+
+    _revoke(conn, 'other', now + 600)
+    assert index.is_revoked('other')
+
+    index.add('local', now - 1)
+    assert not index.is_revoked('local')
+
+
+def test_prune_expired_deletes_only_expired_rows(app):
+    conn = get_db()
+    now = int(time.time())
+    _revoke(conn, 'live', now + 600)
+    _revoke(conn, 'expired', now - 1)
+
+    assert prune_expired(conn) == 1
+    assert [row[0] for row in conn.execute('SELECT jti FROM revoked_tokens').fetchall()] == ['live']
+
+
+def test_migration_converts_legacy_revoked_tokens(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'legacy.db'))
+    conn.execute(
+        'CREATE TABLE revoked_tokens (jti TEXT PRIMARY KEY, token_type TEXT, user_identity INTEGER, '
+        "revoked_at DATETIME DEFAULT (datetime('now')))"
+    )
+    conn.execute("INSERT INTO revoked_tokens (jti, token_type, user_identity) VALUES ('old', 'access', 1)")
+    conn.commit()
+
+    migrations.migrate(conn)
+
+    row = conn.execute('SELECT id, jti, expires_at FROM revoked_tokens').fetchone()
+    assert row[0] == 1 and row[1] == 'old'
+    assert row[2] > time.time() + migrations.LEGACY_REVOCATION_TTL - 60
+    conn.close()
@@ -0,0 +1,476 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from utils import (  # noqa: E402
+    DeadlineExceeded,
+    RqliteConnection,
+    RqliteError,
+    RqliteHealthTable,
+    RqliteTopology,
+    clear_request_deadline,
+    conn_local,
+    query_batch,
+    read_consistency,
+    release_db,
+    set_request_deadline,
+    stream_rows,
+)
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    """Records rqlite HTTP calls and answers them from a handler function."""
+
+    def __init__(self, handler, leader=None):
+        self.handler = handler
+        self.leader = leader
+        self.calls = []
+        self.status_calls = []
+
+    def get(self, url, timeout=None):
+        self.status_calls.append(url)
+        base = url.rsplit('/status', 1)[0]
+        state = 'Leader' if base == self.leader else 'Follower'
+        return FakeResponse({'store': {'raft': {'state': state}}})
+
+    def post(self, url, params=None, json=None, timeout=None):
+        self.calls.append({'url': url, 'params': params, 'json': json, 'timeout': timeout})
+        return FakeResponse(self.handler(url, json))
+
+    def close(self):
+        return None
+
+
+def _is_select(statements):
+    first = statements[0]
+    sql = first[0] if isinstance(first, list) else first
+    return sql.upper().startswith('SELECT')
+
+
+def _write_results(statements):
+    return {'results': [{'rows_affected': 1, 'last_insert_id': 100 + index} for index, _ in enumerate(statements)]}
+
+
+@pytest.fixture
+def conn():
+    connection = RqliteConnection(['http://node-1:4001'])
+
+    def handler(url, statements):
+        if _is_select(statements):
+            return {'results': [{'columns': ['id', 'name'], 'values': [[1, 'Soup']]}]}
+        return _write_results(statements)
+
+    connection._session = FakeSession(handler)
+    return connection
+
+
+def test_writes_are_buffered_until_commit(conn):
+    order_cur = conn.cursor()
+    order_cur.execute('INSERT INTO orders (member_id) VALUES (?)', (7,))
+    conn.execute('UPDATE menu_items SET qty_left=? WHERE id=?', (3, 1))
+    assert conn._session.calls == []
+
+    conn.commit()
+
+    assert len(conn._session.calls) == 1
+    call = conn._session.calls[0]
+    assert call['url'] == 'http://node-1:4001/db/request?transaction'
+    assert call['json'] == [
+        ['INSERT INTO orders (member_id) VALUES (?)', 7],
+        ['UPDATE menu_items SET qty_left=? WHERE id=?', 3, 1],
+    ]
+    assert order_cur.lastrowid == 100
+    assert order_cur.rowcount == 1
+
+
+def test_rollback_discards_buffer(conn):
+    conn.execute('DELETE FROM orders')
+    conn.rollback()
+    conn.commit()
+    assert conn._session.calls == []
+
+
+def test_uncommitted_writes_end_with_the_request(conn):
+    conn_local.connection = conn
+    try:
+        conn.execute('DELETE FROM orders')
+        release_db()
+        conn.execute('SELECT id, name FROM menu_items').fetchall()
+    finally:
+        del conn_local.connection
+    assert [call['json'] for call in conn._session.calls] == [['SELECT id, name FROM menu_items']]
+
+
+def test_reads_flush_pending_writes(conn):
+    conn.execute('UPDATE menu_items SET name=? WHERE id=?', ('Soup', 1))
+    row = conn.execute('SELECT id, name FROM menu_items WHERE id=?', (1,)).fetchone()
+
+    assert [call['url'] for call in conn._session.calls] == [
+        'http://node-1:4001/db/request',
+        'http://node-1:4001/db/request',
+    ]
+    assert row['name'] == 'Soup'
+    assert row[0] == 1
+
+
+def test_rows_share_one_column_index(conn):
+    conn._session.handler = lambda url, statements: {
+        'results': [{'columns': ['id', 'name'], 'values': [[1, 'Soup'], [2, 'Salad']]}]
+    }
+    cur = conn.execute('SELECT id, name FROM menu_items')
+    first = cur.fetchone()
+    rest = cur.fetchall()
+
+    assert first._result is rest[0]._result
+    assert dict(first) == {'id': 1, 'name': 'Soup'}
+    assert rest[0]['name'] == 'Salad' and rest[0][0] == 2
+    assert rest[0].get('missing') is None
+    assert cur.fetchall() == []
+
+
+def test_fetchmany_walks_the_result(conn):
+    conn._session.handler = lambda url, statements: {
+        'results': [{'columns': ['id'], 'values': [[1], [2], [3]]}]
+    }
+    cur = conn.execute('SELECT id FROM menu_items')
+    assert [row['id'] for row in cur.fetchmany(2)] == [1, 2]
+    assert [row['id'] for row in cur.fetchmany(2)] == [3]
+    assert cur.fetchmany(2) == []
+
+
+def test_stream_rows_pages_by_key(conn):
+    table = [[order_id, f'2024-01-0{order_id}'] for order_id in range(1, 6)]
+
+    def handler(url, statements):
+        sql, *params = statements[0]
+        limit = params[-1]
+        after = params[-2] if 'WHERE id > ?' in sql else 0
+        page = [row for row in table if row[0] > after][:limit]
+        return {'results': [{'columns': ['id', 'order_timestamp'], 'values': page}]}
+
+    conn._session.handler = handler
+    rows = list(stream_rows(conn, 'SELECT id, order_timestamp FROM orders WHERE member_id = ?', (7,), page_size=2))
+
+    assert [row['id'] for row in rows] == [1, 2, 3, 4, 5]
+    assert len(conn._session.calls) == 3
+    assert conn._session.calls[1]['json'][0][1:] == [7, 2, 2]
+
+
+def test_executemany_sends_bulk_chunks(conn):
+    conn._bulk_size = 2
+    cur = conn.executemany('INSERT INTO types (name) VALUES (?)', [('Main',), ('Dessert',), ('Beverage',)])
+    assert conn._session.calls == []
+
+    conn.commit()
+
+    assert [call['url'] for call in conn._session.calls] == [
+        'http://node-1:4001/db/request?transaction',
+        'http://node-1:4001/db/request',
+    ]
+    assert conn._session.calls[0]['json'] == [
+        ['INSERT INTO types (name) VALUES (?)', 'Main'],
+        ['INSERT INTO types (name) VALUES (?)', 'Dessert'],
+    ]
+    assert cur.rowcount == 3
+    assert cur.lastrowid is None
+
+
+def test_mixed_buffer_commits_as_one_transaction():
+    connection = RqliteConnection(['http://node-1:4001'], bulk_size=2)
+
+    def handler(url, statements):
+        # The stock update is the last statement, past the first bulk_size chunk.
+        if any('qty_left' in statement[0] for statement in statements):
+            return {'results': [{'rows_affected': 1}] * (len(statements) - 1) + [{'error': 'insufficient stock'}]}
+        return _write_results(statements)
+
+    connection._session = FakeSession(handler)
+    for order in range(2):
+        connection.execute('INSERT INTO orders (member_id) VALUES (?)', (7,))
+        connection.executemany('INSERT INTO order_lines (order_id, item_id, qty) VALUES (?, ?, ?)', [(order, 1, 1), (order, 2, 1)])
+    connection.execute('UPDATE menu_items SET qty_left = qty_left - ? WHERE id=?', (4, 1))
+
+    with pytest.raises(RqliteError):
+        connection.commit()
+    assert [call['url'] for call in connection._session.calls] == ['http://node-1:4001/db/request?transaction']
+    assert len(connection._session.calls[0]['json']) == 7
+
+
+def test_executemany_rejects_queries(conn):
+    with pytest.raises(RqliteError):
+        conn.executemany('SELECT id FROM types WHERE id=?', [(1,)])
+
+
+def test_query_batch_sends_one_request(conn):
+    conn._session.handler = lambda url, statements: {
+        'results': [
+            {'columns': ['name'], 'values': [['Admin'], ['Staff']]},
+            {'columns': ['id', 'price'], 'values': [[1, 9.5]]},
+        ]
+    }
+    conn.execute('UPDATE menu_items SET price=? WHERE id=?', (9.5, 1))
+    roles, items = query_batch(conn, [
+        ('SELECT name FROM roles', None),
+        ('SELECT id, price FROM menu_items WHERE id=?', (1,)),
+    ])
+
+    assert [call['url'] for call in conn._session.calls] == [
+        'http://node-1:4001/db/request',
+        'http://node-1:4001/db/request',
+    ]
+    assert conn._session.calls[1]['json'] == ['SELECT name FROM roles', ['SELECT id, price FROM menu_items WHERE id=?', 1]]
+    assert [row['name'] for row in roles] == ['Admin', 'Staff']
+    assert items[0]['price'] == 9.5
+
+
+def test_returning_rows_come_back_from_the_write(conn):
+    conn._session.handler = lambda url, statements: {
+        'results': [{'columns': ['id', 'price'], 'values': [[1, 9.5]], 'rows_affected': 1}]
+    }
+    cur = conn.execute('UPDATE menu_items SET price=? WHERE id=? RETURNING id, price', (9.5, 1))
+    assert conn._session.calls == []
+
+    row = cur.fetchone()
+
+    assert len(conn._session.calls) == 1
+    assert row['price'] == 9.5
+    assert cur.rowcount == 1
+    assert not conn.in_transaction
+
+
+def test_cte_writes_are_buffered_like_writes(conn):
+    conn.execute('WITH stale AS (SELECT id FROM carts WHERE updated_at < ?) DELETE FROM carts WHERE id IN stale', (1,))
+    conn.execute('WITH s AS (SELECT 1) UPDATE menu_items SET price=2 WHERE id IN s RETURNING id')
+    assert conn._session.calls == []
+    assert conn.in_transaction
+
+    conn.rollback()
+    conn.execute("WITH recent AS (SELECT id, updated_at FROM orders) SELECT replace(name, 'a', 'b') FROM recent").fetchall()
+    assert conn._session.calls[0]['url'] == 'http://node-1:4001/db/request'
+
+
+def test_lastrowid_access_flushes_buffer(conn):
+    cur = conn.cursor()
+    cur.execute('INSERT INTO types (name) VALUES (?)', ('Main',))
+    assert cur.lastrowid == 100
+    assert len(conn._session.calls) == 1
+    assert not conn.in_transaction
+
+
+def test_statement_error_fails_whole_batch(conn):
+    conn._session.handler = lambda url, statements: {'results': [{}, {'error': 'UNIQUE constraint failed'}]}
+    conn.execute('INSERT INTO roles (name) VALUES (?)', ('Admin',))
+    conn.execute('INSERT INTO roles (name) VALUES (?)', ('Admin',))
+
+    with pytest.raises(RqliteError, match='UNIQUE constraint failed'):
+        conn.commit()
+    assert not conn.in_transaction
+
+
+@pytest.fixture
+def cluster():
+    connection = RqliteConnection(
+        ['http://node-1:4001', 'http://node-2:4001', 'http://node-3:4001'],
+        read_consistency='strong',
+    )
+
+    def handler(url, statements):
+        if _is_select(statements):
+            return {'results': [{'columns': ['id'], 'values': [[1]]}]}
+        return _write_results(statements)
+
+    connection._session = FakeSession(handler, leader='http://node-2:4001')
+    return connection
+
+
+def test_writes_and_strong_reads_go_to_leader(cluster):
+    cluster.execute('UPDATE menu_items SET qty_left=? WHERE id=?', (2, 1))
+    cluster.commit()
+    cluster.execute('SELECT id FROM menu_items').fetchall()
+
+    assert [call['url'] for call in cluster._session.calls] == [
+        'http://node-2:4001/db/request',
+        'http://node-2:4001/db/request',
+    ]
+    assert cluster._session.calls[1]['params'] == {'level': 'strong'}
+    # topology is cached between requests
+    assert len(cluster._session.status_calls) == 3
+
+
+def test_connections_share_one_leader_lookup():
+    urls = ['http://node-1:4001', 'http://node-2:4001']
+    topology = RqliteTopology()
+    session = FakeSession(lambda url, statements: _write_results(statements), leader='http://node-2:4001')
+    connections = [RqliteConnection(urls, topology=topology) for _ in range(3)]
+    for connection in connections:
+        connection._session = session
+        connection.execute('DELETE FROM staff_notifications')
+        connection.commit()
+
+    assert len(session.status_calls) == 2
+    assert {call['url'] for call in session.calls} == {'http://node-2:4001/db/request'}
+
+
+def test_none_reads_prefer_followers(cluster):
+    with read_consistency(cluster, 'none'):
+        cluster.execute('SELECT id FROM menu_items').fetchall()
+    cluster.execute('SELECT id FROM menu_items').fetchall()
+
+    first, second = cluster._session.calls
+    assert first['url'] != 'http://node-2:4001/db/request'
+    assert first['params'] == {'level': 'none'}
+    assert second['url'] == 'http://node-2:4001/db/request'
+    assert second['params'] == {'level': 'strong'}
+
+
+def test_health_table_ejects_and_probes():
+    health = RqliteHealthTable(failure_threshold=2, cooldown=0.0)
+    url = 'http://node-1:4001'
+
+    health.record_failure(url)
+    assert health.is_available(url)
+    health.record_failure(url)
+
+    # cooldown of zero means the node is immediately half-open: one probe allowed
+    assert health.is_available(url)
+    health.begin(url)
+    assert not health.is_available(url)
+    health.record_success(url, 0.05)
+    assert health.is_available(url)
+    assert health.latency(url) == pytest.approx(0.05)
+
+
+def test_failing_node_is_skipped_after_ejection():
+    urls = ['http://node-1:4001', 'http://node-2:4001']
+    health = RqliteHealthTable(failure_threshold=1, cooldown=60.0)
+    connection = RqliteConnection(urls, health=health)
+    # node-2 has a slow history, so the fast-but-hung node-1 is tried first
+    health.record_success('http://node-2:4001', 1.0)
+
+    def handler(url, statements):
+        if url.startswith('http://node-1:4001'):
+            raise ConnectionError('node hung')
+        return {'results': [{'columns': ['id'], 'values': [[1]]}]}
+
+    connection._session = FakeSession(handler, leader='http://node-1:4001')
+    connection._session.get = lambda url, timeout=None: FakeResponse({'store': {'raft': {'state': 'Follower'}}})
+    connection.execute('SELECT id FROM menu_items').fetchall()
+    connection.execute('SELECT id FROM menu_items').fetchall()
+
+    contacted = [call['url'] for call in connection._session.calls]
+    assert contacted.count('http://node-1:4001/db/request') == 1
+    assert contacted[-1] == 'http://node-2:4001/db/request'
+    assert not health.is_available('http://node-1:4001')
+
+
+def test_slow_read_is_hedged_to_second_node():
+    urls = ['http://node-1:4001', 'http://node-2:4001']
+    health = RqliteHealthTable()
+    for _ in range(30):
+        health.record_success('http://node-2:4001', 0.01, read=True)
+    connection = RqliteConnection(urls, health=health, hedge_percentile=95)
+
+    def handler(url, statements):
+        if url.startswith('http://node-1:4001'):
+            time.sleep(0.5)
+            return {'results': [{'columns': ['node'], 'values': [['slow']]}]}
+        return {'results': [{'columns': ['node'], 'values': [['fast']]}]}
+
+    connection._session = FakeSession(handler)
+    connection._session.get = lambda url, timeout=None: FakeResponse({'store': {'raft': {'state': 'Follower'}}})
+
+    started = time.monotonic()
+    row = connection.execute('SELECT node FROM nodes').fetchone()
+
+    assert row['node'] == 'fast'
+    assert time.monotonic() - started < 0.4
+    assert {call['url'] for call in connection._session.calls} == {
+        'http://node-1:4001/db/request',
+        'http://node-2:4001/db/request',
+    }
+
+
+def test_stuck_hedged_read_gives_up_at_the_call_timeout():
+    urls = ['http://node-1:4001', 'http://node-2:4001']
+    health = RqliteHealthTable()
+    for _ in range(30):
+        health.record_success('http://node-2:4001', 0.01, read=True)
+    connection = RqliteConnection(urls, health=health, hedge_percentile=95, timeout=0.2)
+
+    def handler(url, statements):
+        time.sleep(0.6)  # the fake session ignores the HTTP timeout, like a starved pool thread
+        return {'results': [{'columns': ['node'], 'values': [['late']]}]}
+
+    connection._session = FakeSession(handler)
+    connection._session.get = lambda url, timeout=None: FakeResponse({'store': {'raft': {'state': 'Follower'}}})
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        connection.execute('SELECT node FROM nodes').fetchall()
+    assert time.monotonic() - started < 0.5
+
+
+def test_writes_are_never_hedged():
+    health = RqliteHealthTable()
+    for _ in range(30):
+        health.record_success('http://node-1:4001', 0.0, read=True)
+    connection = RqliteConnection(['http://node-1:4001', 'http://node-2:4001'], health=health, hedge_percentile=50)
+
+    def handler(url, statements):
+        time.sleep(0.05)
+        return _write_results(statements)
+
+    connection._session = FakeSession(handler)
+    connection.execute('DELETE FROM staff_notifications')
+    connection.commit()
+    assert len(connection._session.calls) == 1
+
+
+def test_request_budget_caps_call_timeout(conn):
+    set_request_deadline(0.5)
+    try:
+        conn.execute('SELECT id, name FROM menu_items').fetchall()
+        assert conn._session.calls[0]['timeout'] <= 0.5
+
+        set_request_deadline(0)
+        with pytest.raises(DeadlineExceeded):
+            conn.execute('SELECT id, name FROM menu_items')
+        assert len(conn._session.calls) == 1
+    finally:
+        clear_request_deadline()
+
+
+def test_budget_timeout_frees_the_probe_slot():
+    import requests
+
+    health = RqliteHealthTable(failure_threshold=1, cooldown=0.0)
+    url = 'http://node-1:4001'
+    health.record_failure(url)
+    connection = RqliteConnection([url], health=health)
+
+    def handler(url, statements):
+        raise requests.exceptions.ReadTimeout('budget ran out')
+
+    connection._session = FakeSession(handler)
+    set_request_deadline(0.5)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            connection.execute('SELECT id FROM menu_items').fetchall()
+    finally:
+        clear_request_deadline()
+    assert health.is_available(url)
@@ -122,6 +122,10 @@ def test_staff_can_view_and_update_own_availability(client):
     rv = client.put('/api/schedules/availability', json=reset_payload, headers={'Authorization': f'Bearer {staff_token}'})
     assert rv.status_code == 200
 
+    oversized = {'entries': [{'date': target_entry['date'], 'is_available': True}] * 367}
+    rv = client.put('/api/schedules/availability', json=oversized, headers={'Authorization': f'Bearer {staff_token}'})
+    assert rv.status_code == 413
+
 
 def test_staff_cannot_update_other_users(client):
     staff_token = login(client, 'sam.staff@example.com')
@@ -401,3 +405,43 @@ def test_staff_receives_notification_on_assignment_update(client):
         for note in list_notifications(client, staff_token, include_ack=True):
             if int(note.get('assignment_id') or 0) == assignment_id:
                 acknowledge_notification(client, staff_token, note['id'])
+
+
+def test_recurring_assignment_creates_each_week_with_notifications(client):
+    staff_token = login(client, 'tina.staff@example.com')
+    staff_profile = get_profile(client, staff_token)
+    manager_token = login(client, 'maya.manager@example.com')
+
+    for note in list_notifications(client, staff_token, include_ack=True):
+        acknowledge_notification(client, staff_token, note['id'])
+
+    target_date = _next_monday(weeks_ahead=8)
+    week_start = target_date - timedelta(days=target_date.weekday())
+
+    created_ids = create_assignment(
+        client,
+        manager_token,
+        {
+            'week_start': week_start.isoformat(),
+            'shift_date': target_date.isoformat(),
+            'start_time': '09:00',
+            'end_time': '15:00',
+            'staff_id': staff_profile['id'],
+            'role': 'Server',
+            'status': 'scheduled',
+            'repeat_weeks': 2,
+        },
+    )
+
+    try:
+        assert len(created_ids) == 3
+        assert created_ids == sorted(created_ids)
+        notifications = list_notifications(client, staff_token)
+        notified = {int(note.get('assignment_id') or 0) for note in notifications}
+        assert set(created_ids) <= notified
+    finally:
+        for assignment_id in created_ids:
+            delete_assignment(client, manager_token, assignment_id)
+        for note in list_notifications(client, staff_token, include_ack=True):
+            if int(note.get('assignment_id') or 0) in created_ids:
+                acknowledge_notification(client, staff_token, note['id'])
@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import seed_data  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'seed.db'))
+    yield conn
+    conn.close()
+
+
+def test_ensure_seed_data_runs_once_per_database(conn):
+    assert seed_data.ensure_seed_data(conn) is True
+    assert seed_data.is_seeded(conn)
+    counts = [conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('users', 'menu_items', 'orders')]
+
+    assert seed_data.ensure_seed_data(conn) is False
+    assert [conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('users', 'menu_items', 'orders')] == counts
+
+
+def test_seeded_rows_reference_existing_records(conn):
+    seed_data.ensure_seed_data(conn)
+
+    assert conn.execute('SELECT COUNT(*) FROM users WHERE role_id IS NULL').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM shift_assignments WHERE shift_id IS NULL').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM orders WHERE id NOT IN (SELECT order_id FROM order_items)').fetchone()[0] == 0
+
+    menu_ids = {row[0] for row in conn.execute('SELECT id FROM menu_items')}
+    for (items,) in conn.execute('SELECT items FROM order_items'):
+        assert {entry['item_id'] for entry in json.loads(items)} <= menu_ids
+
+
+def test_failed_seed_leaves_no_rows_or_marker(conn, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(seed_data, 'seed_orders', broken)
+    with pytest.raises(RuntimeError):
+        seed_data.ensure_seed_data(conn)
+
+    assert not seed_data.is_seeded(conn)
+    assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from utils import DeadlineExceeded, SqlitePool  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SqlitePool(
+        str(tmp_path / 'pool.db'),
+        max_size=2,
+        timeout=0.05,
+        pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 50},
+    )
+    yield pool
+    pool.close()
+
+
+def test_pool_applies_pragma_profile(pool):
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 50
+    assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+    pool.release(conn)
+
+
+def test_pool_is_bounded_and_reuses_connections(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(DeadlineExceeded):
+        pool.acquire()
+
+    pool.release(second)
+    assert pool.acquire() is second
+    pool.release(first)
+    pool.release(second)
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE notes (body TEXT)')
+    conn.commit()
+    conn.execute('INSERT INTO notes VALUES (?)', ('draft',))
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_release_restores_foreign_keys(pool):
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE notes (body TEXT)')
+    conn.commit()
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('DELETE FROM notes')
+    conn.execute('PRAGMA foreign_keys = ON')  # ignored: a transaction is open
+    conn.commit()
+    assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 0
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+    pool.release(conn)
+
+
+def test_busy_writes_are_retried(pool):
+    writer = pool.acquire()
+    writer.execute('CREATE TABLE counters (value INTEGER)')
+    writer.commit()
+    writer.execute('BEGIN IMMEDIATE')
+    writer.execute('INSERT INTO counters VALUES (1)')
+
+    # Let the lock go shortly after the second writer starts backing off.
+    timer = threading.Timer(0.1, writer.commit)
+    timer.start()
+    other = pool.acquire()
+    try:
+        other.execute('INSERT INTO counters VALUES (2)')
+        other.commit()
+    finally:
+        timer.join()
+    assert other.execute('SELECT COUNT(*) FROM counters').fetchone()[0] == 2
+    pool.release(other)
+    pool.release(writer)
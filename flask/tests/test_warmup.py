@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import warmup  # noqa: E402
+from api import create_app  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    warmup.reset_readiness()
+    app = create_app({'TESTING': True})
+    yield app, app.test_client()
+    warmup.reset_readiness()
+
+
+def test_ready_reports_warming_until_warmup_finishes(client):
+    app, test_client = client
+    resp = test_client.get('/ready')
+    assert resp.status_code == 503
+    assert resp.get_json()['status'] == 'warming'
+
+    with app.app_context():
+        assert warmup.warm_up() is True
+
+    resp = test_client.get('/ready')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['status'] == 'ready'
+    assert body['error'] is None
+    # /health stays a plain liveness probe
+    assert test_client.get('/health').status_code == 200
+
+
+def test_ready_does_not_wait_for_disabled_warmup():
+    warmup.reset_readiness()
+    app = create_app({'TESTING': True, 'WARMUP_ON_STARTUP': False})
+    resp = app.test_client().get('/ready')
+    assert resp.status_code == 200
+    assert resp.get_json()['status'] == 'ready'
+
+
+def test_failed_step_keeps_process_unready_and_ready_retries(client, monkeypatch):
+    app, test_client = client
+    calls = []
+
+    def flaky(conn):
+        calls.append(conn)
+        if len(calls) == 1:
+            raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(warmup, 'WARMUP_STEPS', [('flaky', flaky)])
+    with app.app_context():
+        assert warmup.warm_up() is False
+    assert 'database unavailable' in warmup.readiness()['error']
+
+    resp = test_client.get('/ready')
+    assert resp.status_code == 200
+    assert len(calls) == 2
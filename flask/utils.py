@@ -1,25 +1,19 @@
+import binascii
+import hashlib
+import hmac
 import os
+import random
+import re
 import sqlite3
 import threading
-from itertools import cycle
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
 from urllib.parse import urlparse
 
-import requests
-
-try:
-    from passlib.hash import bcrypt  # type: ignore
-except Exception:
-    bcrypt = None
-    import hashlib
-    import os as _os
-    import binascii
-else:
-    # ensure names exist for type checkers when passlib is available
-    _os = os
-    hashlib = __import__('hashlib')
-    binascii = __import__('binascii')
-
 from datetime import datetime
 from flask import current_app
 
@@ -28,6 +22,70 @@ class RqliteError(RuntimeError):
     """Raised when the rqlite cluster cannot be reached or returns an error."""
 
 
+class DeadlineExceeded(RuntimeError):
+    """Raised when the current request has used up its time budget."""
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the password hashing queue is full."""
+
+
+_request_deadline = threading.local()
+
+
+def set_request_deadline(budget: Optional[float]) -> None:
+    """Start a time budget of ``budget`` seconds for the current request thread."""
+    _request_deadline.at = time.monotonic() + budget if budget is not None else None
+
+
+def clear_request_deadline() -> None:
+    _request_deadline.at = None
+
+
+def remaining_request_budget() -> Optional[float]:
+    """Seconds left in the current request's budget, or ``None`` when unbounded."""
+    deadline = getattr(_request_deadline, 'at', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_request_deadline() -> None:
+    remaining = remaining_request_budget()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded('Request time budget exhausted')
+
+
+def request_budget(seconds: float):
+    """Override the default request time budget for a single view."""
+
+    def decorator(fn):
+        fn.request_budget = seconds
+        return fn
+
+    return decorator
+
+
+def _sqlite_deadline_handler() -> int:
+    # Non-zero aborts the running statement with OperationalError('interrupted').
+    deadline = getattr(_request_deadline, 'at', None)
+    return 1 if deadline is not None and time.monotonic() >= deadline else 0
+
+
+class _NodeUnavailable(Exception):
+    """A single rqlite node could not serve a request; another node may."""
+
+    def __init__(self, base: str, reason: Any):
+        super().__init__(f'{base}: {reason}')
+        self.base = base
+
+
+def _is_http_timeout(exc: BaseException) -> bool:
+    import requests
+
+    return isinstance(exc, requests.Timeout)
+
+
 def _normalize_rqlite_url(raw: str) -> Optional[str]:
     if not raw:
         return None
@@ -44,114 +102,214 @@ def _normalize_rqlite_url(raw: str) -> Optional[str]:
     return base
 
 
+class RqliteResultSet:
+    """Columnar result of a single rqlite query.
+
+    The column-to-index map is built once and shared by every row, and the raw
+    value lists from the JSON response are kept as-is; ``RqliteRow`` objects
+    are thin views created on demand.
+    """
+
+    __slots__ = ('columns', 'index', 'values')
+
+    def __init__(self, columns: Sequence[str], values: Sequence[Sequence[Any]]):
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.index: Dict[str, int] = {name: position for position, name in enumerate(self.columns)}
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def row(self, position: int) -> 'RqliteRow':
+        return RqliteRow(self, self.values[position])
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List['RqliteRow']:
+        return [RqliteRow(self, values) for values in self.values[start:stop]]
+
+
+_EMPTY_RESULT = RqliteResultSet((), ())
+
+
 class RqliteRow(Mapping[str, Any]):
-    """Mapping-like row object supporting both key and index access."""
+    """Mapping-like row view supporting both key and index access."""
 
-    __slots__ = ('_columns', '_values', '_mapping')
+    __slots__ = ('_result', '_values')
 
-    def __init__(self, columns: Sequence[str], values: Sequence[Any]):
-        self._columns = list(columns)
-        self._values = list(values)
-        self._mapping = dict(zip(self._columns, self._values))
+    def __init__(self, result: RqliteResultSet, values: Sequence[Any]):
+        self._result = result
+        self._values = values
 
     def __getitem__(self, key: Any) -> Any:
-        if isinstance(key, int):
+        if isinstance(key, (int, slice)):
             return self._values[key]
-        return self._mapping[key]
+        return self._values[self._result.index[key]]
 
     def __iter__(self) -> Iterator[str]:
-        return iter(self._mapping)
+        return iter(self._result.index)
 
     def __len__(self) -> int:
-        return len(self._mapping)
+        return len(self._result.index)
 
-    def keys(self):  # pragma: no cover - delegated to mapping methods
-        return self._mapping.keys()
+    def __repr__(self) -> str:  # pragma: no cover - debugging helper
+        return f"RqliteRow({dict(self)!r})"
 
-    def items(self):  # pragma: no cover - delegated to mapping methods
-        return self._mapping.items()
 
-    def values(self):  # pragma: no cover - delegated to mapping methods
-        return self._mapping.values()
+# DML a ``WITH ...`` prefix can lead into; its CTEs alone never make it a read.
+_CTE_WRITE_RE = re.compile(
+    r'\b(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update|delete\s+from|returning)\b',
+    re.IGNORECASE,
+)
 
-    def __repr__(self) -> str:  # pragma: no cover - debugging helper
-        return f"RqliteRow({self._mapping!r})"
+
+def _is_read_sql(sql: str) -> bool:
+    # Only a routing hint: every statement goes through the unified
+    # ``/db/request`` endpoint and results are read from the response shape.
+    lowered = sql.lower()
+    if lowered.startswith('with'):
+        return not _CTE_WRITE_RE.search(sql)
+    return lowered.startswith(('select', 'pragma', 'show', 'explain'))
 
 
 class RqliteCursor:
-    """Minimal DB-API compatible cursor backed by the rqlite HTTP API."""
+    """Minimal DB-API compatible cursor backed by the rqlite HTTP API.
+
+    Write statements are buffered on the owning connection until ``commit()``;
+    ``rowcount``, ``lastrowid`` and any ``RETURNING`` rows are filled in once
+    the batch has been sent. Reading them sends the buffer early.
+    """
 
     def __init__(self, connection: 'RqliteConnection'):
         self._connection = connection
         self._closed = False
-        self._rows: List[RqliteRow] = []
+        self._result = _EMPTY_RESULT
         self._index = 0
         self._lastrowid: Optional[int] = None
         self._rowcount: int = -1
         self._description: Optional[List[Tuple[str, None, None, None, None, None, None]]] = None
+        self._pending_write = False
+        self._bulk = False
+        self.arraysize = 1
 
     def _ensure_open(self) -> None:
         if self._closed:
             raise RqliteError('Cursor is closed')
 
+    def _resolve_pending(self) -> None:
+        # Reading the outcome of a buffered write requires sending the buffer.
+        if self._pending_write:
+            self._connection._flush_pending()
+
+    def _apply_result(self, payload: Mapping[str, Any]) -> None:
+        self._pending_write = False
+        if self._bulk:
+            # executemany() reports the total like sqlite3 and no lastrowid
+            self._rowcount += payload.get('rows_affected', 0)
+            return
+        if 'columns' in payload:
+            # A read, or a write with a RETURNING clause
+            self._result = RqliteResultSet(payload['columns'] or (), payload.get('values') or ())
+            self._description = [(col, None, None, None, None, None, None) for col in self._result.columns]
+        if 'rows_affected' in payload:
+            self._rowcount = payload['rows_affected']
+        else:
+            self._rowcount = len(self._result)
+        last_id = payload.get('last_insert_id')
+        self._lastrowid = int(last_id) if last_id is not None else None
+
+    def _reset(self) -> None:
+        self._result = _EMPTY_RESULT
+        self._index = 0
+        self._description = None
+        self._lastrowid = None
+        self._rowcount = -1
+        self._bulk = False
+
+    @property
+    def connection(self) -> 'RqliteConnection':
+        return self._connection
+
     @property
     def description(self):
+        self._resolve_pending()
         return self._description
 
     @property
     def rowcount(self) -> int:
+        self._resolve_pending()
         return self._rowcount
 
     @property
     def lastrowid(self) -> Optional[int]:
+        self._resolve_pending()
         return self._lastrowid
 
     def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> 'RqliteCursor':
         self._ensure_open()
         params = list(params) if params is not None else []
         sql_clean = sql.strip()
-        is_query = sql_clean.lower().startswith(('select', 'pragma', 'with', 'show', 'explain'))
+        self._reset()
+
+        if not _is_read_sql(sql_clean):
+            self._pending_write = True
+            self._connection._queue_write(sql_clean, params, self)
+            return self
+
+        # Flush buffered writes first so reads observe them, matching sqlite3.
+        self._connection._flush_pending()
+        result = self._connection._dispatch([(sql_clean, params)], is_query=True)
+        results = result.get('results') or [{}]
+        self._apply_result(results[0] if isinstance(results[0], dict) else {})
+        return self
 
-        result = self._connection._dispatch(sql_clean, params, is_query=is_query)
-        payload = result.get('results', [{}])[0]
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> 'RqliteCursor':
+        """Queue one write per parameter set; they are sent in bulk on commit.
 
-        if is_query:
-            columns = payload.get('columns') or []
-            raw_rows = payload.get('values') or []
-            self._rows = [RqliteRow(columns, row) for row in raw_rows]
-            self._rowcount = len(self._rows)
-            self._description = [(col, None, None, None, None, None, None) for col in columns]
-            self._lastrowid = None
-        else:
-            self._rows = []
-            self._rowcount = payload.get('rows_affected', 0)
-            last_id = payload.get('last_insert_id')
-            self._lastrowid = int(last_id) if last_id is not None else None
-            self._description = None
-        self._index = 0
+        If nothing else is buffered with them and there are more than the
+        connection's ``bulk_size`` rows, commit sends them as several
+        transactions, and a failure part way leaves earlier chunks applied.
+        Callers that need all-or-nothing must stay under ``bulk_size``.
+        """
+        self._ensure_open()
+        sql_clean = sql.strip()
+        if _is_read_sql(sql_clean):
+            raise RqliteError('executemany() can only execute DML statements')
+        self._reset()
+        self._bulk = True
+        self._rowcount = 0
+        for params in seq_of_params:
+            self._pending_write = True
+            self._connection._queue_write(sql_clean, params, self)
         return self
 
     def fetchone(self) -> Optional[RqliteRow]:
         self._ensure_open()
-        if self._index >= len(self._rows):
+        self._resolve_pending()
+        if self._index >= len(self._result):
             return None
-        row = self._rows[self._index]
+        row = self._result.row(self._index)
         self._index += 1
         return row
 
+    def fetchmany(self, size: Optional[int] = None) -> List[RqliteRow]:
+        self._ensure_open()
+        self._resolve_pending()
+        stop = min(self._index + (size or self.arraysize), len(self._result))
+        rows = self._result.rows(self._index, stop)
+        self._index = stop
+        return rows
+
     def fetchall(self) -> List[RqliteRow]:
         self._ensure_open()
-        if self._index == 0:
-            return list(self._rows)
-        result = self._rows[self._index:]
-        self._index = len(self._rows)
-        return result
+        self._resolve_pending()
+        rows = self._result.rows(self._index)
+        self._index = len(self._result)
+        return rows
 
     def close(self) -> None:
-        self._rows = []
+        self._result = _EMPTY_RESULT
         self._closed = True
 
-    def __iter__(self) -> Iterator[RqliteRow]:  # pragma: no cover - rarely used
+    def __iter__(self) -> Iterator[RqliteRow]:
         while True:
             row = self.fetchone()
             if row is None:
@@ -159,23 +317,199 @@ class RqliteCursor:
             yield row
 
 
-class RqliteConnection:
-    """Very small connection wrapper for the rqlite HTTP API."""
+class _NodeState:
+    __slots__ = ('latency', 'failures', 'ejected_until', 'probing')
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until: Optional[float] = None
+        self.probing = False
+
+
+class RqliteHealthTable:
+    """Thread-safe per-node health record shared by all rqlite connections.
+
+    Each node URL tracks an EWMA of response latency and its consecutive
+    failures. After ``failure_threshold`` failures a node is ejected for
+    ``cooldown`` seconds; once the cooldown expires a single request is let
+    through as a half-open probe, which either restores the node or ejects it
+    again.
+    """
+
+    def __init__(self, *, alpha: float = 0.3, failure_threshold: int = 3, cooldown: float = 15.0):
+        self._alpha = alpha
+        self._failure_threshold = max(1, failure_threshold)
+        self._cooldown = cooldown
+        self._nodes: Dict[str, _NodeState] = {}
+        self._read_samples: deque = deque(maxlen=512)
+        self._lock = threading.Lock()
+
+    def _state(self, url: str) -> _NodeState:
+        state = self._nodes.get(url)
+        if state is None:
+            state = self._nodes[url] = _NodeState()
+        return state
+
+    def is_available(self, url: str) -> bool:
+        with self._lock:
+            state = self._state(url)
+            if state.ejected_until is None:
+                return True
+            if time.monotonic() < state.ejected_until:
+                return False
+            return not state.probing
+
+    def begin(self, url: str) -> None:
+        """Mark a request to ``url`` as started, claiming the half-open probe slot."""
+        with self._lock:
+            state = self._state(url)
+            if state.ejected_until is not None and time.monotonic() >= state.ejected_until:
+                state.probing = True
+
+    def record_success(self, url: str, elapsed: float, *, read: bool = False) -> None:
+        with self._lock:
+            if read:
+                self._read_samples.append(elapsed)
+            state = self._state(url)
+            if state.latency is None:
+                state.latency = elapsed
+            else:
+                state.latency = self._alpha * elapsed + (1 - self._alpha) * state.latency
+            state.failures = 0
+            state.ejected_until = None
+            state.probing = False
+
+    def abandon(self, url: str) -> None:
+        """Give back the probe slot of a request that ended without a verdict on the node."""
+        with self._lock:
+            self._state(url).probing = False
+
+    def record_failure(self, url: str) -> None:
+        with self._lock:
+            state = self._state(url)
+            state.failures += 1
+            was_probing = state.probing
+            state.probing = False
+            if was_probing or state.failures >= self._failure_threshold:
+                state.ejected_until = time.monotonic() + self._cooldown
+
+    def latency(self, url: str) -> Optional[float]:
+        with self._lock:
+            state = self._nodes.get(url)
+            return state.latency if state else None
+
+    def read_latency_percentile(self, percentile: float, *, min_samples: int = 20) -> Optional[float]:
+        """Return the given percentile of recent read latencies across all nodes."""
+        with self._lock:
+            samples = sorted(self._read_samples)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return samples[index]
+
+    def rank(self, urls: Sequence[str]) -> List[str]:
+        """Order ``urls`` fastest first; nodes without samples sort first so they get measured."""
+        return sorted(urls, key=lambda url: self.latency(url) or 0.0)
+
+
+class RqliteTopology:
+    """Which node of one rqlite cluster leads, shared by every connection to it.
+
+    A process keeps one per cluster (see ``_shared_topology``), so a single
+    thread probes the nodes' ``/status`` per ``leader_ttl`` and the rest keep
+    routing to the last known leader meanwhile. Only the very first lookup,
+    with no leader known yet, makes other threads wait for it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.leader_url: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def is_stale(self, ttl: float) -> bool:
+        with self._lock:
+            return self.checked_at is None or time.monotonic() - self.checked_at >= ttl
+
+    def update(self, leader: Optional[str]) -> None:
+        with self._lock:
+            self.leader_url = leader
+            self.checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Rediscover the leader on the next request (leadership may have moved)."""
+        with self._lock:
+            self.checked_at = None
 
-    def __init__(self, urls: Sequence[str], *, timeout: float = 8.0, read_consistency: Optional[str] = None):
+
+class RqliteConnection:
+    """Very small connection wrapper for the rqlite HTTP API.
+
+    Writes issued through ``execute()`` are collected in a statement buffer and
+    sent to ``/db/request?transaction`` as a single request on ``commit()``, so a
+    multi-statement write costs one round trip and is applied atomically.
+    ``rollback()`` discards the buffer. Reads flush any pending writes first.
+    A buffer filled by a single ``executemany()`` and nothing else is a bulk
+    load: past ``bulk_size`` statements it is sent as consecutive requests of
+    that size, each applied atomically on its own. Any other buffer is sent as
+    one transaction however long it is, so related writes commit together.
+
+    The cluster leader is located through each node's ``/status`` endpoint and
+    cached for ``leader_ttl`` seconds in ``topology``, which connections from
+    ``get_db`` share process-wide. Writes and leader-bound reads (``weak``,
+    ``strong``) go straight to it; ``none`` reads prefer the fastest follower.
+    Nodes ejected by the ``health`` table are only tried as a last resort.
+
+    With ``hedge_percentile`` set, a read that has not been answered within
+    that percentile of recent read latency is duplicated to the next candidate
+    node and the first response wins. Writes are never hedged.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        *,
+        timeout: float = 8.0,
+        read_consistency: Optional[str] = None,
+        leader_ttl: float = 30.0,
+        health: Optional[RqliteHealthTable] = None,
+        topology: Optional[RqliteTopology] = None,
+        hedge_percentile: Optional[float] = None,
+        bulk_size: int = 500,
+    ):
         if not urls:
             raise ValueError('At least one rqlite URL is required')
-        self._urls = list(urls)
+        self._urls = list(dict.fromkeys(urls))
         self._timeout = timeout
-        if read_consistency:
-            self._read_params = {'level': read_consistency}
-        else:
-            self._read_params = {}
+        self._read_consistency = read_consistency
         self._write_params: Dict[str, Any] = {}
+        import requests  # deferred: only rqlite deployments need it
+
         self._session = requests.Session()
-        self._cycle = cycle(self._urls)
+        self._pending: List[Tuple[str, List[Any], Optional[RqliteCursor]]] = []
+        self._leader_ttl = leader_ttl
+        self._topology = topology if topology is not None else RqliteTopology()
+        self._health = health if health is not None else RqliteHealthTable()
+        self._hedge_percentile = hedge_percentile
+        self._bulk_size = max(1, bulk_size)
         self.row_factory = None  # maintained for API compatibility
 
+    @contextmanager
+    def consistency(self, level: Optional[str]) -> Iterator[None]:
+        """Temporarily override the read consistency level for queries."""
+        previous = self._read_consistency
+        if level:
+            self._read_consistency = level
+        try:
+            yield
+        finally:
+            self._read_consistency = previous
+
+    @property
+    def in_transaction(self) -> bool:
+        return bool(self._pending)
+
     def cursor(self) -> RqliteCursor:
         return RqliteCursor(self)
 
@@ -183,11 +517,33 @@ class RqliteConnection:
         cur = self.cursor()
         return cur.execute(sql, params)
 
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> RqliteCursor:
+        cur = self.cursor()
+        return cur.executemany(sql, seq_of_params)
+
+    def query_batch(self, statements: Sequence[Tuple[str, Optional[Sequence[Any]]]]) -> List[List[RqliteRow]]:
+        """Send several independent reads in one ``/db/request`` call."""
+        prepared = [(sql.strip(), list(params or ())) for sql, params in statements]
+        for sql, _ in prepared:
+            if not _is_read_sql(sql):
+                raise RqliteError('query_batch() only accepts read statements')
+        if not prepared:
+            return []
+        self._flush_pending()
+        result = self._dispatch(prepared, is_query=True)
+        return [
+            RqliteResultSet(payload.get('columns') or (), payload.get('values') or ()).rows()
+            for payload in result.get('results') or []
+        ]
+
     def commit(self) -> None:
-        # Each statement is committed immediately by rqlite.
-        return None
+        self._flush_pending()
+
+    def rollback(self) -> None:
+        self._pending = []
 
     def close(self) -> None:
+        self._pending = []
         self._session.close()
 
     def executescript(self, script: str) -> None:
@@ -203,45 +559,476 @@ class RqliteConnection:
         statements = [segment.strip() for segment in cleaned.split(';') if segment.strip()]
         for stmt in statements:
             self.execute(stmt)
+        self.commit()
+
+    def _queue_write(self, sql: str, params: Sequence[Any], cursor: Optional[RqliteCursor] = None) -> None:
+        self._pending.append((sql, list(params), cursor))
 
-    def _dispatch(self, sql: str, params: Sequence[Any], *, is_query: bool) -> Dict[str, Any]:
+    def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        chunk_size = len(pending)
+        first_cursor = pending[0][2]
+        if first_cursor is not None and first_cursor._bulk and len({(sql, id(cursor)) for sql, _, cursor in pending}) == 1:
+            chunk_size = self._bulk_size
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            result = self._dispatch(
+                [(sql, params) for sql, params, _ in chunk],
+                is_query=False,
+                transaction=len(chunk) > 1,
+            )
+            results = result.get('results') or []
+            for index, (_, _, cursor) in enumerate(chunk):
+                if cursor is None:
+                    continue
+                payload = results[index] if index < len(results) else {}
+                cursor._apply_result(payload if isinstance(payload, dict) else {})
+
+    @staticmethod
+    def _statement_payload(sql: str, params: Sequence[Any]) -> Any:
         if params:
-            statement_payload: Any = [sql, *list(params)]
+            return [sql, *list(params)]
+        return sql
+
+    @property
+    def _leader_url(self) -> Optional[str]:
+        return self._topology.leader_url
+
+    def _refresh_topology(self) -> None:
+        topology = self._topology
+        if not topology.is_stale(self._leader_ttl):
+            return
+        # One thread probes; the others keep the current leader unless there is none yet.
+        if not topology.refresh_lock.acquire(blocking=topology.leader_url is None):
+            return
+        try:
+            if not topology.is_stale(self._leader_ttl):
+                return  # refreshed by another thread while this one waited
+            leader: Optional[str] = None
+            for base in self._urls:
+                if not self._health.is_available(base):
+                    continue
+                probe_timeout = min(self._call_timeout(), 2.0)
+                self._health.begin(base)
+                started = time.monotonic()
+                try:
+                    response = self._session.get(f'{base}/status', timeout=probe_timeout)
+                    response.raise_for_status()
+                    status = response.json()
+                except Exception:
+                    self._health.record_failure(base)
+                    continue
+                self._health.record_success(base, time.monotonic() - started)
+                raft = (status.get('store') or {}).get('raft') or {}
+                if str(raft.get('state', '')).lower() == 'leader':
+                    leader = base
+            topology.update(leader)
+        finally:
+            topology.refresh_lock.release()
+
+    def _candidate_urls(self, *, is_query: bool, level: Optional[str]) -> List[str]:
+        self._refresh_topology()
+        leader = [self._leader_url] if self._leader_url else []
+        followers = self._health.rank([url for url in self._urls if url not in leader])
+        if is_query and (level or '').lower() == 'none':
+            preferred = followers + leader
         else:
-            statement_payload = sql
+            preferred = leader + followers
+        healthy = [url for url in preferred if self._health.is_available(url)]
+        return healthy + [url for url in preferred if url not in healthy]
+
+    def _call_timeout(self) -> float:
+        """Per-call timeout, shrunk to whatever is left of the request budget."""
+        check_request_deadline()
+        remaining = remaining_request_budget()
+        if remaining is None:
+            return self._timeout
+        return min(self._timeout, remaining)
+
+    def _send(self, base: str, path: str, params: Mapping[str, Any], payload: Any, *, is_query: bool) -> Dict[str, Any]:
+        timeout = self._call_timeout()
+        self._health.begin(base)
+        started = time.monotonic()
+        try:
+            response = self._session.post(
+                f"{base}{path}",
+                params=params or None,
+                json=payload,
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as exc:  # pragma: no cover - network error path
+            if timeout < self._timeout and _is_http_timeout(exc):
+                # The request budget ran out, not the node; keep its health intact
+                # but free the probe slot so a half-open node can be tried again.
+                self._health.abandon(base)
+                raise DeadlineExceeded('Request time budget exhausted') from exc
+            self._health.record_failure(base)
+            if base == self._leader_url:
+                # Leadership may have moved; rediscover on the next request.
+                self._topology.invalidate()
+            raise _NodeUnavailable(base, exc) from exc
+
+        if 'results' not in data:
+            self._health.record_failure(base)
+            raise _NodeUnavailable(base, 'unexpected response from rqlite node')
+        self._health.record_success(base, time.monotonic() - started, read=is_query)
+        # Statement errors are deterministic, so retrying on another node is pointless.
+        for entry in data.get('results') or []:
+            if isinstance(entry, dict) and entry.get('error'):
+                raise RqliteError(entry['error'])
+        return data
+
+    def _send_with_deadline(self, deadline: Optional[float], base: str, path: str, params: Mapping[str, Any], payload: Any) -> Dict[str, Any]:
+        # Hedge workers run on pool threads, so carry the caller's deadline over.
+        _request_deadline.at = deadline
+        try:
+            return self._send(base, path, params, payload, is_query=True)
+        finally:
+            _request_deadline.at = None
+
+    def _send_hedged(
+        self,
+        primary: str,
+        backup: str,
+        path: str,
+        params: Mapping[str, Any],
+        payload: Any,
+        failures: List[_NodeUnavailable],
+    ) -> Optional[Dict[str, Any]]:
+        """Send a read to ``primary`` and, if it is slow, also to ``backup``.
+
+        Returns ``None`` when hedging is not possible yet or both nodes failed,
+        leaving the caller to fall back to sequential attempts.
+        """
+        delay = self._health.read_latency_percentile(self._hedge_percentile or 0.0)
+        if delay is None:
+            return None
+        remaining = remaining_request_budget()
+        if remaining is not None and remaining <= delay:
+            return None
+
+        executor = _hedge_executor()
+        deadline = getattr(_request_deadline, 'at', None)
+        # The pool is shared by the whole process, so a future may sit queued or
+        # stuck; never wait on it past the call timeout or the request budget.
+        give_up_at = time.monotonic() + (self._timeout if remaining is None else min(self._timeout, remaining))
+        futures = [executor.submit(self._send_with_deadline, deadline, primary, path, params, payload)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            futures.append(executor.submit(self._send_with_deadline, deadline, backup, path, params, payload))
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, give_up_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                for future in pending:
+                    future.cancel()
+                raise DeadlineExceeded('Request time budget exhausted waiting for a hedged read')
+            for future in done:
+                try:
+                    return future.result()
+                except _NodeUnavailable as exc:
+                    failures.append(exc)
+        return None
 
-        payload = [statement_payload]
+    def _dispatch(
+        self,
+        statements: Sequence[Tuple[str, Sequence[Any]]],
+        *,
+        is_query: bool,
+        transaction: bool = False,
+    ) -> Dict[str, Any]:
+        payload = [self._statement_payload(sql, params) for sql, params in statements]
+        level = self._read_consistency if is_query else None
+        if is_query:
+            params: Dict[str, Any] = {'level': level} if level else {}
+        else:
+            params = self._write_params
+        # The unified endpoint accepts reads and writes alike; ``is_query`` only
+        # decides routing, hedging and the consistency level.
+        path = '/db/request'
+        if transaction:
+            path += '?transaction'
+
+        candidates = self._candidate_urls(is_query=is_query, level=level)
+        failures: List[_NodeUnavailable] = []
+        if is_query and self._hedge_percentile and len(candidates) > 1:
+            data = self._send_hedged(candidates[0], candidates[1], path, params, payload, failures)
+            if data is not None:
+                return data
+            failed = {exc.base for exc in failures}
+            candidates = [base for base in candidates if base not in failed]
 
-        errors = []
-        for _ in range(len(self._urls)):
-            base = next(self._cycle)
-            endpoint = '/db/query' if is_query else '/db/execute'
-            url = f"{base}{endpoint}"
+        for base in candidates:
             try:
-                response = self._session.post(
-                    url,
-                    params=(self._read_params if is_query else self._write_params) or None,
-                    json=payload,
-                    timeout=self._timeout,
-                )
-                response.raise_for_status()
-                data = response.json()
-                if 'results' not in data:
-                    raise RqliteError(f'Unexpected response from rqlite node {base}')
-                results = data.get('results') or []
-                if results:
-                    first = results[0]
-                    if isinstance(first, dict) and first.get('error'):
-                        raise RqliteError(first['error'])
-                return data
-            except Exception as exc:  # pragma: no cover - network error path
-                errors.append(f'{base}: {exc}')
-                continue
+                return self._send(base, path, params, payload, is_query=is_query)
+            except _NodeUnavailable as exc:
+                failures.append(exc)
+
+        raise RqliteError('All rqlite nodes failed: ' + '; '.join(str(exc) for exc in failures))
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='rqlite-hedge')
+        return _hedge_pool
+
+
+def shutdown_hedge_pool() -> None:
+    """Stop this process's hedge threads; the next hedged read starts a new pool.
+
+    Called before forking: a child inherits the executor but not its threads,
+    so anything it submitted there would never run.
+    """
+    global _hedge_pool
+    with _hedge_pool_lock:
+        pool, _hedge_pool = _hedge_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def read_consistency(conn: Any, level: Optional[str]):
+    """Context manager applying a per-query read consistency on rqlite.
+
+    ``none`` lets rqlite answer from the nearest follower's local copy, while
+    ``strong`` routes through the leader. It is a no-op for sqlite connections.
+    """
+    if isinstance(conn, RqliteConnection):
+        return conn.consistency(level)
+    return nullcontext()
+
+
+def query_batch(conn: Any, statements: Sequence[Tuple[str, Optional[Sequence[Any]]]]) -> List[List[Any]]:
+    """Run independent SELECTs together and return one row list per statement.
+
+    On rqlite the statements share a single HTTP round trip; sqlite simply runs
+    them one after another on the same connection.
+    """
+    if isinstance(conn, RqliteConnection):
+        return conn.query_batch(statements)
+    cur = conn.cursor()
+    results = []
+    for sql, params in statements:
+        cur.execute(sql, tuple(params or ()))
+        results.append(cur.fetchall())
+    return results
+
+
+STREAM_PAGE_SIZE = 500
+
+
+def stream_rows(
+    conn: Any,
+    sql: str,
+    params: Sequence[Any] = (),
+    *,
+    key: str = 'id',
+    page_size: int = STREAM_PAGE_SIZE,
+) -> Iterator[Any]:
+    """Yield the rows of ``sql`` without holding the whole result in memory.
+
+    sqlite steps its cursor lazily, so rows are simply pulled ``page_size`` at
+    a time. rqlite returns each response in full, so the query is wrapped and
+    fetched in keyset pages ordered by ``key``, which must be a unique column
+    of the result. Rows therefore come back ordered by ``key`` on rqlite.
+    """
+    if not isinstance(conn, RqliteConnection):
+        cur = conn.cursor()
+        cur.execute(sql, tuple(params))
+        while True:
+            rows = cur.fetchmany(page_size)
+            if not rows:
+                return
+            yield from rows
+
+    first_page = f'SELECT * FROM ({sql}) ORDER BY {key} LIMIT ?'
+    next_page = f'SELECT * FROM ({sql}) WHERE {key} > ? ORDER BY {key} LIMIT ?'
+    cur = conn.cursor()
+    cur.execute(first_page, [*params, page_size])
+    while True:
+        rows = cur.fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        cur.execute(next_page, [*params, rows[-1][key], page_size])
+
+
+_BUSY_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+SQLITE_BUSY_RETRIES = 5
+
+
+def _retry_busy(operation, *args: Any) -> Any:
+    """Run ``operation`` and retry SQLITE_BUSY with jittered exponential backoff.
+
+    ``busy_timeout`` already waits inside sqlite; this covers the cases where
+    that wait expires under a burst of writers. Retries stop once the request
+    budget could not absorb the next sleep.
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation(*args)
+        except sqlite3.OperationalError as exc:
+            if attempt >= SQLITE_BUSY_RETRIES or not any(token in str(exc).lower() for token in _BUSY_MESSAGES):
+                raise
+            delay = min(0.5, 0.01 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            remaining = remaining_request_budget()
+            if remaining is not None and remaining <= delay:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+class PooledSqliteCursor(sqlite3.Cursor):
+    def execute(self, sql: str, parameters: Any = ()) -> 'PooledSqliteCursor':
+        return _retry_busy(super().execute, sql, parameters)
 
-        raise RqliteError('All rqlite nodes failed: ' + '; '.join(errors))
+    def executemany(self, sql: str, seq_of_parameters: Any) -> 'PooledSqliteCursor':
+        # Materialise generators so a retry replays every parameter set.
+        return _retry_busy(super().executemany, sql, list(seq_of_parameters))
+
+
+class PooledSqliteConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements and commits retry SQLITE_BUSY."""
+
+    def cursor(self, factory: Any = PooledSqliteCursor) -> Any:  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> Any:  # type: ignore[override]
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> Any:  # type: ignore[override]
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self) -> None:
+        _retry_busy(super().commit)
+
+
+class SqlitePool:
+    """Bounded pool of sqlite connections sharing one pragma profile.
+
+    Connections are created lazily up to ``max_size``. ``acquire()`` blocks for
+    at most ``timeout`` seconds (or the remaining request budget, whichever is
+    shorter) and raises ``DeadlineExceeded`` when nothing frees up in time.
+    """
+
+    def __init__(self, path: str, *, max_size: int = 8, timeout: float = 5.0, pragmas: Optional[Mapping[str, Any]] = None):
+        self.path = path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.pid = os.getpid()
+        self._idle: List[sqlite3.Connection] = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            factory=PooledSqliteConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.set_progress_handler(_sqlite_deadline_handler, 10_000)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        wait_for = self.timeout
+        remaining = remaining_request_budget()
+        if remaining is not None:
+            wait_for = min(wait_for, max(0.0, remaining))
+        deadline = time.monotonic() + wait_for
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise DeadlineExceeded('Database connection pool exhausted')
+                self._cond.wait(left)
+            if self._idle:
+                # LIFO keeps the warmest connection (and its page cache) busy.
+                return self._idle.pop()
+            self._size += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            # Switching foreign_keys back on is a no-op inside a transaction, so a
+            # borrower that turned it off around bulk deletes can leave it off.
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            # A broken connection is dropped rather than handed out again.
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
 
 
 conn_local = threading.local()
+_sqlite_pools: Dict[str, SqlitePool] = {}
+_sqlite_pools_lock = threading.Lock()
+_health_tables: Dict[Tuple[int, float], RqliteHealthTable] = {}
+_health_tables_lock = threading.Lock()
+_topologies: Dict[Tuple[str, ...], RqliteTopology] = {}
+
+
+def _shared_health_table(failure_threshold: int, cooldown: float) -> RqliteHealthTable:
+    """Return the process-wide health table so every thread sees node failures."""
+    key = (failure_threshold, cooldown)
+    with _health_tables_lock:
+        table = _health_tables.get(key)
+        if table is None:
+            table = _health_tables[key] = RqliteHealthTable(failure_threshold=failure_threshold, cooldown=cooldown)
+        return table
+
+
+def _shared_topology(urls: Sequence[str]) -> RqliteTopology:
+    """Return the process-wide leader view for the cluster at ``urls``."""
+    key = tuple(urls)
+    with _health_tables_lock:
+        topology = _topologies.get(key)
+        if topology is None:
+            topology = _topologies[key] = RqliteTopology()
+        return topology
 
 
 def _get_app_config(key: str, default: Any = None) -> Any:
@@ -275,10 +1062,35 @@ def _resolve_rqlite_settings() -> Optional[Dict[str, Any]]:
 
     timeout_value: Any = _get_app_config('RQLITE_HTTP_TIMEOUT') or os.environ.get('RQLITE_HTTP_TIMEOUT')
     consistency_value: Any = _get_app_config('RQLITE_CONSISTENCY') or os.environ.get('RQLITE_CONSISTENCY')
+    leader_ttl_value: Any = _get_app_config('RQLITE_LEADER_TTL') or os.environ.get('RQLITE_LEADER_TTL')
     try:
         timeout = float(timeout_value) if timeout_value is not None else 8.0
     except (TypeError, ValueError):
         timeout = 8.0
+    eject_after_value: Any = _get_app_config('RQLITE_EJECT_AFTER') or os.environ.get('RQLITE_EJECT_AFTER')
+    eject_cooldown_value: Any = _get_app_config('RQLITE_EJECT_COOLDOWN') or os.environ.get('RQLITE_EJECT_COOLDOWN')
+    try:
+        leader_ttl = float(leader_ttl_value) if leader_ttl_value is not None else 30.0
+    except (TypeError, ValueError):
+        leader_ttl = 30.0
+    bulk_size_value: Any = _get_app_config('RQLITE_BULK_SIZE') or os.environ.get('RQLITE_BULK_SIZE')
+    try:
+        bulk_size = int(bulk_size_value) if bulk_size_value is not None else 500
+    except (TypeError, ValueError):
+        bulk_size = 500
+    hedge_value: Any = _get_app_config('RQLITE_HEDGE_PERCENTILE') or os.environ.get('RQLITE_HEDGE_PERCENTILE')
+    try:
+        hedge_percentile = float(hedge_value) if hedge_value not in (None, '') else None
+    except (TypeError, ValueError):
+        hedge_percentile = None
+    try:
+        eject_after = int(eject_after_value) if eject_after_value is not None else 3
+    except (TypeError, ValueError):
+        eject_after = 3
+    try:
+        eject_cooldown = float(eject_cooldown_value) if eject_cooldown_value is not None else 15.0
+    except (TypeError, ValueError):
+        eject_cooldown = 15.0
 
     consistency = None
     if consistency_value not in (None, ''):
@@ -292,45 +1104,118 @@ def _resolve_rqlite_settings() -> Optional[Dict[str, Any]]:
     settings = {
         'urls': urls,
         'timeout': timeout,
+        'leader_ttl': leader_ttl,
+        'health': _shared_health_table(eject_after, eject_cooldown),
+        'topology': _shared_topology(urls),
+        'hedge_percentile': hedge_percentile,
+        'bulk_size': bulk_size,
     }
     if consistency:
         settings['read_consistency'] = consistency
     return settings
 
 
+def _config_number(key: str, default: Any, cast: Any = float) -> Any:
+    raw: Any = _get_app_config(key) or os.environ.get(key)
+    if raw in (None, ''):
+        return default
+    try:
+        return cast(raw)
+    except (TypeError, ValueError):
+        return default
+
+
+def _sqlite_pool(db_path: str) -> SqlitePool:
+    """Return the process-wide pool for ``db_path``, rebuilt after a fork."""
+    with _sqlite_pools_lock:
+        pool = _sqlite_pools.get(db_path)
+        if pool is None or pool.pid != os.getpid():
+            synchronous = _get_app_config('SQLITE_SYNCHRONOUS') or os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+            journal_mode = _get_app_config('SQLITE_JOURNAL_MODE') or os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+            pool = _sqlite_pools[db_path] = SqlitePool(
+                db_path,
+                max_size=_config_number('SQLITE_POOL_SIZE', 8, int),
+                timeout=_config_number('SQLITE_POOL_TIMEOUT', 5.0),
+                pragmas={
+                    'journal_mode': journal_mode,
+                    'synchronous': synchronous,
+                    'busy_timeout': _config_number('SQLITE_BUSY_TIMEOUT_MS', 5000, int),
+                    'cache_size': _config_number('SQLITE_CACHE_SIZE', -16000, int),
+                    'mmap_size': _config_number('SQLITE_MMAP_SIZE', 128 * 1024 * 1024, int),
+                    'temp_store': 'MEMORY',
+                },
+            )
+        return pool
+
+
+def _sqlite_path() -> str:
+    return _get_app_config('DB_PATH') or os.environ.get('DB_PATH') or os.path.join(os.path.dirname(__file__), 'data', 'app.db')
+
+
+def db_identity() -> str:
+    """Return a stable name for the database ``get_db()`` would connect to."""
+    settings = _resolve_rqlite_settings()
+    if settings is not None:
+        return 'rqlite:' + ','.join(sorted(settings['urls']))
+    return 'sqlite:' + os.path.abspath(_sqlite_path())
+
+
 def get_db():
-    """Return a thread-local database connection (sqlite or rqlite)."""
+    """Return the database connection for the current thread (sqlite or rqlite).
+
+    sqlite connections are checked out of a bounded pool on first use and stay
+    with the thread until ``release_db()`` (called when the app context is
+    torn down) hands them back. Raises ``DeadlineExceeded`` when the current request has no
+    time left or no pooled connection frees up in time.
+    """
+    check_request_deadline()
     settings = _resolve_rqlite_settings()
     using_rqlite = settings is not None
+    db_path = None if using_rqlite else _sqlite_path()
 
     existing = getattr(conn_local, 'connection', None)
     if existing is not None:
         if using_rqlite and isinstance(existing, RqliteConnection):
             return existing
-        if not using_rqlite and isinstance(existing, sqlite3.Connection):
+        pool = getattr(conn_local, 'pool', None)
+        if not using_rqlite and pool is not None and pool.path == db_path:
             return existing
-        # backend switched, close old connection and recreate
-        try:
-            existing.close()
-        except Exception:
-            pass
-        delattr(conn_local, 'connection')
+        # backend or database switched, drop the old connection and recreate
+        close_db()
 
     if using_rqlite and settings:
         conn_local.connection = RqliteConnection(**settings)
     else:
-        db_path = _get_app_config('DB_PATH') or os.environ.get('DB_PATH')
-        if not db_path:
-            db_path = os.path.join(os.path.dirname(__file__), 'data', 'app.db')
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        conn_local.connection = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-        conn_local.connection.row_factory = sqlite3.Row
-        conn_local.connection.execute('PRAGMA foreign_keys = ON')
+        pool = _sqlite_pool(db_path)
+        conn_local.connection = pool.acquire()
+        conn_local.pool = pool
     return conn_local.connection
 
 
+def release_db() -> None:
+    """Return the thread's sqlite connection to its pool; rqlite keeps its session.
+
+    Either way, writes the request did not commit end with it: the sqlite
+    transaction is rolled back and the rqlite statement buffer is dropped.
+    """
+    pool = getattr(conn_local, 'pool', None)
+    if pool is None:
+        connection = getattr(conn_local, 'connection', None)
+        if isinstance(connection, RqliteConnection):
+            connection.rollback()
+        return
+    connection = conn_local.connection
+    del conn_local.connection
+    del conn_local.pool
+    pool.release(connection)
+
+
 def close_db() -> None:
-    """Close the thread-local DB connection if present."""
+    """Release or close the thread-local DB connection if present."""
+    if getattr(conn_local, 'pool', None) is not None:
+        release_db()
+        return
     if hasattr(conn_local, 'connection'):
         try:
             conn_local.connection.close()
@@ -340,39 +1225,132 @@ def close_db() -> None:
             delattr(conn_local, 'connection')
 
 
+def close_pools() -> None:
+    """Close every idle pooled sqlite connection (used at interpreter exit)."""
+    with _sqlite_pools_lock:
+        pools = list(_sqlite_pools.values())
+        _sqlite_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@lru_cache(maxsize=None)
+def bcrypt_handler() -> Any:
+    """passlib's bcrypt handler, imported on first use to keep app startup fast."""
+    try:
+        from passlib.hash import bcrypt  # type: ignore
+    except Exception:
+        return None
+    return bcrypt
+
+
+# Current hashing parameters; stored hashes below these are upgraded on login.
+BCRYPT_ROUNDS = 12
+PBKDF2_ITERATIONS = 100_000
+_PBKDF2_PREFIX = 'pbkdf2_sha256$'
+_BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+
+def hash_scheme(hashed: str) -> Optional[str]:
+    """Name the scheme of a stored hash from its format, or ``None`` if unknown.
+
+    ``bcrypt`` hashes carry a ``$2b$<rounds>$`` prefix, ``pbkdf2_sha256`` ones are
+    ``pbkdf2_sha256$<iterations>$<salt hex>$<key hex>``, and ``pbkdf2_legacy`` is
+    the original bare hex of 16 salt bytes plus the 32-byte key.
+    """
+    if not hashed:
+        return None
+    if hashed.startswith(_BCRYPT_PREFIXES):
+        return 'bcrypt'
+    if hashed.startswith(_PBKDF2_PREFIX):
+        return 'pbkdf2_sha256'
+    if len(hashed) == 96 and all(ch in '0123456789abcdefABCDEF' for ch in hashed):
+        return 'pbkdf2_legacy'
+    return None
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def _bcrypt_rounds(hashed: str) -> int:
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _hash_params(hashed: str) -> Tuple[Optional[str], int]:
+    """A stored hash's scheme and work factor (bcrypt rounds or PBKDF2 iterations)."""
+    scheme = hash_scheme(hashed)
+    if scheme == 'bcrypt':
+        return scheme, _bcrypt_rounds(hashed)
+    if scheme == 'pbkdf2_sha256':
+        return scheme, int(hashed.split('$')[1])
+    return scheme, 0
+
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt when available, otherwise PBKDF2-HMAC-SHA256."""
+    bcrypt = bcrypt_handler()
     if bcrypt:
         try:
             # passlib's bcrypt may be present but its native backend can fail at runtime
             # (for example a broken "bcrypt" C-extension). Attempt to use it and
             # fall back to the pbkdf2 path on any error.
-            return bcrypt.hash(password)
+            return bcrypt.using(rounds=BCRYPT_ROUNDS).hash(password)
         except Exception:
             # fall through to the pbkdf2 fallback below
             pass
-    # fallback to pbkdf2
-    salt = _os.urandom(16)
-    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100_000)
-    return binascii.hexlify(salt + dk).decode('ascii')
+    salt = os.urandom(16)
+    dk = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f'{_PBKDF2_PREFIX}{PBKDF2_ITERATIONS}${salt.hex()}${dk.hex()}'
 
 
 def verify_password(password: str, hashed: str) -> bool:
-    """Verify a password against a stored hash."""
-    if bcrypt:
+    """Verify a password against a stored hash of any supported scheme."""
+    scheme = hash_scheme(hashed)
+    if scheme == 'bcrypt':
+        bcrypt = bcrypt_handler()
+        if not bcrypt:
+            return False
         try:
             return bcrypt.verify(password, hashed)
         except Exception:
-            # If bcrypt verification fails (e.g. stored hash isn't a bcrypt string or
-            # the backend is broken), fall back to the pbkdf2 verification below.
-            pass
-    import binascii
-    raw = binascii.unhexlify(hashed.encode('ascii'))
-    salt = raw[:16]
-    dk = raw[16:]
-    import hashlib
-    new = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 100_000)
-    return new == dk
+            return False
+    if scheme == 'pbkdf2_sha256':
+        _, iterations, salt, dk = hashed.split('$')
+        return hmac.compare_digest(_pbkdf2(password, bytes.fromhex(salt), int(iterations)), bytes.fromhex(dk))
+    if scheme == 'pbkdf2_legacy':
+        raw = binascii.unhexlify(hashed.encode('ascii'))
+        return hmac.compare_digest(_pbkdf2(password, raw[:16], 100_000), raw[16:])
+    return False
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash uses an older scheme or weaker parameters than ``hash_password``."""
+    scheme, cost = _hash_params(hashed)
+    if scheme == 'bcrypt':
+        return cost < BCRYPT_ROUNDS
+    if bcrypt_handler():
+        # A working bcrypt supersedes PBKDF2; verify_and_upgrade drops the
+        # result if its backend turns out to be broken.
+        return True
+    if scheme == 'pbkdf2_sha256':
+        return cost < PBKDF2_ITERATIONS
+    return True
+
+
+def verify_and_upgrade(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Verify ``password`` and, when it matches an outdated hash, return a fresh one too."""
+    if not verify_password(password, hashed):
+        return False, None
+    if not needs_rehash(hashed):
+        return True, None
+    fresh = hash_password(password)
+    # With bcrypt's backend broken, hash_password falls back to the same PBKDF2
+    # parameters the stored hash already has; rewriting it would gain nothing.
+    return True, fresh if _hash_params(fresh) != _hash_params(hashed) else None
 
 
 def now_iso() -> str:
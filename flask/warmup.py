@@ -0,0 +1,133 @@
+"""
+warmup.py
+
+Startup warmup and the readiness state behind ``/ready``.
+
+``warm_up()`` runs each step in ``WARMUP_STEPS`` once: it loads the reference
+data and runs the queries behind the hottest endpoints, so their pages are
+cached before real traffic arrives, and it imports the lazily loaded
+dependencies. The process reports ready only after every step has succeeded.
+Later in-process caches should register a step here to be primed too.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from utils import bcrypt_handler, get_db, query_batch, read_consistency
+
+_state_lock = threading.Lock()
+_state: Dict[str, Any] = {
+    'ready': False,
+    'running': False,
+    'finished_at': None,
+    'duration_ms': None,
+    'error': None,
+}
+
+
+def _reference_data(conn: Any) -> None:
+    with read_consistency(conn, 'none'):
+        query_batch(conn, [
+            ('SELECT id, name FROM types ORDER BY name', ()),
+            ('SELECT id, name FROM roles', ()),
+            (
+                'SELECT m.id, m.name, m.price, m.description, m.img_link, m.qty_left, m.discount, m.type_id, '
+                't.name AS type_name FROM menu_items m LEFT JOIN types t ON m.type_id = t.id ORDER BY m.id DESC',
+                (),
+            ),
+        ])
+
+
+def _schedule_week(conn: Any) -> None:
+    from schedule import _load_week_assignments, _start_of_week
+
+    _load_week_assignments(_start_of_week(), True, None)
+
+
+def _analytics_summary(conn: Any) -> None:
+    from analytics import _compute_metrics, _resolve_timeframe
+
+    for timeframe in ('this_week', 'last_week'):
+        _, start_date, end_date = _resolve_timeframe(timeframe)
+        _compute_metrics(conn, start_date, end_date)
+
+
+def _role_cache(conn: Any) -> None:
+    # Staff hit the role-checked endpoints most; customers are cached on first use.
+    from permissions import cache_role
+
+    rows = query_batch(conn, [(
+        "SELECT u.id, r.name FROM users u JOIN roles r ON u.role_id=r.id WHERE r.name IN ('Admin', 'Manager', 'Staff')",
+        (),
+    )])[0]
+    for row in rows:
+        cache_role(row[0], row[1])
+
+
+def _lazy_dependencies(conn: Any) -> None:
+    # Login needs passlib, and creating a shift template needs marshmallow.
+    bcrypt_handler()
+    import schemas  # noqa: F401
+
+
+def _password_pool(conn: Any) -> None:
+    # Spawning the first hashing process would otherwise delay the first login.
+    import password_pool
+
+    password_pool.warm()
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[Any], None]]] = [
+    ('reference_data', _reference_data),
+    ('schedule_week', _schedule_week),
+    ('analytics_summary', _analytics_summary),
+    ('role_cache', _role_cache),
+    ('lazy_dependencies', _lazy_dependencies),
+    ('password_pool', _password_pool),
+]
+
+
+def warm_up() -> bool:
+    """Run every warmup step and return whether the process is now ready.
+
+    Call it inside an app context so ``get_db()`` picks up the app's config.
+    A call made while another warmup is still running returns False at once.
+    """
+    with _state_lock:
+        if _state['running']:
+            return False
+        _state.update(ready=False, running=True, error=None)
+
+    started = time.monotonic()
+    error = None
+    try:
+        conn = get_db()
+        for name, step in WARMUP_STEPS:
+            try:
+                step(conn)
+            except Exception as exc:
+                error = f'{name}: {exc}'
+                break
+    except Exception as exc:
+        error = str(exc)
+
+    with _state_lock:
+        _state.update(
+            ready=error is None,
+            running=False,
+            finished_at=time.time(),
+            duration_ms=round((time.monotonic() - started) * 1000, 1),
+            error=error,
+        )
+    return error is None
+
+
+def readiness() -> Dict[str, Any]:
+    with _state_lock:
+        return dict(_state)
+
+
+def reset_readiness() -> None:
+    """Forget a previous warmup, e.g. in a freshly forked worker."""
+    with _state_lock:
+        _state.update(ready=False, running=False, finished_at=None, duration_ms=None, error=None)